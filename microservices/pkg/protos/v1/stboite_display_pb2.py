@@ -14,40 +14,198 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x15stboite_display.proto\x12\x12stboite.v1.display\"\xd4\x01\n\x10RenderingRequest\x12<\n\x04type\x18\x01 \x01(\x0e\x32..stboite.v1.display.RenderingRequest.PixelType\x12\x0e\n\x06height\x18\x02 \x01(\r\x12\r\n\x05width\x18\x03 \x01(\r\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\x0c\"U\n\tPixelType\x12\x07\n\x03ONE\x10\x00\x12\x05\n\x01L\x10\x01\x12\x07\n\x03RGB\x10\x02\x12\x08\n\x04RGBA\x10\x03\x12\x08\n\x04\x43MYK\x10\x04\x12\t\n\x05YCBCR\x10\x05\x12\x07\n\x03LAB\x10\x06\x12\x07\n\x03HSV\x10\x07\"\xc8\x01\n\x11RenderingResponse\x12@\n\x06status\x18\x01 \x01(\x0e\x32\x30.stboite.v1.display.RenderingResponse.StatusCode\x12\x0f\n\x07\x64\x65tails\x18\x02 \x01(\t\"`\n\nStatusCode\x12\x06\n\x02OK\x10\x00\x12\x1a\n\x16PIXEL_TYPE_NOT_ALLOWED\x10\x01\x12\x19\n\x15\x44IMENSION_NOT_ALLOWED\x10\x02\x12\x13\n\x0fINVALID_PAYLOAD\x10\x03\x32s\n\x10RenderingService\x12_\n\x10\x44isplayRendering\x12$.stboite.v1.display.RenderingRequest\x1a%.stboite.v1.display.RenderingResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x15stboite_display.proto\x12\x12stboite.v1.display\"\xb7\x06\n\x10RenderingRequest\x12<\n\x04type\x18\x01 \x01(\x0e\x32..stboite.v1.display.RenderingRequest.PixelType\x12\x0e\n\x06height\x18\x02 \x01(\r\x12\r\n\x05width\x18\x03 \x01(\r\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\x0c\x12;\n\x06region\x18\x05 \x01(\x0b\x32+.stboite.v1.display.RenderingRequest.Region\x12\x18\n\x10wait_for_refresh\x18\x06 \x01(\x08\x12\x45\n\x0b\x63ompression\x18\x07 \x01(\x0e\x32\x30.stboite.v1.display.RenderingRequest.Compression\x12\r\n\x05\x64\x65lta\x18\x08 \x01(\x08\x12\x12\n\ndelta_base\x18\t \x01(\r\x12=\n\x04slot\x18\n \x01(\x0b\x32/.stboite.v1.display.RenderingRequest.SharedSlot\x12\x10\n\x08priority\x18\x0b \x01(\r\x12\x13\n\x0b\x64\x65\x61\x64line_ms\x18\x0c \x01(\r\x12\x41\n\tdithering\x18\r \x01(\x0e\x32..stboite.v1.display.RenderingRequest.Dithering\x1a=\n\x06Region\x12\t\n\x01x\x18\x01 \x01(\r\x12\t\n\x01y\x18\x02 \x01(\r\x12\r\n\x05width\x18\x03 \x01(\r\x12\x0e\n\x06height\x18\x04 \x01(\r\x1a\x37\n\nSharedSlot\x12\x0c\n\x04ring\x18\x01 \x01(\t\x12\r\n\x05index\x18\x02 \x01(\r\x12\x0c\n\x04size\x18\x03 \x01(\r\"a\n\tPixelType\x12\x07\n\x03ONE\x10\x00\x12\x05\n\x01L\x10\x01\x12\x07\n\x03RGB\x10\x02\x12\x08\n\x04RGBA\x10\x03\x12\x08\n\x04\x43MYK\x10\x04\x12\t\n\x05YCBCR\x10\x05\x12\x07\n\x03LAB\x10\x06\x12\x07\n\x03HSV\x10\x07\x12\n\n\x06PACKED\x10\x08\")\n\x0b\x43ompression\x12\x07\n\x03RAW\x10\x00\x12\x07\n\x03RLE\x10\x01\x12\x08\n\x04ZLIB\x10\x02\"H\n\tDithering\x12\x13\n\x0f\x46LOYD_STEINBERG\x10\x00\x12\r\n\tTHRESHOLD\x10\x01\x12\t\n\x05\x42\x41YER\x10\x02\x12\x0c\n\x08\x41TKINSON\x10\x03\"\x84\x04\n\x11RenderingResponse\x12@\n\x06status\x18\x01 \x01(\x0e\x32\x30.stboite.v1.display.RenderingResponse.StatusCode\x12\x0f\n\x07\x64\x65tails\x18\x02 \x01(\t\x12\x14\n\x0c\x64\x65\x64uplicated\x18\x03 \x01(\x08\x12\x0f\n\x07\x64ropped\x18\x04 \x01(\x08\x12\x43\n\x07\x64\x65vices\x18\x05 \x03(\x0b\x32\x32.stboite.v1.display.RenderingResponse.DevicesEntry\x1aU\n\x0c\x44\x65vicesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x34\n\x05value\x18\x02 \x01(\x0b\x32%.stboite.v1.display.RenderingResponse:\x02\x38\x01\"\xd8\x01\n\nStatusCode\x12\x06\n\x02OK\x10\x00\x12\x1a\n\x16PIXEL_TYPE_NOT_ALLOWED\x10\x01\x12\x19\n\x15\x44IMENSION_NOT_ALLOWED\x10\x02\x12\x13\n\x0fINVALID_PAYLOAD\x10\x03\x12\x17\n\x13\x44\x45LTA_BASE_MISMATCH\x10\x04\x12\x13\n\x0f\x41SSET_NOT_FOUND\x10\x05\x12\x12\n\x0e\x46ONT_NOT_FOUND\x10\x06\x12\x15\n\x11\x44\x45\x41\x44LINE_EXCEEDED\x10\x07\x12\x0f\n\x0bUNAVAILABLE\x10\x08\x12\x0c\n\x08INTERNAL\x10\t\"s\n\x17StreamRenderingResponse\x12\x10\n\x08sequence\x18\x01 \x01(\x04\x12\x37\n\x08response\x18\x02 \x01(\x0b\x32%.stboite.v1.display.RenderingResponse\x12\r\n\x05ready\x18\x03 \x01(\x08\"\xd2\x01\n\x12UploadAssetRequest\x12\n\n\x02id\x18\x01 \x01(\t\x12<\n\x04type\x18\x02 \x01(\x0e\x32..stboite.v1.display.RenderingRequest.PixelType\x12\r\n\x05width\x18\x03 \x01(\r\x12\x0e\n\x06height\x18\x04 \x01(\r\x12\x0c\n\x04\x64\x61ta\x18\x05 \x01(\x0c\x12\x45\n\x0b\x63ompression\x18\x06 \x01(\x0e\x32\x30.stboite.v1.display.RenderingRequest.Compression\"\xd4\x04\n\x13\x43omposeFrameRequest\x12\r\n\x05width\x18\x01 \x01(\r\x12\x0e\n\x06height\x18\x02 \x01(\r\x12\x41\n\x06\x61ssets\x18\x03 \x03(\x0b\x32\x31.stboite.v1.display.ComposeFrameRequest.Placement\x12>\n\x07patches\x18\x04 \x03(\x0b\x32-.stboite.v1.display.ComposeFrameRequest.Patch\x12\x18\n\x10wait_for_refresh\x18\x05 \x01(\x08\x12;\n\x05texts\x18\x06 \x03(\x0b\x32,.stboite.v1.display.ComposeFrameRequest.Text\x12\x10\n\x08priority\x18\x07 \x01(\r\x12\x13\n\x0b\x64\x65\x61\x64line_ms\x18\x08 \x01(\r\x1a\x33\n\tPlacement\x12\x10\n\x08\x61sset_id\x18\x01 \x01(\t\x12\t\n\x01x\x18\x02 \x01(\x11\x12\t\n\x01y\x18\x03 \x01(\x11\x1aU\n\x04Text\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x0c\n\x04\x66ont\x18\x02 \x01(\t\x12\x0c\n\x04size\x18\x03 \x01(\r\x12\t\n\x01x\x18\x04 \x01(\x11\x12\t\n\x01y\x18\x05 \x01(\x11\x12\r\n\x05white\x18\x06 \x01(\x08\x1a\x90\x01\n\x05Patch\x12;\n\x06region\x18\x01 \x01(\x0b\x32+.stboite.v1.display.RenderingRequest.Region\x12<\n\x04type\x18\x02 \x01(\x0e\x32..stboite.v1.display.RenderingRequest.PixelType\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\x0c\"\xe7\x01\n\x14PlayAnimationRequest\x12>\n\x06\x66rames\x18\x01 \x03(\x0b\x32..stboite.v1.display.PlayAnimationRequest.Frame\x12\r\n\x05loops\x18\x02 \x01(\r\x12\x10\n\x08priority\x18\x03 \x01(\r\x12\x1b\n\x13wait_for_completion\x18\x04 \x01(\x08\x1aQ\n\x05\x46rame\x12\x33\n\x05\x66rame\x18\x01 \x01(\x0b\x32$.stboite.v1.display.RenderingRequest\x12\x13\n\x0b\x64uration_ms\x18\x02 \x01(\r\"\x16\n\x14StopAnimationRequest\"\x18\n\x16GetCapabilitiesRequest\"\xa8\x05\n\x17GetCapabilitiesResponse\x12\r\n\x05width\x18\x01 \x01(\r\x12\x0e\n\x06height\x18\x02 \x01(\r\x12\x14\n\x0cnative_width\x18\x03 \x01(\r\x12\x15\n\rnative_height\x18\x04 \x01(\r\x12\x11\n\tlinewidth\x18\x05 \x01(\r\x12L\n\x0borientation\x18\x06 \x01(\x0e\x32\x37.stboite.v1.display.GetCapabilitiesResponse.Orientation\x12\x11\n\tbit_depth\x18\x07 \x01(\r\x12\x46\n\x0epreferred_type\x18\x08 \x01(\x0e\x32..stboite.v1.display.RenderingRequest.PixelType\x12\x43\n\x0bpixel_types\x18\t \x03(\x0e\x32..stboite.v1.display.RenderingRequest.PixelType\x12\x46\n\x0c\x63ompressions\x18\n \x03(\x0e\x32\x30.stboite.v1.display.RenderingRequest.Compression\x12\x17\n\x0fpartial_regions\x18\x0b \x01(\x08\x12\x14\n\x0c\x64\x65lta_frames\x18\x0c \x01(\x08\x12\x13\n\x0b\x66rame_rings\x18\r \x01(\x08\x12\x1c\n\x14max_animation_frames\x18\x0e \x01(\r\x12\x18\n\x10\x61sset_cache_size\x18\x0f \x01(\r\x12\r\n\x05\x66onts\x18\x10 \x03(\t\x12\x42\n\nditherings\x18\x11 \x03(\x0e\x32..stboite.v1.display.RenderingRequest.Dithering\")\n\x0bOrientation\x12\n\n\x06NATIVE\x10\x00\x12\x0e\n\nTRANSPOSED\x10\x01\x32\xcb\x05\n\x10RenderingService\x12_\n\x10\x44isplayRendering\x12$.stboite.v1.display.RenderingRequest\x1a%.stboite.v1.display.RenderingResponse\x12h\n\x0fStreamRendering\x12$.stboite.v1.display.RenderingRequest\x1a+.stboite.v1.display.StreamRenderingResponse(\x01\x30\x01\x12\\\n\x0bUploadAsset\x12&.stboite.v1.display.UploadAssetRequest\x1a%.stboite.v1.display.RenderingResponse\x12^\n\x0c\x43omposeFrame\x12\'.stboite.v1.display.ComposeFrameRequest\x1a%.stboite.v1.display.RenderingResponse\x12`\n\rPlayAnimation\x12(.stboite.v1.display.PlayAnimationRequest\x1a%.stboite.v1.display.RenderingResponse\x12`\n\rStopAnimation\x12(.stboite.v1.display.StopAnimationRequest\x1a%.stboite.v1.display.RenderingResponse\x12j\n\x0fGetCapabilities\x12*.stboite.v1.display.GetCapabilitiesRequest\x1a+.stboite.v1.display.GetCapabilitiesResponseb\x06proto3')
 
 
 
 _RENDERINGREQUEST = DESCRIPTOR.message_types_by_name['RenderingRequest']
+_RENDERINGREQUEST_REGION = _RENDERINGREQUEST.nested_types_by_name['Region']
+_RENDERINGREQUEST_SHAREDSLOT = _RENDERINGREQUEST.nested_types_by_name['SharedSlot']
 _RENDERINGRESPONSE = DESCRIPTOR.message_types_by_name['RenderingResponse']
+_RENDERINGRESPONSE_DEVICESENTRY = _RENDERINGRESPONSE.nested_types_by_name['DevicesEntry']
+_STREAMRENDERINGRESPONSE = DESCRIPTOR.message_types_by_name['StreamRenderingResponse']
+_UPLOADASSETREQUEST = DESCRIPTOR.message_types_by_name['UploadAssetRequest']
+_COMPOSEFRAMEREQUEST = DESCRIPTOR.message_types_by_name['ComposeFrameRequest']
+_COMPOSEFRAMEREQUEST_PLACEMENT = _COMPOSEFRAMEREQUEST.nested_types_by_name['Placement']
+_COMPOSEFRAMEREQUEST_TEXT = _COMPOSEFRAMEREQUEST.nested_types_by_name['Text']
+_COMPOSEFRAMEREQUEST_PATCH = _COMPOSEFRAMEREQUEST.nested_types_by_name['Patch']
+_PLAYANIMATIONREQUEST = DESCRIPTOR.message_types_by_name['PlayAnimationRequest']
+_PLAYANIMATIONREQUEST_FRAME = _PLAYANIMATIONREQUEST.nested_types_by_name['Frame']
+_STOPANIMATIONREQUEST = DESCRIPTOR.message_types_by_name['StopAnimationRequest']
+_GETCAPABILITIESREQUEST = DESCRIPTOR.message_types_by_name['GetCapabilitiesRequest']
+_GETCAPABILITIESRESPONSE = DESCRIPTOR.message_types_by_name['GetCapabilitiesResponse']
 _RENDERINGREQUEST_PIXELTYPE = _RENDERINGREQUEST.enum_types_by_name['PixelType']
+_RENDERINGREQUEST_COMPRESSION = _RENDERINGREQUEST.enum_types_by_name['Compression']
+_RENDERINGREQUEST_DITHERING = _RENDERINGREQUEST.enum_types_by_name['Dithering']
 _RENDERINGRESPONSE_STATUSCODE = _RENDERINGRESPONSE.enum_types_by_name['StatusCode']
+_GETCAPABILITIESRESPONSE_ORIENTATION = _GETCAPABILITIESRESPONSE.enum_types_by_name['Orientation']
 RenderingRequest = _reflection.GeneratedProtocolMessageType('RenderingRequest', (_message.Message,), {
+
+  'Region' : _reflection.GeneratedProtocolMessageType('Region', (_message.Message,), {
+    'DESCRIPTOR' : _RENDERINGREQUEST_REGION,
+    '__module__' : 'stboite_display_pb2'
+    # @@protoc_insertion_point(class_scope:stboite.v1.display.RenderingRequest.Region)
+    })
+  ,
+
+  'SharedSlot' : _reflection.GeneratedProtocolMessageType('SharedSlot', (_message.Message,), {
+    'DESCRIPTOR' : _RENDERINGREQUEST_SHAREDSLOT,
+    '__module__' : 'stboite_display_pb2'
+    # @@protoc_insertion_point(class_scope:stboite.v1.display.RenderingRequest.SharedSlot)
+    })
+  ,
   'DESCRIPTOR' : _RENDERINGREQUEST,
   '__module__' : 'stboite_display_pb2'
   # @@protoc_insertion_point(class_scope:stboite.v1.display.RenderingRequest)
   })
 _sym_db.RegisterMessage(RenderingRequest)
+_sym_db.RegisterMessage(RenderingRequest.Region)
+_sym_db.RegisterMessage(RenderingRequest.SharedSlot)
 
 RenderingResponse = _reflection.GeneratedProtocolMessageType('RenderingResponse', (_message.Message,), {
+
+  'DevicesEntry' : _reflection.GeneratedProtocolMessageType('DevicesEntry', (_message.Message,), {
+    'DESCRIPTOR' : _RENDERINGRESPONSE_DEVICESENTRY,
+    '__module__' : 'stboite_display_pb2'
+    # @@protoc_insertion_point(class_scope:stboite.v1.display.RenderingResponse.DevicesEntry)
+    })
+  ,
   'DESCRIPTOR' : _RENDERINGRESPONSE,
   '__module__' : 'stboite_display_pb2'
   # @@protoc_insertion_point(class_scope:stboite.v1.display.RenderingResponse)
   })
 _sym_db.RegisterMessage(RenderingResponse)
+_sym_db.RegisterMessage(RenderingResponse.DevicesEntry)
+
+StreamRenderingResponse = _reflection.GeneratedProtocolMessageType('StreamRenderingResponse', (_message.Message,), {
+  'DESCRIPTOR' : _STREAMRENDERINGRESPONSE,
+  '__module__' : 'stboite_display_pb2'
+  # @@protoc_insertion_point(class_scope:stboite.v1.display.StreamRenderingResponse)
+  })
+_sym_db.RegisterMessage(StreamRenderingResponse)
+
+UploadAssetRequest = _reflection.GeneratedProtocolMessageType('UploadAssetRequest', (_message.Message,), {
+  'DESCRIPTOR' : _UPLOADASSETREQUEST,
+  '__module__' : 'stboite_display_pb2'
+  # @@protoc_insertion_point(class_scope:stboite.v1.display.UploadAssetRequest)
+  })
+_sym_db.RegisterMessage(UploadAssetRequest)
+
+ComposeFrameRequest = _reflection.GeneratedProtocolMessageType('ComposeFrameRequest', (_message.Message,), {
+
+  'Placement' : _reflection.GeneratedProtocolMessageType('Placement', (_message.Message,), {
+    'DESCRIPTOR' : _COMPOSEFRAMEREQUEST_PLACEMENT,
+    '__module__' : 'stboite_display_pb2'
+    # @@protoc_insertion_point(class_scope:stboite.v1.display.ComposeFrameRequest.Placement)
+    })
+  ,
+
+  'Text' : _reflection.GeneratedProtocolMessageType('Text', (_message.Message,), {
+    'DESCRIPTOR' : _COMPOSEFRAMEREQUEST_TEXT,
+    '__module__' : 'stboite_display_pb2'
+    # @@protoc_insertion_point(class_scope:stboite.v1.display.ComposeFrameRequest.Text)
+    })
+  ,
+
+  'Patch' : _reflection.GeneratedProtocolMessageType('Patch', (_message.Message,), {
+    'DESCRIPTOR' : _COMPOSEFRAMEREQUEST_PATCH,
+    '__module__' : 'stboite_display_pb2'
+    # @@protoc_insertion_point(class_scope:stboite.v1.display.ComposeFrameRequest.Patch)
+    })
+  ,
+  'DESCRIPTOR' : _COMPOSEFRAMEREQUEST,
+  '__module__' : 'stboite_display_pb2'
+  # @@protoc_insertion_point(class_scope:stboite.v1.display.ComposeFrameRequest)
+  })
+_sym_db.RegisterMessage(ComposeFrameRequest)
+_sym_db.RegisterMessage(ComposeFrameRequest.Placement)
+_sym_db.RegisterMessage(ComposeFrameRequest.Text)
+_sym_db.RegisterMessage(ComposeFrameRequest.Patch)
+
+PlayAnimationRequest = _reflection.GeneratedProtocolMessageType('PlayAnimationRequest', (_message.Message,), {
+
+  'Frame' : _reflection.GeneratedProtocolMessageType('Frame', (_message.Message,), {
+    'DESCRIPTOR' : _PLAYANIMATIONREQUEST_FRAME,
+    '__module__' : 'stboite_display_pb2'
+    # @@protoc_insertion_point(class_scope:stboite.v1.display.PlayAnimationRequest.Frame)
+    })
+  ,
+  'DESCRIPTOR' : _PLAYANIMATIONREQUEST,
+  '__module__' : 'stboite_display_pb2'
+  # @@protoc_insertion_point(class_scope:stboite.v1.display.PlayAnimationRequest)
+  })
+_sym_db.RegisterMessage(PlayAnimationRequest)
+_sym_db.RegisterMessage(PlayAnimationRequest.Frame)
+
+StopAnimationRequest = _reflection.GeneratedProtocolMessageType('StopAnimationRequest', (_message.Message,), {
+  'DESCRIPTOR' : _STOPANIMATIONREQUEST,
+  '__module__' : 'stboite_display_pb2'
+  # @@protoc_insertion_point(class_scope:stboite.v1.display.StopAnimationRequest)
+  })
+_sym_db.RegisterMessage(StopAnimationRequest)
+
+GetCapabilitiesRequest = _reflection.GeneratedProtocolMessageType('GetCapabilitiesRequest', (_message.Message,), {
+  'DESCRIPTOR' : _GETCAPABILITIESREQUEST,
+  '__module__' : 'stboite_display_pb2'
+  # @@protoc_insertion_point(class_scope:stboite.v1.display.GetCapabilitiesRequest)
+  })
+_sym_db.RegisterMessage(GetCapabilitiesRequest)
+
+GetCapabilitiesResponse = _reflection.GeneratedProtocolMessageType('GetCapabilitiesResponse', (_message.Message,), {
+  'DESCRIPTOR' : _GETCAPABILITIESRESPONSE,
+  '__module__' : 'stboite_display_pb2'
+  # @@protoc_insertion_point(class_scope:stboite.v1.display.GetCapabilitiesResponse)
+  })
+_sym_db.RegisterMessage(GetCapabilitiesResponse)
 
 _RENDERINGSERVICE = DESCRIPTOR.services_by_name['RenderingService']
 if _descriptor._USE_C_DESCRIPTORS == False:
 
   DESCRIPTOR._options = None
+  _RENDERINGRESPONSE_DEVICESENTRY._options = None
+  _RENDERINGRESPONSE_DEVICESENTRY._serialized_options = b'8\001'
   _RENDERINGREQUEST._serialized_start=46
-  _RENDERINGREQUEST._serialized_end=258
-  _RENDERINGREQUEST_PIXELTYPE._serialized_start=173
-  _RENDERINGREQUEST_PIXELTYPE._serialized_end=258
-  _RENDERINGRESPONSE._serialized_start=261
-  _RENDERINGRESPONSE._serialized_end=461
-  _RENDERINGRESPONSE_STATUSCODE._serialized_start=365
-  _RENDERINGRESPONSE_STATUSCODE._serialized_end=461
-  _RENDERINGSERVICE._serialized_start=463
-  _RENDERINGSERVICE._serialized_end=578
+  _RENDERINGREQUEST._serialized_end=869
+  _RENDERINGREQUEST_REGION._serialized_start=535
+  _RENDERINGREQUEST_REGION._serialized_end=596
+  _RENDERINGREQUEST_SHAREDSLOT._serialized_start=598
+  _RENDERINGREQUEST_SHAREDSLOT._serialized_end=653
+  _RENDERINGREQUEST_PIXELTYPE._serialized_start=655
+  _RENDERINGREQUEST_PIXELTYPE._serialized_end=752
+  _RENDERINGREQUEST_COMPRESSION._serialized_start=754
+  _RENDERINGREQUEST_COMPRESSION._serialized_end=795
+  _RENDERINGREQUEST_DITHERING._serialized_start=797
+  _RENDERINGREQUEST_DITHERING._serialized_end=869
+  _RENDERINGRESPONSE._serialized_start=872
+  _RENDERINGRESPONSE._serialized_end=1388
+  _RENDERINGRESPONSE_DEVICESENTRY._serialized_start=1084
+  _RENDERINGRESPONSE_DEVICESENTRY._serialized_end=1169
+  _RENDERINGRESPONSE_STATUSCODE._serialized_start=1172
+  _RENDERINGRESPONSE_STATUSCODE._serialized_end=1388
+  _STREAMRENDERINGRESPONSE._serialized_start=1390
+  _STREAMRENDERINGRESPONSE._serialized_end=1505
+  _UPLOADASSETREQUEST._serialized_start=1508
+  _UPLOADASSETREQUEST._serialized_end=1718
+  _COMPOSEFRAMEREQUEST._serialized_start=1721
+  _COMPOSEFRAMEREQUEST._serialized_end=2317
+  _COMPOSEFRAMEREQUEST_PLACEMENT._serialized_start=2032
+  _COMPOSEFRAMEREQUEST_PLACEMENT._serialized_end=2083
+  _COMPOSEFRAMEREQUEST_TEXT._serialized_start=2085
+  _COMPOSEFRAMEREQUEST_TEXT._serialized_end=2170
+  _COMPOSEFRAMEREQUEST_PATCH._serialized_start=2173
+  _COMPOSEFRAMEREQUEST_PATCH._serialized_end=2317
+  _PLAYANIMATIONREQUEST._serialized_start=2320
+  _PLAYANIMATIONREQUEST._serialized_end=2551
+  _PLAYANIMATIONREQUEST_FRAME._serialized_start=2470
+  _PLAYANIMATIONREQUEST_FRAME._serialized_end=2551
+  _STOPANIMATIONREQUEST._serialized_start=2553
+  _STOPANIMATIONREQUEST._serialized_end=2575
+  _GETCAPABILITIESREQUEST._serialized_start=2577
+  _GETCAPABILITIESREQUEST._serialized_end=2601
+  _GETCAPABILITIESRESPONSE._serialized_start=2604
+  _GETCAPABILITIESRESPONSE._serialized_end=3284
+  _GETCAPABILITIESRESPONSE_ORIENTATION._serialized_start=3243
+  _GETCAPABILITIESRESPONSE_ORIENTATION._serialized_end=3284
+  _RENDERINGSERVICE._serialized_start=3287
+  _RENDERINGSERVICE._serialized_end=4002
 # @@protoc_insertion_point(module_scope)
@@ -20,6 +20,36 @@ class RenderingServiceStub(object):
                 request_serializer=stboite__display__pb2.RenderingRequest.SerializeToString,
                 response_deserializer=stboite__display__pb2.RenderingResponse.FromString,
                 )
+        self.StreamRendering = channel.stream_stream(
+                '/stboite.v1.display.RenderingService/StreamRendering',
+                request_serializer=stboite__display__pb2.RenderingRequest.SerializeToString,
+                response_deserializer=stboite__display__pb2.StreamRenderingResponse.FromString,
+                )
+        self.UploadAsset = channel.unary_unary(
+                '/stboite.v1.display.RenderingService/UploadAsset',
+                request_serializer=stboite__display__pb2.UploadAssetRequest.SerializeToString,
+                response_deserializer=stboite__display__pb2.RenderingResponse.FromString,
+                )
+        self.ComposeFrame = channel.unary_unary(
+                '/stboite.v1.display.RenderingService/ComposeFrame',
+                request_serializer=stboite__display__pb2.ComposeFrameRequest.SerializeToString,
+                response_deserializer=stboite__display__pb2.RenderingResponse.FromString,
+                )
+        self.PlayAnimation = channel.unary_unary(
+                '/stboite.v1.display.RenderingService/PlayAnimation',
+                request_serializer=stboite__display__pb2.PlayAnimationRequest.SerializeToString,
+                response_deserializer=stboite__display__pb2.RenderingResponse.FromString,
+                )
+        self.StopAnimation = channel.unary_unary(
+                '/stboite.v1.display.RenderingService/StopAnimation',
+                request_serializer=stboite__display__pb2.StopAnimationRequest.SerializeToString,
+                response_deserializer=stboite__display__pb2.RenderingResponse.FromString,
+                )
+        self.GetCapabilities = channel.unary_unary(
+                '/stboite.v1.display.RenderingService/GetCapabilities',
+                request_serializer=stboite__display__pb2.GetCapabilitiesRequest.SerializeToString,
+                response_deserializer=stboite__display__pb2.GetCapabilitiesResponse.FromString,
+                )
 
 
 class RenderingServiceServicer(object):
@@ -33,6 +63,59 @@ class RenderingServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamRendering(self, request_iterator, context):
+        """StreamRendering displays the frames pushed by the client over a single
+        stream. Frames are displayed in order, but a frame not yet displayed
+        when a newer one arrives is dropped; each frame gets exactly one
+        response, once it has been displayed, dropped or rejected.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def UploadAsset(self, request, context):
+        """UploadAsset stores an image on the device, converted once for it, to
+        be drawn by ComposeFrame. Assets are evicted (least recently used
+        first) when the device runs out of room for them.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ComposeFrame(self, request, context):
+        """ComposeFrame displays a frame made of previously uploaded assets, texts
+        rendered by the device and small raw patches.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def PlayAnimation(self, request, context):
+        """PlayAnimation plays a sequence of frames on the device, decoded once
+        before the playback starts. The playback is interrupted by any other
+        frame, by another animation or by StopAnimation.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StopAnimation(self, request, context):
+        """StopAnimation interrupts the animation being played, its last
+        displayed frame staying on the screen.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetCapabilities(self, request, context):
+        """GetCapabilities describes the frames accepted by the device and the
+        features it supports, letting clients send frames the device does not
+        need to convert.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_RenderingServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -41,6 +124,36 @@ def add_RenderingServiceServicer_to_server(servicer, server):
                     request_deserializer=stboite__display__pb2.RenderingRequest.FromString,
                     response_serializer=stboite__display__pb2.RenderingResponse.SerializeToString,
             ),
+            'StreamRendering': grpc.stream_stream_rpc_method_handler(
+                    servicer.StreamRendering,
+                    request_deserializer=stboite__display__pb2.RenderingRequest.FromString,
+                    response_serializer=stboite__display__pb2.StreamRenderingResponse.SerializeToString,
+            ),
+            'UploadAsset': grpc.unary_unary_rpc_method_handler(
+                    servicer.UploadAsset,
+                    request_deserializer=stboite__display__pb2.UploadAssetRequest.FromString,
+                    response_serializer=stboite__display__pb2.RenderingResponse.SerializeToString,
+            ),
+            'ComposeFrame': grpc.unary_unary_rpc_method_handler(
+                    servicer.ComposeFrame,
+                    request_deserializer=stboite__display__pb2.ComposeFrameRequest.FromString,
+                    response_serializer=stboite__display__pb2.RenderingResponse.SerializeToString,
+            ),
+            'PlayAnimation': grpc.unary_unary_rpc_method_handler(
+                    servicer.PlayAnimation,
+                    request_deserializer=stboite__display__pb2.PlayAnimationRequest.FromString,
+                    response_serializer=stboite__display__pb2.RenderingResponse.SerializeToString,
+            ),
+            'StopAnimation': grpc.unary_unary_rpc_method_handler(
+                    servicer.StopAnimation,
+                    request_deserializer=stboite__display__pb2.StopAnimationRequest.FromString,
+                    response_serializer=stboite__display__pb2.RenderingResponse.SerializeToString,
+            ),
+            'GetCapabilities': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetCapabilities,
+                    request_deserializer=stboite__display__pb2.GetCapabilitiesRequest.FromString,
+                    response_serializer=stboite__display__pb2.GetCapabilitiesResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'stboite.v1.display.RenderingService', rpc_method_handlers)
@@ -68,3 +181,105 @@ class RenderingService(object):
             stboite__display__pb2.RenderingResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def StreamRendering(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/stboite.v1.display.RenderingService/StreamRendering',
+            stboite__display__pb2.RenderingRequest.SerializeToString,
+            stboite__display__pb2.StreamRenderingResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def UploadAsset(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/stboite.v1.display.RenderingService/UploadAsset',
+            stboite__display__pb2.UploadAssetRequest.SerializeToString,
+            stboite__display__pb2.RenderingResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def ComposeFrame(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/stboite.v1.display.RenderingService/ComposeFrame',
+            stboite__display__pb2.ComposeFrameRequest.SerializeToString,
+            stboite__display__pb2.RenderingResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def PlayAnimation(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/stboite.v1.display.RenderingService/PlayAnimation',
+            stboite__display__pb2.PlayAnimationRequest.SerializeToString,
+            stboite__display__pb2.RenderingResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def StopAnimation(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/stboite.v1.display.RenderingService/StopAnimation',
+            stboite__display__pb2.StopAnimationRequest.SerializeToString,
+            stboite__display__pb2.RenderingResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetCapabilities(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/stboite.v1.display.RenderingService/GetCapabilities',
+            stboite__display__pb2.GetCapabilitiesRequest.SerializeToString,
+            stboite__display__pb2.GetCapabilitiesResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
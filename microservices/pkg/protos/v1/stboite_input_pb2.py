@@ -15,12 +15,13 @@ _sym_db = _symbol_database.Default()
 from google.protobuf import empty_pb2 as google_dot_protobuf_dot_empty__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x13stboite_input.proto\x12\x10stboite.v1.input\x1a\x1bgoogle/protobuf/empty.proto\"q\n\nTouchEvent\x12\x32\n\x06points\x18\x01 \x03(\x0b\x32\".stboite.v1.input.TouchEvent.Point\x1a/\n\x05Point\x12\t\n\x01X\x18\x01 \x01(\r\x12\t\n\x01Y\x18\x02 \x01(\r\x12\x10\n\x08Pressure\x18\x03 \x01(\r2]\n\x11TouchInputService\x12H\n\x10HandleTouchEvent\x12\x1c.stboite.v1.input.TouchEvent\x1a\x16.google.protobuf.Emptyb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x13stboite_input.proto\x12\x10stboite.v1.input\x1a\x1bgoogle/protobuf/empty.proto\"\x87\x01\n\nTouchEvent\x12\x32\n\x06points\x18\x01 \x03(\x0b\x32\".stboite.v1.input.TouchEvent.Point\x12\x14\n\x0ctimestamp_us\x18\x02 \x01(\x04\x1a/\n\x05Point\x12\t\n\x01X\x18\x01 \x01(\r\x12\t\n\x01Y\x18\x02 \x01(\r\x12\x10\n\x08Pressure\x18\x03 \x01(\r\"?\n\x0fTouchEventBatch\x12,\n\x06\x65vents\x18\x01 \x03(\x0b\x32\x1c.stboite.v1.input.TouchEvent2\xb1\x01\n\x11TouchInputService\x12H\n\x10HandleTouchEvent\x12\x1c.stboite.v1.input.TouchEvent\x1a\x16.google.protobuf.Empty\x12R\n\x11StreamTouchEvents\x12!.stboite.v1.input.TouchEventBatch\x1a\x16.google.protobuf.Empty(\x01\x30\x01\x62\x06proto3')
 
 
 
 _TOUCHEVENT = DESCRIPTOR.message_types_by_name['TouchEvent']
 _TOUCHEVENT_POINT = _TOUCHEVENT.nested_types_by_name['Point']
+_TOUCHEVENTBATCH = DESCRIPTOR.message_types_by_name['TouchEventBatch']
 TouchEvent = _reflection.GeneratedProtocolMessageType('TouchEvent', (_message.Message,), {
 
   'Point' : _reflection.GeneratedProtocolMessageType('Point', (_message.Message,), {
@@ -36,14 +37,23 @@ TouchEvent = _reflection.GeneratedProtocolMessageType('TouchEvent', (_message.Me
 _sym_db.RegisterMessage(TouchEvent)
 _sym_db.RegisterMessage(TouchEvent.Point)
 
+TouchEventBatch = _reflection.GeneratedProtocolMessageType('TouchEventBatch', (_message.Message,), {
+  'DESCRIPTOR' : _TOUCHEVENTBATCH,
+  '__module__' : 'stboite_input_pb2'
+  # @@protoc_insertion_point(class_scope:stboite.v1.input.TouchEventBatch)
+  })
+_sym_db.RegisterMessage(TouchEventBatch)
+
 _TOUCHINPUTSERVICE = DESCRIPTOR.services_by_name['TouchInputService']
 if _descriptor._USE_C_DESCRIPTORS == False:
 
   DESCRIPTOR._options = None
-  _TOUCHEVENT._serialized_start=70
-  _TOUCHEVENT._serialized_end=183
-  _TOUCHEVENT_POINT._serialized_start=136
-  _TOUCHEVENT_POINT._serialized_end=183
-  _TOUCHINPUTSERVICE._serialized_start=185
-  _TOUCHINPUTSERVICE._serialized_end=278
+  _TOUCHEVENT._serialized_start=71
+  _TOUCHEVENT._serialized_end=206
+  _TOUCHEVENT_POINT._serialized_start=159
+  _TOUCHEVENT_POINT._serialized_end=206
+  _TOUCHEVENTBATCH._serialized_start=208
+  _TOUCHEVENTBATCH._serialized_end=271
+  _TOUCHINPUTSERVICE._serialized_start=274
+  _TOUCHINPUTSERVICE._serialized_end=451
 # @@protoc_insertion_point(module_scope)
@@ -21,6 +21,11 @@ class TouchInputServiceStub(object):
                 request_serializer=stboite__input__pb2.TouchEvent.SerializeToString,
                 response_deserializer=google_dot_protobuf_dot_empty__pb2.Empty.FromString,
                 )
+        self.StreamTouchEvents = channel.stream_stream(
+                '/stboite.v1.input.TouchInputService/StreamTouchEvents',
+                request_serializer=stboite__input__pb2.TouchEventBatch.SerializeToString,
+                response_deserializer=google_dot_protobuf_dot_empty__pb2.Empty.FromString,
+                )
 
 
 class TouchInputServiceServicer(object):
@@ -34,6 +39,18 @@ class TouchInputServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamTouchEvents(self, request_iterator, context):
+        """StreamTouchEvents handles the touch screen events coming from the
+        device over a single stream. Events are sent in batches, oldest first,
+        each batch being acknowledged by a response once handled: the device
+        sends the next batch only once the previous one has been acknowledged,
+        merging the intermediate positions of the moving fingers meanwhile.
+        Every press and release of the screen is sent.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_TouchInputServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -42,6 +59,11 @@ def add_TouchInputServiceServicer_to_server(servicer, server):
                     request_deserializer=stboite__input__pb2.TouchEvent.FromString,
                     response_serializer=google_dot_protobuf_dot_empty__pb2.Empty.SerializeToString,
             ),
+            'StreamTouchEvents': grpc.stream_stream_rpc_method_handler(
+                    servicer.StreamTouchEvents,
+                    request_deserializer=stboite__input__pb2.TouchEventBatch.FromString,
+                    response_serializer=google_dot_protobuf_dot_empty__pb2.Empty.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'stboite.v1.input.TouchInputService', rpc_method_handlers)
@@ -69,3 +91,20 @@ class TouchInputService(object):
             google_dot_protobuf_dot_empty__pb2.Empty.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def StreamTouchEvents(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/stboite.v1.input.TouchInputService/StreamTouchEvents',
+            stboite__input__pb2.TouchEventBatch.SerializeToString,
+            google_dot_protobuf_dot_empty__pb2.Empty.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
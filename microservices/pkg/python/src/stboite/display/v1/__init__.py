@@ -16,26 +16,122 @@
 
 import abc
 import asyncio
+import logging
 import string
 import sys
+from collections import OrderedDict
+
 import grpc
+import numpy as np
 
+from stboite.display.v1.assets import Asset, AssetCache, compose
+from stboite.display.v1.budget import IngestBudget
+from stboite.display.v1.capture import CaptureInterceptor, CaptureWriter
+from stboite.display.v1.converter import PIXEL_FORMATS
+from stboite.display.v1.encoding import check_payload_size, decompress
+from stboite.display.v1.metrics import DisplayMetrics, serve_metrics
+from stboite.display.v1.ring import FrameRing
+from stboite.display.v1.scheduler import Deadline
+from stboite.display.v1.text import Fonts
 from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceServicer, add_RenderingServiceServicer_to_server  # noqa: E501
-from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest, RenderingResponse  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2 import ComposeFrameRequest, GetCapabilitiesRequest, GetCapabilitiesResponse, RenderingRequest, RenderingResponse, StreamRenderingResponse, UploadAssetRequest  # noqa: E501
 
-from typing import Optional
+from typing import AsyncIterator, Optional, Set, Tuple
 
 
 class GRPCDisplay(RenderingServiceServicer):
     """Abstract class to simplify the use of the gRPC API for embedded API
     """
 
+    # Inactivity duration, in seconds, after which `on_idle` is called (None
+    # to disable it)
+    IDLE_TIMEOUT: Optional[float] = None
+    # Maximum duration, in seconds, between two refreshes of the screen after
+    # which `on_refresh_due` is called (None to disable it)
+    REFRESH_INTERVAL: Optional[float] = None
+    # Memory available to the uploaded assets, in bytes
+    ASSET_CACHE_SIZE: int = 1 << 20
+    # Size of the frames accepted by the display, as (width, height), None to
+    # accept any size
+    FRAME_SIZE: Optional[Tuple[int, int]] = None
+    # Size of the largest frame composed by `ComposeFrame`, as (width, height)
+    MAX_COMPOSED_FRAME_SIZE: Tuple[int, int] = (4096, 4096)
+    # Number of characters of the longest text drawn by `ComposeFrame`
+    MAX_TEXT_LENGTH: int = 1024
+    # Number of frame rings kept open, the least recently used ones being
+    # closed first
+    FRAME_RING_CACHE_SIZE: int = 8
+    # Size of the largest request accepted, in bytes; larger requests are
+    # rejected before being read in memory
+    MAX_MESSAGE_SIZE: int = 4 << 20
+    # Number of frames of a stream handled at the same time; the next frames
+    # are not read until one of them is answered
+    MAX_STREAM_FRAMES: int = 4
+    # Number of frames handled at the same time by default, counting each
+    # frame of the streams
+    MAX_CONCURRENT_RPCS: int = 16
+
     _server: grpc.aio.Server
     __pre_stop: asyncio.Task
+    __metrics_addr: Optional[str]
+    __metrics_server: Optional[asyncio.AbstractServer] = None
+    __idle: Deadline
+    __refresh_due: Deadline
+    __rings: "OrderedDict[str, FrameRing]"
+    __local_socket: Optional[str]
+    __capture: Optional[CaptureWriter] = None
+    __budget: Optional[IngestBudget] = None
+
+    # Assets uploaded by the clients, drawn by `ComposeFrame`
+    assets: AssetCache
+    # Fonts of the texts drawn by `ComposeFrame`
+    fonts: Fonts
+    # Port the gRPC server is bound to
+    port: int
+    # Counters and latency histograms of the display, updated by the
+    # implementations
+    metrics: DisplayMetrics
+
+    def __init__(self,
+                 listen_addr: string,
+                 metrics_addr: Optional[str] = None,
+                 local_socket: Optional[str] = None,
+                 capture_file: Optional[str] = None,
+                 max_concurrent_rpcs: Optional[int] = None):
+        # NOTE: the requests are captured as received, to be replayed
+        interceptors = []
+        if capture_file:
+            self.__capture = CaptureWriter(capture_file)
+            interceptors.append(CaptureInterceptor(self.__capture))
+        # NOTE: the frames received while `max_concurrent_rpcs` frames
+        #       (MAX_CONCURRENT_RPCS if not set, no limit if 0) are handled
+        #       are rejected with RESOURCE_EXHAUSTED, bounding the memory used
+        #       by the frames; the calls controlling the display are not
+        #       limited, so that they are served while frames are queued
+        if max_concurrent_rpcs is None:
+            max_concurrent_rpcs = self.MAX_CONCURRENT_RPCS
+        if max_concurrent_rpcs:
+            self.__budget = IngestBudget(max_concurrent_rpcs)
+            interceptors.append(self.__budget)
+        self._server = grpc.aio.server(
+            interceptors=interceptors,
+            options=[("grpc.max_receive_message_length", self.MAX_MESSAGE_SIZE)],  # noqa: E501
+        )
+        self.port = self._server.add_insecure_port(listen_addr)
+        # NOTE: co-located clients can pass their frames through frame rings
+        #       when connected to the Unix socket
+        if local_socket:
+            self._server.add_insecure_port(f"unix:{local_socket}")
+        self.__local_socket = local_socket
+        self.__rings = OrderedDict()
 
-    def __init__(self, listen_addr: string):
-        self._server = grpc.aio.server()
-        self._server.add_insecure_port(listen_addr)
+        self.metrics = DisplayMetrics()
+        self.__metrics_addr = metrics_addr
+
+        self.__idle = Deadline(self.IDLE_TIMEOUT, self.on_idle)
+        self.__refresh_due = Deadline(self.REFRESH_INTERVAL, self.__refresh)
+        self.assets = AssetCache(self.ASSET_CACHE_SIZE)
+        self.fonts = Fonts()
 
         add_RenderingServiceServicer_to_server(self, self._server)
 
@@ -50,7 +146,17 @@ class GRPCDisplay(RenderingServiceServicer):
         """Starts the gRPC server.
 
         This method may only be called once. (i.e. it is not idempotent).
+
+        The metrics are exposed on `http://<metrics_addr>/metrics` when a
+        metrics address has been given.
+
+        The idle and refresh deadlines are armed once started, the screen
+        being expected to have been refreshed when the display was created.
         """
+        self.__idle.arm()
+        self.__refresh_due.arm()
+        if self.__metrics_addr:
+            self.__metrics_server = await serve_metrics(self.metrics, self.__metrics_addr)  # noqa: E501
         return await self._server.start()
 
     async def wait_for_termination(self,
@@ -114,7 +220,96 @@ class GRPCDisplay(RenderingServiceServicer):
         Args:
           grace: A duration of time in seconds or None.
         """
-        return await self._server.stop(grace)
+        self.__idle.cancel()
+        self.__refresh_due.cancel()
+        if self.__metrics_server:
+            self.__metrics_server.close()
+            await self.__metrics_server.wait_closed()
+        await self._server.stop(grace)
+        if self.__capture:
+            self.__capture.close()
+        for ring in self.__rings.values():
+            ring.close()
+        self.__rings.clear()
+
+    def frame_received(self) -> None:
+        """Signals that a frame is being handled, suspending the idle
+        deadline until `frame_handled` is called.
+        """
+        self.__idle.disarm()
+
+    def frame_handled(self, refreshed: bool) -> None:
+        """Signals that a frame has been handled, re-arming the idle
+        deadline (and the refresh one if the screen has been refreshed).
+        """
+        self.__idle.arm()
+        if refreshed:
+            self.__refresh_due.arm()
+
+    def schedule_refresh(self, delay: Optional[float] = None) -> None:
+        """Re-arms the refresh deadline, to expire in `delay` seconds
+        (`REFRESH_INTERVAL` if not set).
+        """
+        self.__refresh_due.arm(delay)
+
+    async def on_idle(self) -> None:
+        """Called once no frame has been handled for `IDLE_TIMEOUT`
+        seconds, typically to put the screen in a low consumption mode.
+        """
+
+    async def on_refresh_due(self) -> None:
+        """Called when the screen has not been refreshed for
+        `REFRESH_INTERVAL` seconds.
+        """
+
+    async def __refresh(self) -> None:
+        await self.on_refresh_due()
+        self.__refresh_due.arm()
+
+    def payload(
+        self,
+        request: RenderingRequest,
+        context: grpc.aio.ServicerContext
+    ) -> bytes:
+        """Returns the payload of a rendering request, read from the slot of
+        a frame ring when the request refers to one.
+
+        Raises:
+          ValueError: the slot cannot be read, or the request has not been
+            received on the local socket.
+        """
+        if not request.HasField("slot"):
+            return request.data
+
+        if not context.peer().startswith("unix:"):
+            raise ValueError("frame rings are only accepted on the local socket")  # noqa: E501
+
+        name = request.slot.ring
+        ring = self.__rings.get(name)
+        if ring is None:
+            try:
+                ring = FrameRing.open(name)
+            except OSError as e:
+                raise ValueError(f"cannot open frame ring {name!r}: {e.strerror}") from e  # noqa: E501
+            self.__rings[name] = ring
+            if len(self.__rings) > self.FRAME_RING_CACHE_SIZE:
+                self.__rings.popitem(last=False)[1].close()
+        else:
+            self.__rings.move_to_end(name)
+        try:
+            return ring.read(request.slot.index, request.slot.size)
+        except OSError as e:
+            raise ValueError(f"cannot read frame ring {name!r}: {e.strerror}") from e  # noqa: E501
+
+    def pack(self, white: np.ndarray) -> Optional[bytes]:
+        """Packs a frame composed by `ComposeFrame`, a (height, width)
+        boolean array set for the white pixels, into the panel layout of the
+        PACKED pixel type.
+
+        Returns None if the display has no packed layout, the frame being
+        then sent as a ONE payload.
+        """
+        return None
 
     @abc.abstractclassmethod
     async def DisplayRendering(
@@ -124,3 +319,239 @@ class GRPCDisplay(RenderingServiceServicer):
     ) -> RenderingResponse:
         """Displays the encapsulated image on the device.
         """
+
+    def capabilities(self) -> GetCapabilitiesResponse:
+        """Returns the capabilities common to all displays, completed by the
+        implementations with the properties of their panel.
+        """
+        capabilities = GetCapabilitiesResponse(
+            compressions=[RenderingRequest.RAW, RenderingRequest.RLE, RenderingRequest.ZLIB],  # noqa: E501
+            frame_rings=bool(self.__local_socket),
+            asset_cache_size=self.ASSET_CACHE_SIZE,
+            fonts=self.fonts.ids(),
+        )
+        if self.FRAME_SIZE:
+            capabilities.width, capabilities.height = self.FRAME_SIZE
+        return capabilities
+
+    async def GetCapabilities(
+        self,
+        request: GetCapabilitiesRequest,
+        context: grpc.aio.ServicerContext
+    ) -> GetCapabilitiesResponse:
+        """Describes the frames accepted by the display and the features it
+        supports.
+        """
+        return self.capabilities()
+
+    async def StreamRendering(
+        self,
+        request_iterator: AsyncIterator[RenderingRequest],
+        context: grpc.aio.ServicerContext
+    ) -> AsyncIterator[StreamRenderingResponse]:
+        """Displays the frames pushed on the stream.
+
+        Frames are read as they arrive and handed to `DisplayRendering`,
+        which is expected to only display the newest frame when several are
+        waiting; the response of each frame is sent once it has been
+        displayed, dropped or rejected. At most `MAX_STREAM_FRAMES` frames
+        are handled at the same time, the next ones being left to the
+        client until one of them is answered.
+        """
+        responses: asyncio.Queue = asyncio.Queue()
+        tasks: Set[asyncio.Task] = set()
+        slots = asyncio.Semaphore(self.MAX_STREAM_FRAMES)
+        in_flight = 0
+        received = False
+
+        async def render(sequence: int, request: RenderingRequest) -> None:
+            try:
+                response = await self.DisplayRendering(request, context)
+            except Exception as e:  # pylint: disable=broad-except
+                # NOTE: the failure of a frame does not end the stream
+                logging.getLogger("GRPCDisplay").exception("failed to render streamed frame %d", sequence)  # noqa: E501
+                response = RenderingResponse(status=RenderingResponse.INTERNAL, details=str(e))  # noqa: E501
+            responses.put_nowait((sequence, response))
+
+        async def acquire() -> None:
+            await slots.acquire()
+            if self.__budget:
+                # NOTE: the streamed frames count against the requests
+                #       handled by the server
+                try:
+                    await self.__budget.acquire()
+                except BaseException:
+                    slots.release()
+                    raise
+
+        def release(*_) -> None:
+            slots.release()
+            if self.__budget:
+                self.__budget.release()
+
+        async def receive() -> None:
+            nonlocal in_flight, received
+            sequence = 0
+            # NOTE: a slot is taken before reading each frame, so the frames
+            #       are not read while all the slots are taken; the slot of a
+            #       frame is released once its task is done, even if it is
+            #       cancelled before running
+            await acquire()
+            held = True
+            try:
+                async for request in request_iterator:
+                    sequence += 1
+                    in_flight += 1
+                    request.wait_for_refresh = True
+                    task = asyncio.create_task(render(sequence, request))
+                    held = False
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    task.add_done_callback(release)
+                    await acquire()
+                    held = True
+            except Exception as e:  # pylint: disable=broad-except
+                responses.put_nowait(e)
+                return
+            finally:
+                if held:
+                    release()
+            received = True
+            responses.put_nowait(None)
+
+        receiver = asyncio.create_task(receive())
+        try:
+            while not (received and in_flight == 0):
+                item = await responses.get()
+                if item is None:
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+
+                in_flight -= 1
+                sequence, response = item
+                yield StreamRenderingResponse(sequence=sequence, response=response, ready=in_flight == 0)  # noqa: E501
+        finally:
+            receiver.cancel()
+            for task in tasks:
+                task.cancel()
+
+    async def UploadAsset(
+        self,
+        request: UploadAssetRequest,
+        context: grpc.aio.ServicerContext
+    ) -> RenderingResponse:
+        """Converts and stores an asset, to be drawn by `ComposeFrame`."""
+        if request.type not in PIXEL_FORMATS:
+            return RenderingResponse(
+                status=RenderingResponse.PIXEL_TYPE_NOT_ALLOWED,
+                details=f"pixel type {RenderingRequest.PixelType.Name(request.type)} is not allowed for assets"  # noqa: E501
+            )
+
+        # NOTE: check the size before decompressing the payload
+        if (request.width + 7) // 8 * request.height > self.assets.max_size:
+            return RenderingResponse(
+                status=RenderingResponse.DIMENSION_NOT_ALLOWED,
+                details=f"asset size exceeds the cache size ({self.assets.max_size} bytes)"  # noqa: E501
+            )
+
+        def convert() -> Asset:
+            size = request.width * request.height * PIXEL_FORMATS[request.type][1]  # noqa: E501
+            check_payload_size(request.compression, len(request.data), size)
+            data = decompress(request.compression, request.data, size)
+            return Asset.convert(request.type, request.width, request.height, data)  # noqa: E501
+
+        try:
+            asset = await asyncio.get_running_loop().run_in_executor(None, convert)  # noqa: E501
+            self.assets.put(request.id, asset)
+        except ValueError as e:
+            return RenderingResponse(status=RenderingResponse.INVALID_PAYLOAD, details=str(e))  # noqa: E501
+        return RenderingResponse(status=RenderingResponse.OK)
+
+    async def ComposeFrame(
+        self,
+        request: ComposeFrameRequest,
+        context: grpc.aio.ServicerContext
+    ) -> RenderingResponse:
+        """Composes a frame from the uploaded assets and the texts, and
+        displays it with `DisplayRendering`.
+        """
+        received_at = asyncio.get_running_loop().time()
+        # NOTE: the frame is allocated from the requested size, which must be
+        #       bounded even when the display accepts any size
+        max_width, max_height = self.MAX_COMPOSED_FRAME_SIZE
+        if not 0 < request.width <= max_width or not 0 < request.height <= max_height:  # noqa: E501
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"composed frame dimension size must be between 1x1px and {max_width}x{max_height}px")  # noqa: E501
+        if self.FRAME_SIZE and (request.width, request.height) != self.FRAME_SIZE:  # noqa: E501
+            return RenderingResponse(
+                status=RenderingResponse.DIMENSION_NOT_ALLOWED,
+                details="rendering frame dimension size must be exactly {}x{}px".format(*self.FRAME_SIZE)  # noqa: E501
+            )
+
+        placements = []
+        for placement in request.assets:
+            asset = self.assets.get(placement.asset_id)
+            if asset is None:
+                return RenderingResponse(
+                    status=RenderingResponse.ASSET_NOT_FOUND,
+                    details=f"asset {placement.asset_id!r} is unknown or has been evicted"  # noqa: E501
+                )
+            placements.append((asset, placement.x, placement.y))
+        patches = [
+            ((patch.region.x, patch.region.y, patch.region.width, patch.region.height), patch.type, patch.data)  # noqa: E501
+            for patch in request.patches
+        ]
+        for text in request.texts:
+            # NOTE: each character of a text is looked up in the glyph
+            #       atlas of its font, even outside of the frame
+            if len(text.text) > self.MAX_TEXT_LENGTH:
+                await context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"text must be at most {self.MAX_TEXT_LENGTH} characters long")  # noqa: E501
+            if text.font not in self.fonts:
+                return RenderingResponse(
+                    status=RenderingResponse.FONT_NOT_FOUND,
+                    details=f"font {text.font!r} is unknown"
+                )
+
+        def render() -> Tuple[int, bytes]:
+            # NOTE: glyph atlases are created on first use, out of the
+            #       event loop
+            texts = [
+                (self.fonts.atlas(text.font, text.size), text.text, text.x, text.y, text.white)  # noqa: E501
+                for text in request.texts
+            ]
+            frame = compose(request.width, request.height, placements, patches, texts)  # noqa: E501
+            # NOTE: the frame is packed once, here, instead of being
+            #       expanded to one byte per pixel and converted again by
+            #       `DisplayRendering`
+            packed = self.pack(frame)
+            if packed is not None:
+                return RenderingRequest.PACKED, packed
+            # NOTE: ONE payloads use one byte per pixel, non-zero for white
+            return RenderingRequest.ONE, frame.view(np.uint8).tobytes()
+
+        try:
+            pixel_type, data = await asyncio.get_running_loop().run_in_executor(None, render)  # noqa: E501
+        except ValueError as e:
+            return RenderingResponse(status=RenderingResponse.INVALID_PAYLOAD, details=str(e))  # noqa: E501
+
+        # NOTE: the deadline includes the composition
+        deadline_ms = request.deadline_ms
+        if deadline_ms:
+            elapsed_ms = int((asyncio.get_running_loop().time() - received_at) * 1000)  # noqa: E501
+            if elapsed_ms >= deadline_ms:
+                self.metrics.frames_expired.inc()
+                return RenderingResponse(
+                    status=RenderingResponse.DEADLINE_EXCEEDED,
+                    details="frame deadline passed while composing it"
+                )
+            deadline_ms -= elapsed_ms
+
+        return await self.DisplayRendering(RenderingRequest(
+            type=pixel_type,
+            width=request.width,
+            height=request.height,
+            data=data,
+            wait_for_refresh=request.wait_for_refresh,
+            priority=request.priority,
+            deadline_ms=deadline_ms,
+        ), context)
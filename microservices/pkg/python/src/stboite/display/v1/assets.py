@@ -0,0 +1,173 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Assets stored on the display servers and composition of frames"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from stboite.display.v1.converter import PIXEL_FORMATS, white_pixels
+from stboite.display.v1.text import GlyphAtlas
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest
+
+from typing import Iterable, Optional, Tuple
+
+
+class Asset:
+    """Image reduced to black and white, packed eight pixels per byte"""
+
+    def __init__(self, width: int, height: int, white: bytes, mask: Optional[bytes] = None):  # noqa: E501
+        self.width = width
+        self.height = height
+        # NOTE: rows of packed bits, set for the white pixels
+        self.white = white
+        # NOTE: rows of packed bits, set for the opaque pixels (None if the
+        #       whole asset is opaque)
+        self.mask = mask
+
+    @property
+    def size(self) -> int:
+        """Memory used by the asset pixels, in bytes."""
+        return len(self.white) + (len(self.mask) if self.mask is not None else 0)  # noqa: E501
+
+    @classmethod
+    def convert(cls, pixel_type: int, width: int, height: int, data: bytes) -> "Asset":  # noqa: E501
+        """Converts the raw pixels of an image into an asset.
+
+        Raises:
+          ValueError: the pixel type, the size or the payload is invalid.
+        """
+        if pixel_type not in PIXEL_FORMATS:
+            raise ValueError(f"unsupported asset pixel type {pixel_type}")
+        if width == 0 or height == 0:
+            raise ValueError("asset must not be empty")
+        if len(data) != width * height * PIXEL_FORMATS[pixel_type][1]:
+            raise ValueError("payload size does not match the asset size")
+
+        white = np.packbits(white_pixels(pixel_type, width, height, data), axis=1)  # noqa: E501
+        mask = None
+        if pixel_type == RenderingRequest.RGBA:
+            alpha = np.frombuffer(data, dtype=np.uint8)[3::4].reshape(height, width) >= 128  # noqa: E501
+            if not alpha.all():
+                mask = np.packbits(alpha, axis=1).tobytes()
+        return cls(width, height, white.tobytes(), mask)
+
+    def unpack(self) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Returns the (height, width) boolean arrays of the white and the
+        opaque pixels of the asset.
+        """
+        def bits(packed: bytes) -> np.ndarray:
+            rows = np.frombuffer(packed, dtype=np.uint8).reshape(self.height, -1)  # noqa: E501
+            return np.unpackbits(rows, axis=1, count=self.width).view(bool)
+
+        return bits(self.white), (bits(self.mask) if self.mask is not None else None)  # noqa: E501
+
+
+class AssetCache:
+    """Assets indexed by their identifier, the least recently used ones
+    being evicted once their total size exceeds `max_size` bytes.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.__assets: "OrderedDict[str, Asset]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__assets)
+
+    def get(self, asset_id: str) -> Optional[Asset]:
+        """Returns the given asset, or None if unknown or evicted."""
+        asset = self.__assets.get(asset_id)
+        if asset is not None:
+            self.__assets.move_to_end(asset_id)
+        return asset
+
+    def put(self, asset_id: str, asset: Asset) -> None:
+        """Stores (or replaces) an asset, evicting the least recently used
+        ones to make room for it.
+
+        Raises:
+          ValueError: the asset is larger than the whole cache.
+        """
+        if asset.size > self.max_size:
+            raise ValueError(f"asset size ({asset.size} bytes) exceeds the cache size ({self.max_size} bytes)")  # noqa: E501
+
+        previous = self.__assets.pop(asset_id, None)
+        if previous is not None:
+            self.size -= previous.size
+        while self.size + asset.size > self.max_size:
+            _, evicted = self.__assets.popitem(last=False)
+            self.size -= evicted.size
+
+        self.__assets[asset_id] = asset
+        self.size += asset.size
+
+
+def compose(width: int,
+            height: int,
+            placements: Iterable[Tuple[Asset, int, int]],
+            patches: Iterable[Tuple[Tuple[int, int, int, int], int, bytes]] = (),  # noqa: E501
+            texts: Iterable[Tuple[GlyphAtlas, str, int, int, bool]] = ()) -> np.ndarray:  # noqa: E501
+    """Composes a frame from assets, texts and raw patches, on a white
+    background.
+
+    Args:
+      width: the frame width, in pixels.
+      height: the frame height, in pixels.
+      placements: the assets to draw, in order, with the position of their
+        top left corner (clipped by the frame borders).
+      patches: the raw pixels to draw over the assets and the texts, as the
+        (x, y, width, height) region they fill, their pixel type and their
+        payload.
+      texts: the texts to draw over the assets, with the glyph atlas of
+        their font, the position of their top left corner and whether they
+        are drawn in white.
+
+    Returns:
+      The (height, width) boolean array of the frame, set for the white
+      pixels, to be packed into the panel layout.
+
+    Raises:
+      ValueError: a patch is outside of the frame or has an invalid payload.
+    """
+    frame = np.ones((height, width), dtype=bool)
+
+    for asset, x, y in placements:
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + asset.width, width), min(y + asset.height, height)
+        if x0 >= x1 or y0 >= y1:
+            continue
+
+        white, mask = asset.unpack()
+        source = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+        if mask is None:
+            frame[y0:y1, x0:x1] = white[source]
+        else:
+            np.copyto(frame[y0:y1, x0:x1], white[source], where=mask[source])
+
+    for atlas, text, x, y, white in texts:
+        atlas.draw(frame, text, x, y, white)
+
+    for (x, y, w, h), pixel_type, data in patches:
+        if w == 0 or h == 0 or x + w > width or y + h > height:
+            raise ValueError("patch region must be a non-empty area inside the frame")  # noqa: E501
+        if pixel_type not in PIXEL_FORMATS:
+            raise ValueError(f"unsupported patch pixel type {pixel_type}")
+        if len(data) != w * h * PIXEL_FORMATS[pixel_type][1]:
+            raise ValueError("payload size does not match the patch size")
+        frame[y:y + h, x:x + w] = white_pixels(pixel_type, w, h, data)
+
+    return frame
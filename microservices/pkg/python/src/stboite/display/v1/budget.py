@@ -0,0 +1,69 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Bound on the number of requests held in memory by the display servers"""
+
+import asyncio
+
+import grpc
+
+from typing import Awaitable, Callable
+
+
+class IngestBudget(grpc.aio.ServerInterceptor):
+    """Server interceptor sharing a fixed number of slots between the
+    requests being handled.
+
+    A call carrying a frame (one of `METHODS`) holds a slot while it is
+    handled, and is rejected with RESOURCE_EXHAUSTED when no slot is left;
+    the other calls, which control the display, are never limited. The
+    frames of the streaming calls take their slots with `acquire` instead,
+    waiting for one to be released.
+    """
+
+    # Names of the unary methods whose requests carry a frame
+    METHODS = ("DisplayRendering", "ComposeFrame")
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.__slots = asyncio.Semaphore(slots)
+
+    async def acquire(self) -> None:
+        """Takes a slot, waiting for one to be released if needed."""
+        await self.__slots.acquire()
+
+    def release(self) -> None:
+        """Releases a slot taken by `acquire`."""
+        self.__slots.release()
+
+    async def intercept_service(
+        self,
+        continuation: Callable[[grpc.HandlerCallDetails], Awaitable[grpc.RpcMethodHandler]],  # noqa: E501
+        handler_call_details: grpc.HandlerCallDetails
+    ) -> grpc.RpcMethodHandler:
+        handler = await continuation(handler_call_details)
+        if handler is None or not handler.unary_unary:
+            return handler
+        if handler_call_details.method.rsplit("/", 1)[-1] not in self.METHODS:  # noqa: E501
+            return handler
+
+        behavior = handler.unary_unary
+
+        async def limited(request, context: grpc.aio.ServicerContext):
+            if self.__slots.locked():
+                await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, f"more than {self.slots} frames being handled")  # noqa: E501
+            async with self.__slots:
+                return await behavior(request, context)
+
+        return grpc.unary_unary_rpc_method_handler(limited, handler.request_deserializer, handler.response_serializer)  # noqa: E501
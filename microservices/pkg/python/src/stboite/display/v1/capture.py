@@ -0,0 +1,164 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Capture of the requests received by the display servers, to replay them
+later
+"""
+
+import hashlib
+import struct
+import time
+
+import grpc
+
+from typing import Awaitable, Callable, Dict, Iterator, NamedTuple, Optional
+
+
+class CapturedCall(NamedTuple):
+    """Request read from a capture file"""
+
+    # Wall-clock time of the reception of the request
+    timestamp: float
+    # Full name of the gRPC method, as /<service>/<method>
+    method: str
+    # Serialized request
+    request: bytes
+
+
+class CaptureWriter:
+    """Writes the requests received by a server in a capture file.
+
+    The file starts with a header followed by length-prefixed records:
+    blobs, holding the serialized requests and the method names, and calls,
+    referring to the blobs by index. Each distinct blob is only written
+    once, so frames sent periodically take little room.
+    """
+
+    MAGIC = b"STBC"
+    VERSION = 1
+    # magic, version
+    HEADER = struct.Struct("<4sH")
+    # tag, size (followed by the blob)
+    BLOB = struct.Struct("<BI")
+    # tag, timestamp, method blob, request blob
+    CALL = struct.Struct("<BdII")
+
+    BLOB_TAG = 1
+    CALL_TAG = 2
+
+    def __init__(self, path: str):
+        """Creates (or replaces) a capture file."""
+        self.__file = open(path, "wb")
+        self.__file.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+        self.__blobs: Dict[bytes, int] = {}
+
+    def write(self, method: str, request: bytes, timestamp: Optional[float] = None) -> None:  # noqa: E501
+        """Appends a call to the capture file."""
+        timestamp = time.time() if timestamp is None else timestamp
+        self.__file.write(self.CALL.pack(
+            self.CALL_TAG, timestamp,
+            self.__blob(method.encode()), self.__blob(request)
+        ))
+
+    def flush(self) -> None:
+        """Writes the buffered records to the file."""
+        self.__file.flush()
+
+    def close(self) -> None:
+        """Writes the buffered records and closes the file."""
+        self.__file.close()
+
+    def __blob(self, data: bytes) -> int:
+        """Returns the index of a blob, written first if unknown."""
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        index = self.__blobs.get(digest)
+        if index is None:
+            index = self.__blobs[digest] = len(self.__blobs)
+            self.__file.write(self.BLOB.pack(self.BLOB_TAG, len(data)))
+            self.__file.write(data)
+        return index
+
+
+def read_capture(path: str) -> Iterator[CapturedCall]:
+    """Reads the calls of a capture file, in order.
+
+    Raises:
+      ValueError: the file is not a capture file or is corrupted; a
+        truncated last record (capture interrupted) is ignored.
+    """
+    with open(path, "rb") as capture:
+        header = capture.read(CaptureWriter.HEADER.size)
+        if len(header) != CaptureWriter.HEADER.size or CaptureWriter.HEADER.unpack(header) != (CaptureWriter.MAGIC, CaptureWriter.VERSION):  # noqa: E501
+            raise ValueError(f"{path} is not a capture file")
+
+        blobs = []
+        while True:
+            tag = capture.read(1)
+            if not tag:
+                return
+
+            if tag[0] == CaptureWriter.BLOB_TAG:
+                record = tag + capture.read(CaptureWriter.BLOB.size - 1)
+                if len(record) != CaptureWriter.BLOB.size:
+                    return
+                _, size = CaptureWriter.BLOB.unpack(record)
+                blob = capture.read(size)
+                if len(blob) != size:
+                    return
+                blobs.append(blob)
+            elif tag[0] == CaptureWriter.CALL_TAG:
+                record = tag + capture.read(CaptureWriter.CALL.size - 1)
+                if len(record) != CaptureWriter.CALL.size:
+                    return
+                _, timestamp, method, request = CaptureWriter.CALL.unpack(record)  # noqa: E501
+                if method >= len(blobs) or request >= len(blobs):
+                    raise ValueError(f"{path} refers to unknown blobs")
+                yield CapturedCall(timestamp, blobs[method].decode(), blobs[request])  # noqa: E501
+            else:
+                raise ValueError(f"{path} holds an unknown record")
+
+
+class CaptureInterceptor(grpc.aio.ServerInterceptor):
+    """Server interceptor writing the requests received in a capture file.
+
+    The requests are captured as received, before being deserialized, and
+    so are the frames of the streaming calls.
+    """
+
+    def __init__(self, writer: CaptureWriter):
+        self.writer = writer
+
+    async def intercept_service(
+        self,
+        continuation: Callable[[grpc.HandlerCallDetails], Awaitable[grpc.RpcMethodHandler]],  # noqa: E501
+        handler_call_details: grpc.HandlerCallDetails
+    ) -> grpc.RpcMethodHandler:
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return handler
+
+        method = handler_call_details.method
+        deserializer = handler.request_deserializer
+
+        def capture(request: bytes):
+            self.writer.write(method, request)
+            return deserializer(request) if deserializer else request
+
+        if handler.unary_unary:
+            return grpc.unary_unary_rpc_method_handler(handler.unary_unary, capture, handler.response_serializer)  # noqa: E501
+        if handler.unary_stream:
+            return grpc.unary_stream_rpc_method_handler(handler.unary_stream, capture, handler.response_serializer)  # noqa: E501
+        if handler.stream_unary:
+            return grpc.stream_unary_rpc_method_handler(handler.stream_unary, capture, handler.response_serializer)  # noqa: E501
+        return grpc.stream_stream_rpc_method_handler(handler.stream_stream, capture, handler.response_serializer)  # noqa: E501
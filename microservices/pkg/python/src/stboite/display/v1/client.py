@@ -0,0 +1,360 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Asynchronous client of the gRPC display API"""
+
+import asyncio
+import os
+import secrets
+import weakref
+import zlib
+
+import grpc
+import numpy as np
+from PIL import Image
+
+from stboite.display.v1.converter import PIXEL_FORMATS, Dither, FrameConverter, white_pixels  # noqa: E501
+from stboite.display.v1.encoding import crc, xor_delta
+from stboite.display.v1.ring import FrameRing
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+from stboite.grpc.v1.stboite_display_pb2 import ComposeFrameRequest, GetCapabilitiesRequest, GetCapabilitiesResponse, PlayAnimationRequest, RenderingRequest, RenderingResponse, StopAnimationRequest, UploadAssetRequest  # noqa: E501
+
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Tuple, TypeVar, Union  # noqa: E501
+
+T = TypeVar("T")
+
+# Pillow modes of the supported pixel types
+_PIXEL_TYPES = {mode: pixel_type for pixel_type, (mode, _) in PIXEL_FORMATS.items()}  # noqa: E501
+
+# Channels shared by all the clients of an event loop, indexed by address
+_CHANNELS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, grpc.aio.Channel]]" = weakref.WeakKeyDictionary()  # noqa: E501
+
+# Status codes worth retrying (RESOURCE_EXHAUSTED: the server handles too
+# many calls at once)
+_RETRYABLE = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED, grpc.StatusCode.RESOURCE_EXHAUSTED)  # noqa: E501
+
+
+def channel(addr: str) -> grpc.aio.Channel:
+    """Returns the channel to the given address, shared by all the clients
+    of the running event loop.
+    """
+    channels = _CHANNELS.setdefault(asyncio.get_running_loop(), {})
+    if addr not in channels:
+        channels[addr] = grpc.aio.insecure_channel(addr)
+    return channels[addr]
+
+
+def _encode(request: RenderingRequest, frame: bytes, base: Optional[bytes] = None) -> None:  # noqa: E501
+    """Sets the payload of a PACKED rendering request, compressed, as a delta
+    of `base` when it is smaller.
+    """
+    request.compression = RenderingRequest.ZLIB
+    request.data = zlib.compress(frame)
+    request.delta = False
+    request.delta_base = 0
+    if base is not None:
+        delta = zlib.compress(bytes(xor_delta(base, frame)))
+        if len(delta) < len(request.data):
+            request.data = delta
+            request.delta = True
+            request.delta_base = crc(base)
+
+
+async def close_channels() -> None:
+    """Closes the channels opened by the clients of the running event
+    loop.
+    """
+    channels = _CHANNELS.pop(asyncio.get_running_loop(), {})
+    await asyncio.gather(*(channel.close() for channel in channels.values()))  # noqa: E501
+
+
+class DisplayClient:
+    """Client of a display server, converting the frames into panel buffers
+    before sending them.
+
+    Frames are packed for the panel on the client side (PACKED pixel type),
+    sent as compressed deltas of the previous frame when it is smaller, and
+    not sent at all when identical to the previous one. Calls failing
+    because the server is unavailable or too slow are retried.
+
+    Clients of a server listening on a Unix socket (`unix:` address) can
+    write their frames in a frame ring shared with the server instead of
+    sending them in the requests.
+
+    NOTE: the deduplication and the deltas assume that the client is the
+          only one drawing on the display; deltas are sent again as full
+          frames when the server rejects them.
+    """
+
+    __ring: Optional[FrameRing] = None
+    __free_slots: "asyncio.Queue[int]"
+
+    def __init__(self,
+                 addr: str,
+                 panel_size: Optional[Tuple[int, int]] = None,
+                 timeout: float = 10.0,
+                 retries: int = 3,
+                 backoff: float = 0.2,
+                 dither: Dither = Dither.FLOYDSTEINBERG,
+                 frame_ring: int = 0):
+        """Creates a client of the display server listening on `addr`.
+
+        Args:
+          addr: the address of the display server.
+          panel_size: the (width, height) of the panel, in its native
+            orientation, queried from the server if not set.
+          timeout: the deadline of each attempt of a call, in seconds.
+          retries: the number of times a failing call is retried.
+          backoff: the delay before the first retry, in seconds, doubled
+            after each attempt.
+          dither: the method used to reduce the frames to black and white.
+          frame_ring: the number of slots of the frame ring used to pass the
+            frames to a server listening on a Unix socket, the number of
+            frames being sent concurrently (0 to send them in the requests).
+
+        Raises:
+          ValueError: a frame ring is requested for a remote server.
+        """
+        if frame_ring and not addr.startswith("unix:"):
+            raise ValueError("frame rings require a server listening on a Unix socket")  # noqa: E501
+
+        self.addr = addr
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.dither = dither
+        self.__converter = FrameConverter(*panel_size) if panel_size else None
+        self.__capabilities: Optional[GetCapabilitiesResponse] = None
+        self.__last_frame: Optional[bytes] = None
+        self.__ring_slots = frame_ring
+
+    @property
+    def stub(self) -> RenderingServiceStub:
+        """Stub of the display server, using the shared channel."""
+        return RenderingServiceStub(channel(self.addr))
+
+    async def display(self,
+                      image: Union[Image.Image, np.ndarray],
+                      wait_for_refresh: bool = False,
+                      priority: int = 0,
+                      deadline: Optional[float] = None) -> RenderingResponse:
+        """Displays an image, in the panel native orientation or rotated by
+        90 degrees.
+
+        Args:
+          image: a Pillow image, or a NumPy array of shape (height, width)
+            (boolean or 8-bit grayscale) or (height, width, 3 or 4) (RGB or
+            RGBA).
+          wait_for_refresh: whether to wait for the frame to be displayed.
+          priority: the priority of the frame over the frames waiting to be
+            displayed (higher first).
+          deadline: the delay, in seconds, after which the frame is
+            discarded by the server if it has not been displayed (None for
+            no deadline).
+
+        Raises:
+          ValueError: the image cannot be converted for the panel.
+          grpc.aio.AioRpcError: the call failed after all the retries.
+        """
+        await self.__negotiate()
+        width, height, frame = await asyncio.get_running_loop().run_in_executor(None, self.pack, image)  # noqa: E501
+        if frame == self.__last_frame:
+            return RenderingResponse(status=RenderingResponse.OK, deduplicated=True)  # noqa: E501
+
+        options = dict(
+            wait_for_refresh=wait_for_refresh,
+            priority=priority,
+            # NOTE: a deadline rounded to 0 would disable it
+            deadline_ms=max(int(deadline * 1000), 1) if deadline is not None else 0,  # noqa: E501
+        )
+        if self.__ring_slots:
+            response = await self.__display_shared(width, height, frame, options)  # noqa: E501
+            self.__last_frame = frame if response.status == RenderingResponse.OK else None  # noqa: E501
+            return response
+
+        request = RenderingRequest(type=RenderingRequest.PACKED, width=width, height=height, **options)  # noqa: E501
+        _encode(request, frame, self.__last_frame)
+
+        response = await self.__call(self.stub.DisplayRendering, request)
+        if response.status == RenderingResponse.DELTA_BASE_MISMATCH:
+            # NOTE: someone else drew on the display, send the whole frame
+            _encode(request, frame)
+            response = await self.__call(self.stub.DisplayRendering, request)
+
+        self.__last_frame = frame if response.status == RenderingResponse.OK else None  # noqa: E501
+        return response
+
+    async def upload_asset(self, asset_id: str, image: Image.Image) -> RenderingResponse:  # noqa: E501
+        """Uploads an image to be drawn by `compose_frame`."""
+        if image.mode not in _PIXEL_TYPES or image.mode == "1":
+            image = image.convert("RGBA" if "A" in image.getbands() else "L")
+        return await self.__call(self.stub.UploadAsset, UploadAssetRequest(
+            id=asset_id,
+            type=_PIXEL_TYPES[image.mode],
+            width=image.width,
+            height=image.height,
+            compression=RenderingRequest.ZLIB,
+            data=zlib.compress(image.tobytes()),
+        ))
+
+    async def compose_frame(self, request: ComposeFrameRequest) -> RenderingResponse:  # noqa: E501
+        """Displays a frame composed by the server."""
+        response = await self.__call(self.stub.ComposeFrame, request)
+        # NOTE: the displayed frame is no longer known by the client
+        self.__last_frame = None
+        return response
+
+    async def play_animation(self,
+                             images: Sequence[Union[Image.Image, np.ndarray]],
+                             durations: Union[float, Sequence[float]],
+                             loops: int = 0,
+                             priority: int = 0,
+                             wait_for_completion: bool = False) -> RenderingResponse:  # noqa: E501
+        """Plays a sequence of images on the display, sent at once as
+        compressed deltas of each other.
+
+        Args:
+          images: the frames of the animation (see `display`).
+          durations: the time each frame stays displayed, in seconds, or the
+            same time for all of them.
+          loops: the number of times the frames are played, 0 to play them
+            until the playback is interrupted.
+          priority: the priority of the frames over the frames waiting to
+            be displayed (higher first).
+          wait_for_completion: whether to wait for the end of the playback,
+            without deadline.
+
+        Raises:
+          ValueError: an image cannot be converted for the panel.
+          grpc.aio.AioRpcError: the call failed after all the retries.
+        """
+        await self.__negotiate()
+        packed = await asyncio.get_running_loop().run_in_executor(None, lambda: [self.pack(image) for image in images])  # noqa: E501
+        if isinstance(durations, (int, float)):
+            durations = [durations] * len(packed)
+
+        request = PlayAnimationRequest(loops=loops, priority=priority, wait_for_completion=wait_for_completion)  # noqa: E501
+        base = None
+        for (width, height, frame), duration in zip(packed, durations):
+            animation_frame = request.frames.add(duration_ms=int(duration * 1000))  # noqa: E501
+            animation_frame.frame.type = RenderingRequest.PACKED
+            animation_frame.frame.width = width
+            animation_frame.frame.height = height
+            _encode(animation_frame.frame, frame, base)
+            base = frame
+
+        response = await self.__call(self.stub.PlayAnimation, request, bounded=not wait_for_completion)  # noqa: E501
+        # NOTE: the displayed frame is no longer known by the client
+        self.__last_frame = None
+        return response
+
+    async def stop_animation(self) -> RenderingResponse:
+        """Interrupts the animation being played."""
+        return await self.__call(self.stub.StopAnimation, StopAnimationRequest())  # noqa: E501
+
+    async def capabilities(self) -> GetCapabilitiesResponse:
+        """Returns the capabilities of the display server, queried once."""
+        if self.__capabilities is None:
+            self.__capabilities = await self.__call(self.stub.GetCapabilities, GetCapabilitiesRequest())  # noqa: E501
+        return self.__capabilities
+
+    async def __negotiate(self) -> None:
+        """Configures the conversion of the frames for the panel of the
+        server, unless the panel size has been given.
+
+        Raises:
+          ValueError: the server does not accept panel buffers.
+        """
+        if self.__converter is not None:
+            return
+        capabilities = await self.capabilities()
+        if capabilities.preferred_type != RenderingRequest.PACKED or not capabilities.native_width:  # noqa: E501
+            raise ValueError("display server does not accept panel buffers")
+        self.__converter = FrameConverter(capabilities.native_width, capabilities.native_height)  # noqa: E501
+
+    def close(self) -> None:
+        """Removes the frame ring of the client, if any."""
+        if self.__ring is not None:
+            self.__ring.close()
+            self.__ring.unlink()
+            self.__ring = None
+
+    async def __display_shared(self, width: int, height: int, frame: bytes, options: Dict) -> RenderingResponse:  # noqa: E501
+        """Displays a panel buffer written in a slot of the frame ring."""
+        if self.__ring is None:
+            name = f"stboite-{os.getpid()}-{secrets.token_hex(4)}"
+            self.__ring = FrameRing.create(name, self.__ring_slots, len(frame))
+            self.__free_slots = asyncio.Queue()
+            for index in range(self.__ring_slots):
+                self.__free_slots.put_nowait(index)
+
+        # NOTE: a slot is reused once the server has answered the request
+        #       reading it
+        index = await self.__free_slots.get()
+        try:
+            self.__ring.write(index, frame)
+            return await self.__call(self.stub.DisplayRendering, RenderingRequest(  # noqa: E501
+                type=RenderingRequest.PACKED,
+                width=width,
+                height=height,
+                slot=RenderingRequest.SharedSlot(ring=self.__ring.name, index=index, size=len(frame)),  # noqa: E501
+                **options,
+            ))
+        finally:
+            self.__free_slots.put_nowait(index)
+
+    def pack(self, image: Union[Image.Image, np.ndarray]) -> Tuple[int, int, bytes]:  # noqa: E501
+        """Converts an image into a panel buffer.
+
+        Returns:
+          The width and the height of the image, and the panel buffer.
+
+        Raises:
+          ValueError: the image cannot be converted, or the panel size is
+            not known yet (see `capabilities`).
+        """
+        if isinstance(image, Image.Image):
+            if image.mode == "1":
+                white = np.asarray(image)
+            else:
+                if image.mode not in _PIXEL_TYPES:
+                    image = image.convert("RGB")
+                white = white_pixels(_PIXEL_TYPES[image.mode], image.width, image.height, image.tobytes(), self.dither)  # noqa: E501
+        else:
+            array = np.ascontiguousarray(image)
+            if array.dtype == bool:
+                white = array
+            elif array.ndim == 2:
+                white = white_pixels(RenderingRequest.L, array.shape[1], array.shape[0], array.astype(np.uint8).tobytes(), self.dither)  # noqa: E501
+            elif array.ndim == 3 and array.shape[2] in (3, 4):
+                pixel_type = RenderingRequest.RGB if array.shape[2] == 3 else RenderingRequest.RGBA  # noqa: E501
+                white = white_pixels(pixel_type, array.shape[1], array.shape[0], array.astype(np.uint8).tobytes(), self.dither)  # noqa: E501
+            else:
+                raise ValueError(f"unsupported array shape {array.shape}")
+
+        if self.__converter is None:
+            raise ValueError("panel size is unknown, query the server capabilities first")  # noqa: E501
+        height, width = white.shape
+        return width, height, self.__converter.pack(white)
+
+    async def __call(self, method: Callable[..., Awaitable[T]], request, bounded: bool = True) -> T:  # noqa: E501
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                return await method(request, timeout=self.timeout if bounded else None)  # noqa: E501
+            except grpc.aio.AioRpcError as e:
+                if e.code() not in _RETRYABLE or attempt == self.retries:
+                    raise
+            await asyncio.sleep(delay)
+            delay *= 2
@@ -0,0 +1,258 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Conversion of rendering requests into 1-bit panel buffers"""
+
+import enum
+import queue
+
+import numpy as np
+
+from stboite.display.v1.dither import ATKINSON, error_diffusion, ordered
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest
+
+from typing import Dict, Tuple
+
+
+class Dither(enum.Enum):
+    """Method used to reduce the image to black and white pixels"""
+
+    # Hard threshold at the middle gray level
+    NONE = 0
+    # Floyd-Steinberg error diffusion, as done by `Image.convert('1')`
+    FLOYDSTEINBERG = 1
+    # Ordered dithering with the 8x8 Bayer matrix
+    BAYER = 2
+    # Atkinson error diffusion
+    ATKINSON = 3
+
+
+# DITHERINGS gives the method of each `RenderingRequest.Dithering`.
+DITHERINGS: Dict[int, Dither] = {
+    RenderingRequest.FLOYD_STEINBERG: Dither.FLOYDSTEINBERG,
+    RenderingRequest.THRESHOLD: Dither.NONE,
+    RenderingRequest.BAYER: Dither.BAYER,
+    # NOTE: Atkinson requests are served with the Floyd-Steinberg error
+    #       diffusion of Pillow, the NumPy Atkinson taking several times the
+    #       frame budget on a Pi; clients can still dither their frames with
+    #       Atkinson before sending them
+    RenderingRequest.ATKINSON: Dither.FLOYDSTEINBERG,
+}
+
+
+# PIXEL_FORMATS gives, for each supported pixel type, the Pillow mode of the
+# image and the number of bytes used by a pixel in the request payload.
+# NOTE: LAB images are not supported, Pillow cannot reduce them to black
+#       and white.
+PIXEL_FORMATS: Dict[int, Tuple[str, int]] = {
+    RenderingRequest.ONE: ("1", 1),
+    RenderingRequest.L: ("L", 1),
+    RenderingRequest.RGB: ("RGB", 3),
+    RenderingRequest.RGBA: ("RGBA", 4),
+    RenderingRequest.CMYK: ("CMYK", 4),
+    RenderingRequest.YCBCR: ("YCbCr", 3),
+    RenderingRequest.HSV: ("HSV", 3),
+}
+
+# Lookup tables giving the white pixels of one byte per pixel images
+_ONE_LUT = np.arange(256) != 0
+_L_LUT = np.arange(256) >= 128
+
+# Lookup tables giving the weight of each RGB channel in the luminance,
+# scaled by 1000 (ITU-R 601-2, the same threshold as Pillow)
+_RGB_LUTS = (
+    np.arange(256, dtype=np.uint32) * 299,
+    np.arange(256, dtype=np.uint32) * 587,
+    np.arange(256, dtype=np.uint32) * 114,
+)
+_RGB_THRESHOLD = 128000
+
+
+class FrameConverter:
+    """Converts the payload of rendering requests into packed 1-bit panel
+    buffers, using NumPy instead of iterating over the pixels.
+
+    Panel buffers use one bit per pixel (0 is black, most significant bit
+    first), `linewidth` bytes per row and `panel_height` rows. Like the
+    `getbuffer` method of the Waveshare drivers, images can either be given
+    in the panel native orientation or rotated by 90 degrees (landscape).
+    """
+
+    def __init__(self, panel_width: int, panel_height: int):
+        self.panel_width = panel_width
+        self.panel_height = panel_height
+        self.linewidth = (panel_width + 7) // 8
+        # NOTE: unpacked panel buffers reused by the conversions, one per
+        #       conversion running at the same time
+        self.__scratch: "queue.SimpleQueue[np.ndarray]" = queue.SimpleQueue()
+
+    @property
+    def buffer_size(self) -> int:
+        """Size of a panel buffer, in bytes."""
+        return self.linewidth * self.panel_height
+
+    def supports(self, pixel_type: int) -> bool:
+        """Returns whether the given pixel type can be converted."""
+        return pixel_type == RenderingRequest.PACKED or pixel_type in PIXEL_FORMATS  # noqa: E501
+
+    def payload_size(self, pixel_type: int, width: int, height: int) -> int:
+        """Returns the expected size of a request payload.
+
+        Raises:
+          ValueError: the pixel type is not supported.
+        """
+        if pixel_type == RenderingRequest.PACKED:
+            return self.buffer_size
+        if pixel_type not in PIXEL_FORMATS:
+            raise ValueError(f"unsupported pixel type {pixel_type}")
+        return width * height * PIXEL_FORMATS[pixel_type][1]
+
+    def convert(self,
+                pixel_type: int,
+                width: int,
+                height: int,
+                data: bytes,
+                dither: Dither = Dither.FLOYDSTEINBERG) -> bytes:
+        """Converts a request payload into a panel buffer.
+
+        Args:
+          pixel_type: the `RenderingRequest.PixelType` of the payload.
+          width: the image width, in pixels.
+          height: the image height, in pixels.
+          data: the raw pixels of the image, or the panel buffer itself for
+            the PACKED pixel type.
+          dither: the method used to reduce the image to black and white.
+
+        Raises:
+          ValueError: the pixel type, the size or the payload is invalid.
+        """
+        if len(data) != self.payload_size(pixel_type, width, height):
+            raise ValueError("payload size does not match the image size")
+
+        if pixel_type == RenderingRequest.PACKED:
+            if (width, height) not in ((self.panel_width, self.panel_height), (self.panel_height, self.panel_width)):  # noqa: E501
+                raise ValueError(f"image size must be {self.panel_height}x{self.panel_width}px or {self.panel_width}x{self.panel_height}px")  # noqa: E501
+            # NOTE: already in the panel layout (copied only if the payload
+            #       is not immutable)
+            return bytes(data)
+
+        return self.pack(self.white_pixels(pixel_type, width, height, data, dither))  # noqa: E501
+
+    def white_pixels(self,
+                     pixel_type: int,
+                     width: int,
+                     height: int,
+                     data: bytes,
+                     dither: Dither = Dither.FLOYDSTEINBERG) -> np.ndarray:
+        """Reduces a request payload to a (height, width) boolean array, set
+        for the white pixels.
+        """
+        return white_pixels(pixel_type, width, height, data, dither)
+
+    def pack(self, white: np.ndarray) -> bytes:
+        """Packs a (height, width) boolean array, set for the white pixels,
+        into a panel buffer.
+
+        Raises:
+          ValueError: the image size does not fit the panel.
+        """
+        height, width = white.shape
+        if (width, height) not in ((self.panel_height, self.panel_width), (self.panel_width, self.panel_height)):  # noqa: E501
+            raise ValueError(f"image size must be {self.panel_height}x{self.panel_width}px or {self.panel_width}x{self.panel_height}px")  # noqa: E501
+
+        try:
+            bits = self.__scratch.get_nowait()
+            bits.fill(True)
+        except queue.Empty:
+            bits = np.ones((self.panel_height, self.linewidth * 8), dtype=bool)  # noqa: E501
+
+        try:
+            if (width, height) == (self.panel_height, self.panel_width):
+                # NOTE: landscape image, each column becomes a panel row
+                bits[:, :height] = white.T
+            else:
+                # NOTE: same shift as the Waveshare `getbuffer` method, which
+                #       stores the pixel x at the bit `width - x`
+                bits[:, 1:width + 1] = white[:, ::-1]
+            return np.packbits(bits, axis=1).tobytes()
+        finally:
+            self.__scratch.put(bits)
+
+    def unpack(self, data: bytes, width: int, height: int) -> np.ndarray:
+        """Unpacks a panel buffer into a (height, width) boolean array, set
+        for the white pixels; this is the reverse of `pack`.
+
+        Raises:
+          ValueError: the image size or the buffer size does not fit the
+            panel.
+        """
+        if (width, height) not in ((self.panel_height, self.panel_width), (self.panel_width, self.panel_height)):  # noqa: E501
+            raise ValueError(f"image size must be {self.panel_height}x{self.panel_width}px or {self.panel_width}x{self.panel_height}px")  # noqa: E501
+        if len(data) != self.buffer_size:
+            raise ValueError(f"panel buffer size must be {self.buffer_size} bytes")  # noqa: E501
+
+        rows = np.frombuffer(data, dtype=np.uint8).reshape(self.panel_height, self.linewidth)  # noqa: E501
+        bits = np.unpackbits(rows, axis=1).view(bool)
+        if (width, height) == (self.panel_height, self.panel_width):
+            return bits[:, :height].T.copy()
+        return bits[:, width:0:-1].copy()
+
+
+def white_pixels(pixel_type: int,
+                 width: int,
+                 height: int,
+                 data: bytes,
+                 dither: Dither = Dither.FLOYDSTEINBERG) -> np.ndarray:
+    """Reduces the raw pixels of an image to a (height, width) boolean array,
+    set for the white pixels.
+
+    Args:
+      pixel_type: the `RenderingRequest.PixelType` of the pixels, one of
+        `PIXEL_FORMATS`.
+      width: the image width, in pixels.
+      height: the image height, in pixels.
+      data: the raw pixels of the image.
+      dither: the method used to reduce the image to black and white.
+    """
+    mode, depth = PIXEL_FORMATS[pixel_type]
+    pixels = np.frombuffer(data, dtype=np.uint8).reshape(height, width, depth)  # noqa: E501
+
+    if pixel_type == RenderingRequest.ONE:
+        return _ONE_LUT[pixels[:, :, 0]]
+
+    # NOTE: Pillow is only loaded by the first image needing it, shortening
+    #       the startup of the servers
+    from PIL import Image
+
+    if dither is Dither.FLOYDSTEINBERG:
+        image = Image.frombuffer(mode, (width, height), data, "raw", mode, 0, 1)  # noqa: E501
+        return np.asarray(image.convert("1"))
+
+    if pixel_type == RenderingRequest.L:
+        if dither is Dither.NONE:
+            return _L_LUT[pixels[:, :, 0]]
+        gray = pixels[:, :, 0].astype(np.float32)
+    else:
+        if pixel_type not in (RenderingRequest.RGB, RenderingRequest.RGBA):
+            image = Image.frombuffer(mode, (width, height), data, "raw", mode, 0, 1)  # noqa: E501
+            pixels = np.asarray(image.convert("RGB"))
+
+        luminance = _RGB_LUTS[0][pixels[:, :, 0]] + _RGB_LUTS[1][pixels[:, :, 1]] + _RGB_LUTS[2][pixels[:, :, 2]]  # noqa: E501
+        if dither is Dither.NONE:
+            return luminance >= _RGB_THRESHOLD
+        gray = luminance.astype(np.float32) / 1000
+
+    if dither is Dither.BAYER:
+        return ordered(gray)
+    return error_diffusion(gray, ATKINSON)
@@ -0,0 +1,125 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Dithering of grayscale images into black and white pixels, using NumPy
+instead of iterating over the pixels
+"""
+
+import functools
+
+import numpy as np
+
+from typing import Dict, List, Sequence, Tuple
+
+# Error diffusion kernels, as (row offset, column offset, weight)
+Kernel = Sequence[Tuple[int, int, float]]
+
+# NOTE: only 3/4 of the error is diffused, keeping more contrast
+ATKINSON: Kernel = ((0, 1, 1 / 8), (0, 2, 1 / 8), (1, -1, 1 / 8), (1, 0, 1 / 8), (1, 1, 1 / 8), (2, 0, 1 / 8))  # noqa: E501
+
+
+def _bayer(order: int) -> np.ndarray:
+    """Returns the Bayer matrix of size 2^order, holding each value from 0
+    to 4^order - 1 once.
+    """
+    matrix = np.zeros((1, 1), dtype=np.int32)
+    for _ in range(order):
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])  # noqa: E501
+    return matrix
+
+
+# Thresholds of the 8x8 Bayer matrix, from 0 to 255
+_BAYER_TILE = ((_bayer(3) + 0.5) * 256 / 64).astype(np.float32)
+
+
+@functools.lru_cache(maxsize=4)
+def _bayer_thresholds(height: int, width: int) -> np.ndarray:
+    """Returns the Bayer tile repeated over an image."""
+    tiles = np.tile(_BAYER_TILE, ((height + 7) // 8, (width + 7) // 8))
+    return tiles[:height, :width]
+
+
+def ordered(gray: np.ndarray) -> np.ndarray:
+    """Dithers a (height, width) grayscale array (0 to 255) with the 8x8
+    Bayer matrix.
+
+    Returns:
+      A (height, width) boolean array, set for the white pixels.
+    """
+    return gray >= _bayer_thresholds(*gray.shape)
+
+
+@functools.lru_cache(maxsize=4)
+def _skew(height: int, width: int) -> Tuple[np.ndarray, np.ndarray, List[Tuple[int, int]]]:  # noqa: E501
+    """Returns the position of each pixel (y, x) of an image in the skewed
+    image indexed by (x + 2y, y), and the first and last rows of each row of
+    the skewed image.
+    """
+    ys, xs = np.indices((height, width))
+    fronts = [
+        (max(0, (t - width + 2) // 2), min(height - 1, t // 2) + 1)
+        for t in range(width + 2 * (height - 1))
+    ]
+    return xs + 2 * ys, ys, fronts
+
+
+def error_diffusion(gray: np.ndarray, kernel: Kernel) -> np.ndarray:
+    """Dithers a (height, width) grayscale array (0 to 255) by diffusing the
+    error of each pixel to its neighbours.
+
+    Pixels are processed by wavefronts instead of one by one: a pixel only
+    diffuses its error to the pixels after it (on its right or on the rows
+    below), so all the pixels (y, x) with the same x + 2y can be processed
+    at once. The image is skewed so that each wavefront is a row.
+
+    NOTE: this is still a loop over the wavefronts (about 500 for a 250x122
+          image), a few times slower than the C implementation of Pillow.
+
+    Args:
+      gray: the grayscale image.
+      kernel: the error diffusion kernel, reaching only pixels (y + dy,
+        x + dx) with dx + 2dy > 0.
+
+    Returns:
+      A (height, width) boolean array, set for the white pixels.
+    """
+    height, width = gray.shape
+    fronts_index, rows_index, fronts = _skew(height, width)
+    reach = max(dx + 2 * dy for dy, dx, _ in kernel)
+    depth = max(dy for dy, _, _ in kernel)
+
+    # NOTE: errors diffused out of the image land on skewed pixels that are
+    #       never processed
+    values = np.zeros((len(fronts) + reach, height + depth), dtype=np.float32)  # noqa: E501
+    values[fronts_index, rows_index] = gray
+    white = np.zeros(values.shape, dtype=bool)
+    # NOTE: the targets on the same row of the image are consecutive rows of
+    #       the skewed image, updated at once
+    rows: Dict[int, Dict[int, float]] = {}
+    for dy, dx, weight in kernel:
+        rows.setdefault(dy, {})[dx + 2 * dy] = weight
+    targets = [
+        (dy, min(shifts), max(shifts) + 1, np.array([[shifts.get(shift, 0)] for shift in range(min(shifts), max(shifts) + 1)], dtype=np.float32))  # noqa: E501
+        for dy, shifts in rows.items()
+    ]
+
+    for t, (first, last) in enumerate(fronts):
+        pixels = values[t, first:last]
+        on = white[t, first:last]
+        np.greater_equal(pixels, 128, out=on)
+        error = pixels - on * np.float32(255)
+        for dy, low, high, weights in targets:
+            values[t + low:t + high, first + dy:last + dy] += weights * error
+
+    return white[fronts_index, rows_index]
@@ -0,0 +1,169 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Compression and delta encoding of rendering request payloads"""
+
+import zlib
+
+import numpy as np
+
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest
+
+from typing import Union
+
+# Runs of each byte value, used to expand the PackBits repeat packets
+_RUNS = [bytes([value]) * 128 for value in range(256)]
+
+
+def rle_encode(data: bytes) -> bytes:
+    """Compresses the given bytes with the PackBits run-length encoding.
+
+    Each packet starts with a header byte `n`: when `n < 128`, the next
+    `n + 1` bytes are copied as is; when `n > 128`, the next byte is repeated
+    `257 - n` times.
+    """
+    out = bytearray()
+    i, size = 0, len(data)
+    while i < size:
+        j = i + 1
+        while j < size and j - i < 128 and data[j] == data[i]:
+            j += 1
+        if j - i >= 3:
+            out.append(257 - (j - i))
+            out.append(data[i])
+            i = j
+            continue
+
+        # NOTE: copy bytes literally until the next run of at least 3 bytes
+        j = i
+        while j < size and j - i < 128 and not (j + 2 < size and data[j] == data[j + 1] == data[j + 2]):  # noqa: E501
+            j += 1
+        out.append(j - i - 1)
+        out += data[i:j]
+        i = j
+    return bytes(out)
+
+
+def rle_decode(data: bytes, size: int) -> bytearray:
+    """Expands PackBits encoded bytes, which must give exactly `size` bytes.
+
+    Raises:
+      ValueError: the encoded data is truncated or does not expand to
+        `size` bytes.
+    """
+    out = bytearray(size)
+    view = memoryview(data)
+    i = o = 0
+    while i < len(data):
+        header = data[i]
+        i += 1
+        if header < 128:
+            count = header + 1
+            if i + count > len(data) or o + count > size:
+                raise ValueError("invalid RLE payload")
+            out[o:o + count] = view[i:i + count]
+            i += count
+        elif header > 128:
+            count = 257 - header
+            if i >= len(data) or o + count > size:
+                raise ValueError("invalid RLE payload")
+            out[o:o + count] = _RUNS[data[i]][:count]
+            i += 1
+        else:
+            # NOTE: 128 is a no-op header
+            continue
+        o += count
+
+    if o != size:
+        raise ValueError("invalid RLE payload")
+    return out
+
+
+def check_payload_size(compression: int, length: int, size: int) -> None:
+    """Checks, before decompressing it, that a payload of `length` bytes can
+    expand to exactly `size` bytes.
+
+    Raises:
+      ValueError: the payload cannot expand to `size` bytes.
+    """
+    if compression == RenderingRequest.RAW:
+        limit = size
+    elif compression == RenderingRequest.RLE:
+        # NOTE: literal packets add one header byte per 128 bytes
+        limit = size + (size + 127) // 128
+    elif compression == RenderingRequest.ZLIB:
+        # NOTE: upper bound of zlib `compressBound`
+        limit = size + (size >> 12) + (size >> 14) + (size >> 25) + 13
+    else:
+        raise ValueError(f"unsupported compression {compression}")
+
+    if length > limit or (compression == RenderingRequest.RAW and length != size):  # noqa: E501
+        raise ValueError("payload size does not match the image size")
+
+
+def decompress(compression: int,
+               data: bytes,
+               size: int) -> Union[bytes, bytearray]:
+    """Decompresses a request payload, which must expand to exactly `size`
+    bytes. Uncompressed payloads are returned as is.
+
+    Args:
+      compression: the `RenderingRequest.Compression` of the payload.
+      data: the payload.
+      size: the expected size of the decompressed payload.
+
+    Raises:
+      ValueError: the compression is not supported or the payload is
+        invalid.
+    """
+    if compression == RenderingRequest.RAW:
+        return data
+
+    if compression == RenderingRequest.RLE:
+        return rle_decode(data, size)
+
+    if compression == RenderingRequest.ZLIB:
+        decompressor = zlib.decompressobj()
+        try:
+            # NOTE: never expand more than expected, whatever the payload
+            out = decompressor.decompress(data, size)
+        except zlib.error as e:
+            raise ValueError(f"invalid ZLIB payload: {e}") from e
+        if len(out) != size or decompressor.unconsumed_tail or decompressor.unused_data or not decompressor.eof:  # noqa: E501
+            raise ValueError("invalid ZLIB payload")
+        return out
+
+    raise ValueError(f"unsupported compression {compression}")
+
+
+def crc(frame: bytes) -> int:
+    """Returns the checksum identifying a frame as base of delta payloads."""
+    return zlib.crc32(frame)
+
+
+def xor_delta(base: bytes, delta: Union[bytes, bytearray]) -> bytearray:
+    """Applies (or computes) a delta between two frames of the same size.
+
+    The delta is updated in place when it is a bytearray.
+
+    Raises:
+      ValueError: both frames have a different size.
+    """
+    if len(base) != len(delta):
+        raise ValueError("delta size does not match the frame size")
+
+    out = delta if isinstance(delta, bytearray) else bytearray(delta)
+    view = np.frombuffer(out, dtype=np.uint8)
+    np.bitwise_xor(view, np.frombuffer(base, dtype=np.uint8), out=view)
+    return out
@@ -0,0 +1,267 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Metrics of the display servers, exposed in the Prometheus text format"""
+
+import asyncio
+import bisect
+import time
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Default buckets of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # noqa: E501
+
+
+class Metric:
+    """Family of samples sharing the same name, one per set of label values.
+
+    Updating a sample only changes a number in memory: the text exposition
+    is only built when the metrics are scraped.
+    """
+
+    TYPE = "untyped"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "Metric.Child"] = {}
+
+    class Child:
+        def __init__(self, metric: "Metric"):
+            self.value = 0.0
+            self.function: Optional[Callable[[], float]] = None
+
+        def get(self) -> float:
+            return self.function() if self.function else self.value
+
+    def labels(self, *values: str) -> "Metric.Child":
+        """Returns the sample of the given label values."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")  # noqa: E501
+            child = self._children[values] = self.Child(self)
+        return child
+
+    def collect(self) -> List[str]:
+        """Returns the lines of the text exposition of this metric."""
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.TYPE}"]
+        for values, child in self._children.items():
+            lines += self._samples(values, child)
+        return lines
+
+    def _samples(self, values: Tuple[str, ...], child: "Metric.Child") -> List[str]:  # noqa: E501
+        return [f"{self.name}{self._labels(values)} {child.get()!r}"]
+
+    def _labels(self, values: Tuple[str, ...], **extra: str) -> str:
+        pairs = list(zip(self.labelnames, values)) + list(extra.items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"  # noqa: E501
+
+
+class Counter(Metric):
+    """Monotonically increasing value"""
+
+    TYPE = "counter"
+
+    class Child(Metric.Child):
+        def inc(self, amount: float = 1) -> None:
+            self.value += amount
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+
+    TYPE = "gauge"
+
+    class Child(Metric.Child):
+        def set(self, value: float) -> None:
+            self.value = value
+
+        def inc(self, amount: float = 1) -> None:
+            self.value += amount
+
+        def dec(self, amount: float = 1) -> None:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+
+
+class Histogram(Metric):
+    """Distribution of observed values, counted in cumulative buckets"""
+
+    TYPE = "histogram"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    class Child(Metric.Child):
+        def __init__(self, metric: "Histogram"):
+            super().__init__(metric)
+            self.buckets = metric.buckets
+            # NOTE: the last count is the +Inf bucket
+            self.counts = [0] * (len(metric.buckets) + 1)
+            self.count = 0
+
+        def observe(self, value: float) -> None:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.value += value
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self, values: Tuple[str, ...], child: "Histogram.Child") -> List[str]:  # noqa: E501
+        labels = self._labels(values)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{self.name}_bucket{self._labels(values, le=le)} {cumulative}")  # noqa: E501
+        lines.append(f"{self.name}_sum{labels} {child.value!r}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    """Set of metrics exposed together"""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Returns the Prometheus text exposition of all metrics."""
+        lines = []
+        for metric in self.metrics:
+            lines += metric.collect()
+        return "\n".join(lines) + "\n"
+
+
+class DisplayMetrics(Registry):
+    """Metrics shared by all display servers"""
+
+    def __init__(self):
+        super().__init__()
+        self.frames_received = self.register(Counter(
+            "stboite_display_frames_received_total",
+            "Frames received by the display."))
+        self.frames_deduplicated = self.register(Counter(
+            "stboite_display_frames_deduplicated_total",
+            "Frames identical to the displayed one, answered without refresh."))  # noqa: E501
+        self.frames_dropped = self.register(Counter(
+            "stboite_display_frames_dropped_total",
+            "Frames replaced by a newer one before being displayed."))
+        self.frames_expired = self.register(Counter(
+            "stboite_display_frames_expired_total",
+            "Frames discarded because their deadline passed before being displayed."))  # noqa: E501
+        self.frames_rejected = self.register(Counter(
+            "stboite_display_frames_rejected_total",
+            "Frames rejected because of an invalid request.",
+            ["status"]))
+        self.refreshes = self.register(Counter(
+            "stboite_display_refreshes_total",
+            "Physical refreshes of the screen.",
+            ["mode"]))
+        self.stage_duration = self.register(Histogram(
+            "stboite_display_stage_duration_seconds",
+            "Time spent by frames in each stage of the rendering pipeline.",
+            ["stage"]))
+        self.queue_depth = self.register(Gauge(
+            "stboite_display_queue_depth",
+            "Frames received but not yet displayed, deduplicated or dropped."))  # noqa: E501
+        self.deep_sleep = self.register(Counter(
+            "stboite_display_deep_sleep_seconds_total",
+            "Time spent by the screen in deep sleep mode."))
+
+        self.__sleep_since: Optional[float] = None
+        self.deep_sleep.labels().function = self.__deep_sleep_seconds
+
+    def enter_deep_sleep(self) -> None:
+        """Starts counting the time spent in deep sleep mode."""
+        if self.__sleep_since is None:
+            self.__sleep_since = time.monotonic()
+
+    def leave_deep_sleep(self) -> None:
+        """Stops counting the time spent in deep sleep mode."""
+        if self.__sleep_since is not None:
+            self.deep_sleep.inc(time.monotonic() - self.__sleep_since)
+            self.__sleep_since = None
+
+    def __deep_sleep_seconds(self) -> float:
+        child = self.deep_sleep.labels()
+        if self.__sleep_since is None:
+            return child.value
+        return child.value + time.monotonic() - self.__sleep_since
+
+
+async def serve_metrics(registry: Registry,
+                        listen_addr: str) -> asyncio.AbstractServer:
+    """Starts an HTTP server exposing the given metrics on /metrics.
+
+    Args:
+      registry: the metrics to expose.
+      listen_addr: the address to listen on, as `host:port`.
+    """
+    async def handle(reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        try:
+            request = (await reader.readline()).split()
+            while (await reader.readline()).strip():
+                # NOTE: headers are ignored
+                pass
+
+            if len(request) >= 2 and request[0] == b"GET" and request[1].split(b"?")[0] == b"/metrics":  # noqa: E501
+                status, body = b"200 OK", registry.render().encode()
+            else:
+                status, body = b"404 Not Found", b"not found\n"
+
+            writer.write(b"HTTP/1.0 " + status + b"\r\n"
+                         b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"  # noqa: E501
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n"  # noqa: E501
+                         + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    host, _, port = listen_addr.rpartition(":")
+    return await asyncio.start_server(handle, host.strip("[]") or None, int(port))  # noqa: E501
@@ -0,0 +1,338 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Display forwarding the frames it receives to several displays"""
+
+import asyncio
+import zlib
+
+import grpc
+import numpy as np
+
+from stboite.display.v1 import GRPCDisplay
+from stboite.display.v1.converter import DITHERINGS, PIXEL_FORMATS, FrameConverter  # noqa: E501
+from stboite.display.v1.encoding import crc, decompress, xor_delta
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+from stboite.grpc.v1.stboite_display_pb2 import GetCapabilitiesRequest, GetCapabilitiesResponse, RenderingRequest, RenderingResponse  # noqa: E501
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Full name of the DisplayRendering method, called with serialized requests
+_DISPLAY_RENDERING = "/stboite.v1.display.RenderingService/DisplayRendering"
+
+# Layout of a panel buffer: native width, native height, orientation and
+# bit depth
+Panel = Tuple[int, int, int, int]
+
+
+def panel(capabilities: GetCapabilitiesResponse) -> Optional[Panel]:
+    """Returns the layout of the panel buffers accepted by a display, or
+    None if it does not accept them.
+    """
+    # NOTE: only 1-bit panels are supported by the frame converter
+    if capabilities.preferred_type != RenderingRequest.PACKED or not capabilities.native_width or capabilities.bit_depth != 1:  # noqa: E501
+        return None
+    return (capabilities.native_width, capabilities.native_height, capabilities.orientation, capabilities.bit_depth)  # noqa: E501
+
+
+class DisplayMultiplexer(GRPCDisplay):
+    """Display forwarding each frame it receives to several displays at
+    once, e.g. to show the same status screen on a rack of devices.
+
+    The frames are converted into panel buffers once per kind of panel (as
+    described by the capabilities of the displays), encoded and serialized
+    once per kind of panel, and sent to all the displays concurrently over
+    persistent channels. Each display answers independently, a slow or
+    unreachable display only delaying its own response; the response holds
+    the response of each display.
+
+    NOTE: the frames of the displays that do not accept panel buffers are
+          forwarded as received, except for the panel buffers which are
+          sent to them as 1-bit images (deltas being resolved first).
+    """
+
+    # Deadline of the calls to the displays, in seconds
+    TIMEOUT: float = 10.0
+
+    __last_frame: Optional[bytes] = None
+
+    def __init__(self,
+                 listen_addr: str,
+                 displays: Sequence[str],
+                 metrics_addr: Optional[str] = None,
+                 local_socket: Optional[str] = None,
+                 capture_file: Optional[str] = None):
+        """Creates a multiplexer listening on `listen_addr`.
+
+        Args:
+          listen_addr: the address to listen on.
+          displays: the addresses of the displays the frames are sent to.
+          metrics_addr: the address to expose the metrics on, if any.
+          local_socket: the Unix socket to listen on for co-located
+            clients, if any.
+          capture_file: the file to record the received requests to, if
+            any.
+
+        Raises:
+          ValueError: no display is given.
+        """
+        if not displays:
+            raise ValueError("at least one display is required")
+        super().__init__(listen_addr, metrics_addr, local_socket, capture_file)  # noqa: E501
+
+        self.displays = list(dict.fromkeys(displays))
+        self.__channels = {addr: grpc.aio.insecure_channel(addr) for addr in self.displays}  # noqa: E501
+        # NOTE: the requests are serialized once for all the displays of a
+        #       kind of panel
+        self.__forward = {
+            addr: channel.unary_unary(_DISPLAY_RENDERING, response_deserializer=RenderingResponse.FromString)  # noqa: E501
+            for addr, channel in self.__channels.items()
+        }
+        self.__capabilities: Dict[str, GetCapabilitiesResponse] = {}
+        self.__converters: Dict[Panel, FrameConverter] = {}
+
+    async def stop(self, grace: Optional[float] = None) -> None:
+        await super().stop(grace)
+        await asyncio.gather(*(channel.close() for channel in self.__channels.values()))  # noqa: E501
+
+    async def discover(self) -> Dict[str, str]:
+        """Queries the capabilities of the displays not queried yet.
+
+        Returns:
+          The error of each display that could not be queried.
+        """
+        unknown = [addr for addr in self.displays if addr not in self.__capabilities]  # noqa: E501
+        results = await asyncio.gather(
+            *(RenderingServiceStub(self.__channels[addr]).GetCapabilities(GetCapabilitiesRequest(), timeout=self.TIMEOUT) for addr in unknown),  # noqa: E501
+            return_exceptions=True,
+        )
+
+        errors = {}
+        for addr, result in zip(unknown, results):
+            if isinstance(result, grpc.aio.AioRpcError):
+                errors[addr] = f"display unreachable ({result.code().name}): {result.details()}"  # noqa: E501
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                self.__capabilities[addr] = result
+        return errors
+
+    def capabilities(self) -> GetCapabilitiesResponse:
+        capabilities = super().capabilities()
+        capabilities.pixel_types.extend(sorted(PIXEL_FORMATS))
+        capabilities.ditherings.extend(DITHERINGS)
+
+        # NOTE: panel buffers are only accepted when all the displays share
+        #       the same panel; otherwise, 1-bit frames are the cheapest to
+        #       convert for any of them
+        known = [self.__capabilities[addr] for addr in self.displays if addr in self.__capabilities]  # noqa: E501
+        panels = {panel(display) for display in known}
+        if len(known) == len(self.displays) and len(panels) == 1 and None not in panels:  # noqa: E501
+            display = known[0]
+            capabilities.width, capabilities.height = display.width, display.height  # noqa: E501
+            capabilities.native_width, capabilities.native_height = display.native_width, display.native_height  # noqa: E501
+            capabilities.linewidth = display.linewidth
+            capabilities.orientation = display.orientation
+            capabilities.bit_depth = display.bit_depth
+            capabilities.preferred_type = RenderingRequest.PACKED
+            capabilities.pixel_types.append(RenderingRequest.PACKED)
+            capabilities.partial_regions = all(display.partial_regions for display in known)  # noqa: E501
+            capabilities.delta_frames = True
+        return capabilities
+
+    async def GetCapabilities(
+        self,
+        request: GetCapabilitiesRequest,
+        context: grpc.aio.ServicerContext
+    ) -> GetCapabilitiesResponse:
+        await self.discover()
+        return self.capabilities()
+
+    async def DisplayRendering(
+        self,
+        request: RenderingRequest,
+        context: grpc.aio.ServicerContext
+    ) -> RenderingResponse:
+        loop = asyncio.get_running_loop()
+        received_at = loop.time()
+        self.metrics.frames_received.inc()
+
+        if request.type != RenderingRequest.PACKED and request.type not in PIXEL_FORMATS:  # noqa: E501
+            return self.__reject(
+                RenderingResponse.PIXEL_TYPE_NOT_ALLOWED,
+                f"pixel type {RenderingRequest.PixelType.Name(request.type)} is not supported"  # noqa: E501
+            )
+
+        try:
+            data = bytes(self.payload(request, context))
+        except ValueError as e:
+            return self.__reject(RenderingResponse.INVALID_PAYLOAD, str(e))
+
+        errors = await self.discover()
+        # NOTE: the displays found unreachable by the concurrent requests are
+        #       forgotten meanwhile; this request keeps its own view of them
+        known = dict(self.__capabilities)
+        compression = request.compression
+        resolved = None
+        source: Optional[Panel] = None
+        if request.type == RenderingRequest.PACKED:
+            # NOTE: panel buffers are decompressed to resolve the deltas of
+            #       the next frames
+            panels = [layout for layout in map(panel, known.values()) if layout and (request.width, request.height) in ((layout[0], layout[1]), (layout[1], layout[0]))]  # noqa: E501
+            if not panels:
+                return self.__reject(
+                    RenderingResponse.DIMENSION_NOT_ALLOWED,
+                    "panel buffer does not fit the panel of any display"
+                )
+            source = panels[0]
+            size = self.__converter(source).buffer_size
+            if request.delta and (self.__last_frame is None or crc(self.__last_frame) != request.delta_base):  # noqa: E501
+                return self.__reject(
+                    RenderingResponse.DELTA_BASE_MISMATCH,
+                    "delta base is not the last frame sent to the displays"
+                )
+            try:
+                data = bytes(decompress(compression, data, size))
+            except ValueError as e:
+                return self.__reject(RenderingResponse.INVALID_PAYLOAD, str(e))  # noqa: E501
+            if request.delta:
+                data = bytes(xor_delta(self.__last_frame, data))
+            compression = RenderingRequest.RAW
+            resolved = data
+        elif request.delta:
+            return self.__reject(
+                RenderingResponse.INVALID_PAYLOAD,
+                "delta frames must use the PACKED pixel type"
+            )
+        if request.dithering not in DITHERINGS:
+            return self.__reject(
+                RenderingResponse.INVALID_PAYLOAD,
+                f"dithering {request.dithering} is not supported"
+            )
+
+        # NOTE: displays are grouped by kind of panel, each group getting
+        #       the same serialized request
+        groups: Dict[Tuple[Optional[Panel], bool], List[str]] = {}
+        for addr in self.displays:
+            if addr in known:
+                capabilities = known[addr]
+                key = (panel(capabilities), RenderingRequest.ZLIB in capabilities.compressions)  # noqa: E501
+                groups.setdefault(key, []).append(addr)
+
+        def encode(layout: Optional[Panel], compress: bool) -> RenderingRequest:  # noqa: E501
+            if layout is None and source is not None:
+                # NOTE: the panel buffer is only meaningful to the displays
+                #       sharing its layout
+                white = self.__converter(source).unpack(data, request.width, request.height)  # noqa: E501
+                frame = white.view(np.uint8).tobytes()
+                if compress:
+                    return RenderingRequest(type=RenderingRequest.ONE, width=request.width, height=request.height, data=zlib.compress(frame), compression=RenderingRequest.ZLIB)  # noqa: E501
+                return RenderingRequest(type=RenderingRequest.ONE, width=request.width, height=request.height, data=frame)  # noqa: E501
+            if layout is None:
+                return RenderingRequest(type=request.type, width=request.width, height=request.height, data=data, compression=compression, dithering=request.dithering)  # noqa: E501
+            converter = self.__converter(layout)
+            if request.type == RenderingRequest.PACKED:
+                # NOTE: panel buffers are repacked for the other kinds of
+                #       panels, provided the image fits them
+                frame = data if layout == source else converter.pack(self.__converter(source).unpack(data, request.width, request.height))  # noqa: E501
+            else:
+                size = converter.payload_size(request.type, request.width, request.height)  # noqa: E501
+                frame = converter.convert(request.type, request.width, request.height, decompress(compression, data, size), DITHERINGS[request.dithering])  # noqa: E501
+            if compress:
+                return RenderingRequest(type=RenderingRequest.PACKED, width=request.width, height=request.height, data=zlib.compress(frame), compression=RenderingRequest.ZLIB)  # noqa: E501
+            return RenderingRequest(type=RenderingRequest.PACKED, width=request.width, height=request.height, data=frame)  # noqa: E501
+
+        encoded = await asyncio.gather(
+            *(loop.run_in_executor(None, encode, *key) for key in groups),
+            return_exceptions=True,
+        )
+
+        # NOTE: the deadline includes the conversion
+        deadline_ms = request.deadline_ms
+        if deadline_ms:
+            elapsed_ms = int((loop.time() - received_at) * 1000)
+            if elapsed_ms >= deadline_ms:
+                self.metrics.frames_expired.inc()
+                return RenderingResponse(
+                    status=RenderingResponse.DEADLINE_EXCEEDED,
+                    details="frame deadline passed while converting it"
+                )
+            deadline_ms -= elapsed_ms
+
+        responses: Dict[str, RenderingResponse] = {
+            addr: RenderingResponse(status=RenderingResponse.UNAVAILABLE, details=error)  # noqa: E501
+            for addr, error in errors.items()
+        }
+        calls = {}
+        for addrs, forwarded in zip(groups.values(), encoded):
+            if isinstance(forwarded, ValueError):
+                for addr in addrs:
+                    responses[addr] = RenderingResponse(status=RenderingResponse.INVALID_PAYLOAD, details=str(forwarded))  # noqa: E501
+                continue
+            if isinstance(forwarded, BaseException):
+                raise forwarded
+
+            forwarded.wait_for_refresh = request.wait_for_refresh
+            forwarded.priority = request.priority
+            forwarded.deadline_ms = deadline_ms
+            if request.HasField("region"):
+                forwarded.region.CopyFrom(request.region)
+            payload = forwarded.SerializeToString()
+            for addr in addrs:
+                calls[addr] = self.__send(addr, payload)
+
+        for addr, response in zip(calls, await asyncio.gather(*calls.values())):  # noqa: E501
+            responses[addr] = response
+        # NOTE: the next deltas apply to the frame shown by the displays,
+        #       which is unchanged if none of them accepted this one
+        if resolved is not None and any(response.status == RenderingResponse.OK for response in responses.values()):  # noqa: E501
+            self.__last_frame = resolved
+        return self.__merge(responses)
+
+    async def __send(self, addr: str, payload: bytes) -> RenderingResponse:
+        """Sends a serialized rendering request to a display."""
+        try:
+            return await self.__forward[addr](payload, timeout=self.TIMEOUT)
+        except grpc.aio.AioRpcError as e:
+            if e.code() == grpc.StatusCode.UNAVAILABLE:
+                # NOTE: the display may have been replaced meanwhile
+                self.__capabilities.pop(addr, None)
+            return RenderingResponse(status=RenderingResponse.UNAVAILABLE, details=f"display unreachable ({e.code().name}): {e.details()}")  # noqa: E501
+
+    def __merge(self, responses: Dict[str, RenderingResponse]) -> RenderingResponse:  # noqa: E501
+        """Returns the response of a frame forwarded to the displays."""
+        response = RenderingResponse(status=RenderingResponse.OK)
+        failures = []
+        for addr in self.displays:
+            device = responses.get(addr) or RenderingResponse(status=RenderingResponse.UNAVAILABLE, details="display unreachable")  # noqa: E501
+            response.devices[addr].CopyFrom(device)
+            if device.status != RenderingResponse.OK:
+                failures.append(f"{addr}: {device.details}")
+                if response.status == RenderingResponse.OK:
+                    response.status = device.status
+        response.details = "; ".join(failures)
+        response.deduplicated = all(device.deduplicated for device in response.devices.values())  # noqa: E501
+        response.dropped = any(device.dropped for device in response.devices.values())  # noqa: E501
+        return response
+
+    def __converter(self, layout: Panel) -> FrameConverter:
+        converter = self.__converters.get(layout)
+        if converter is None:
+            converter = self.__converters[layout] = FrameConverter(layout[0], layout[1])  # noqa: E501
+        return converter
+
+    def __reject(self, status: int, details: str) -> RenderingResponse:
+        """Returns the response of an invalid request."""
+        self.metrics.frames_rejected.labels(RenderingResponse.StatusCode.Name(status)).inc()  # noqa: E501
+        return RenderingResponse(status=status, details=details)
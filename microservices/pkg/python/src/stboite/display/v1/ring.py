@@ -0,0 +1,163 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Frame rings, shared memory segments used by the local clients to pass
+frames to the display servers without copying them through the socket
+"""
+
+import mmap
+import os
+import struct
+
+from typing import Optional, Union
+
+# Directory of the shared memory segments (tmpfs)
+SHM_DIR = "/dev/shm"
+
+
+class FrameRing:
+    """Shared memory segment split into fixed-size slots.
+
+    The client writes a payload in a free slot and sends its index instead
+    of the payload; the server reads the slot from the segment. A slot must
+    not be written again before the response of the request using it has
+    been received, and the name of a ring must not be reused since the
+    servers keep the rings they read open.
+
+    NOTE: only the owner of a ring maps it; the servers read the slots with
+          `pread`, a segment truncated by its owner making the reads fail
+          instead of raising SIGBUS in the server.
+    """
+
+    MAGIC = b"STBR"
+    VERSION = 1
+    # magic, version, number of slots, size of a slot
+    HEADER = struct.Struct("<4sHII")
+    # NOTE: slots are aligned on cache lines
+    HEADER_SIZE = 64
+
+    def __init__(self, name: str, slots: int, slot_size: int, buffer: Optional[mmap.mmap] = None, fd: Optional[int] = None):  # noqa: E501
+        self.name = name
+        self.slots = slots
+        self.slot_size = slot_size
+        # NOTE: mapping of the owner, descriptor of the readers
+        self.__mmap = buffer
+        self.__view = memoryview(buffer) if buffer is not None else None
+        self.__fd = fd
+
+    @staticmethod
+    def path(name: str) -> str:
+        """Returns the path of the shared memory segment of a ring.
+
+        Raises:
+          ValueError: the name is not a plain file name.
+        """
+        if not name or os.path.basename(name) != name or name.startswith("."):  # noqa: E501
+            raise ValueError(f"invalid frame ring name {name!r}")
+        return os.path.join(SHM_DIR, name)
+
+    @classmethod
+    def create(cls, name: str, slots: int, slot_size: int) -> "FrameRing":
+        """Creates a new ring, owned by the caller.
+
+        Raises:
+          FileExistsError: a ring with the same name already exists.
+        """
+        size = cls.HEADER_SIZE + slots * slot_size
+        fd = os.open(cls.path(name), os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)  # noqa: E501
+        try:
+            os.ftruncate(fd, size)
+            buffer = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        cls.HEADER.pack_into(buffer, 0, cls.MAGIC, cls.VERSION, slots, slot_size)  # noqa: E501
+        return cls(name, slots, slot_size, buffer)
+
+    @classmethod
+    def open(cls, name: str) -> "FrameRing":
+        """Opens a ring created by another process.
+
+        Raises:
+          OSError: the ring does not exist.
+          ValueError: the shared memory segment is not a valid ring.
+        """
+        fd = os.open(cls.path(name), os.O_RDONLY)
+        try:
+            header = os.pread(fd, cls.HEADER.size, 0)
+            if len(header) < cls.HEADER.size:
+                raise ValueError(f"{name!r} is not a frame ring")
+            magic, version, slots, slot_size = cls.HEADER.unpack(header)
+            if (magic, version) != (cls.MAGIC, cls.VERSION) or os.fstat(fd).st_size < cls.HEADER_SIZE + slots * slot_size:  # noqa: E501
+                raise ValueError(f"{name!r} is not a frame ring")
+        except Exception:
+            os.close(fd)
+            raise
+        return cls(name, slots, slot_size, fd=fd)
+
+    def __offset(self, index: int, size: int) -> int:
+        if not 0 <= index < self.slots:
+            raise ValueError(f"frame ring {self.name!r} has no slot {index}")
+        if size > self.slot_size:
+            raise ValueError(f"payload size exceeds the slot size ({self.slot_size} bytes)")  # noqa: E501
+        return self.HEADER_SIZE + index * self.slot_size
+
+    def slot(self, index: int, size: int) -> memoryview:
+        """Returns a view of the first `size` bytes of a slot of a ring
+        created by the caller, without copying them.
+
+        Raises:
+          ValueError: the slot does not exist or is smaller than `size`.
+        """
+        if self.__view is None:
+            raise ValueError(f"frame ring {self.name!r} is not owned by this process")  # noqa: E501
+        offset = self.__offset(index, size)
+        return self.__view[offset:offset + size]
+
+    def read(self, index: int, size: int) -> bytes:
+        """Returns a copy of the first `size` bytes of a slot.
+
+        Raises:
+          ValueError: the slot does not exist, is smaller than `size`, or
+            the segment has been truncated.
+        """
+        offset = self.__offset(index, size)
+        if self.__view is not None:
+            return bytes(self.__view[offset:offset + size])
+
+        # NOTE: the segment can be resized by its owner at any time, even
+        #       during the read
+        data = os.pread(self.__fd, size, offset) if os.fstat(self.__fd).st_size >= offset + size else b""  # noqa: E501
+        if len(data) != size:
+            raise ValueError(f"frame ring {self.name!r} has been truncated")
+        return data
+
+    def write(self, index: int, data: Union[bytes, bytearray, memoryview]) -> None:  # noqa: E501
+        """Copies a payload in a slot."""
+        self.slot(index, len(data))[:] = data
+
+    def close(self) -> None:
+        """Closes the ring; views of its slots must have been released."""
+        if self.__mmap is not None:
+            self.__view.release()
+            self.__mmap.close()
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+    def unlink(self) -> None:
+        """Removes the shared memory segment, once the ring is closed by all
+        the processes using it.
+        """
+        os.unlink(self.path(self.name))
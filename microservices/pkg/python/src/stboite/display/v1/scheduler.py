@@ -0,0 +1,88 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Timers used to schedule the maintenance of the display servers"""
+
+import asyncio
+import logging
+
+from typing import Awaitable, Callable, Optional
+
+
+class Deadline:
+    """Runs a coroutine function once a delay has elapsed.
+
+    The deadline is armed by an event loop timer, so nothing runs until it
+    expires. Arming it again postpones the expiration, which makes it a
+    cheap way to detect inactivity.
+    """
+
+    __handle: Optional[asyncio.TimerHandle] = None
+    __task: Optional[asyncio.Task] = None
+
+    def __init__(self,
+                 delay: Optional[float],
+                 callback: Callable[[], Awaitable[None]]):
+        """Creates a disarmed deadline.
+
+        Args:
+          delay: the default delay, in seconds. None disables the deadline.
+          callback: the coroutine function called when the deadline expires.
+        """
+        self.delay = delay
+        self.__callback = callback
+
+    @property
+    def armed(self) -> bool:
+        """Whether the deadline will expire."""
+        return self.__handle is not None
+
+    def arm(self, delay: Optional[float] = None) -> None:
+        """(Re)arms the deadline, replacing the previous expiration.
+
+        Args:
+          delay: the delay before the expiration, in seconds. The default
+            delay is used if not set.
+        """
+        self.disarm()
+        delay = self.delay if delay is None else delay
+        if delay is None:
+            return
+        self.__handle = asyncio.get_event_loop().call_later(delay, self.__expire)  # noqa: E501
+
+    def disarm(self) -> None:
+        """Cancels the expiration, if any. A callback already running is
+        not cancelled.
+        """
+        if self.__handle is not None:
+            self.__handle.cancel()
+            self.__handle = None
+
+    def cancel(self) -> None:
+        """Cancels the expiration and the callback if it is running."""
+        self.disarm()
+        if self.__task is not None:
+            self.__task.cancel()
+
+    def __expire(self) -> None:
+        self.__handle = None
+        self.__task = asyncio.get_event_loop().create_task(self.__run())
+
+    async def __run(self) -> None:
+        try:
+            await self.__callback()
+        except asyncio.CancelledError:
+            pass
+        except Exception:  # pylint: disable=broad-except
+            logging.getLogger("Deadline").exception("deadline callback failed")  # noqa: E501
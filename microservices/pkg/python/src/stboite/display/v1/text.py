@@ -0,0 +1,234 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Text rendering from cached 1-bit glyph atlases"""
+
+import string
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Tuple, Union
+
+# NOTE: Pillow is only loaded by the first text drawn (or font registered),
+#       shortening the startup of the servers
+if TYPE_CHECKING:
+    from PIL import ImageFont
+
+# Identifier of the Pillow built-in bitmap font, always available
+DEFAULT_FONT = "default"
+
+# Characters rasterized when an atlas is created, the others being
+# rasterized the first time they are drawn
+_PRERENDERED = "".join(c for c in string.printable if not c.isspace()) + " "
+
+
+def _text_size(font: "ImageFont.ImageFont", text: str) -> Tuple[int, int]:
+    """Returns the (width, height) of a text drawn with a bitmap font."""
+    # NOTE: `getsize` is removed from Pillow 10, and `getbbox` only added in
+    #       Pillow 9.2
+    if hasattr(font, "getbbox"):
+        _, _, width, height = font.getbbox(text)
+        return width, height
+    return font.getsize(text)
+
+
+class Glyph(NamedTuple):
+    """1-bit bitmap of a character, packed eight pixels per byte"""
+
+    # Rows of packed bits, set for the inked pixels
+    bits: np.ndarray
+    width: int
+    height: int
+    # Position of the bitmap relative to the pen position, the pen being on
+    # the top of the line
+    left: int
+    top: int
+    # Horizontal distance to the next character, in pixels
+    advance: float
+
+    def mask(self) -> np.ndarray:
+        """Returns the (height, width) boolean array of the inked pixels."""
+        return np.unpackbits(self.bits, axis=1, count=self.width).view(bool)
+
+
+class GlyphAtlas:
+    """Glyphs of a font at a given size, rasterized once without
+    anti-aliasing
+    """
+
+    # Number of glyphs kept besides the prerendered ones, the least recently
+    # used ones being dropped first
+    GLYPH_CACHE_SIZE = 512
+
+    def __init__(self, font: Union["ImageFont.ImageFont", "ImageFont.FreeTypeFont"]):  # noqa: E501
+        from PIL import ImageFont
+
+        self.font = font
+        if isinstance(font, ImageFont.FreeTypeFont):
+            ascent, descent = font.getmetrics()
+            self.line_height = ascent + descent
+        else:
+            self.line_height = _text_size(font, string.ascii_letters)[1] + 1
+
+        self.__prerendered: Dict[str, Glyph] = {char: self.__rasterize(char) for char in _PRERENDERED}  # noqa: E501
+        self.__glyphs: "OrderedDict[str, Glyph]" = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__prerendered) + len(self.__glyphs)
+
+    def glyph(self, char: str) -> Glyph:
+        """Returns the glyph of the given character."""
+        glyph = self.__prerendered.get(char)
+        if glyph is not None:
+            return glyph
+
+        with self.__lock:
+            glyph = self.__glyphs.get(char)
+            if glyph is not None:
+                self.__glyphs.move_to_end(char)
+                return glyph
+
+            glyph = self.__glyphs[char] = self.__rasterize(char)
+            if len(self.__glyphs) > self.GLYPH_CACHE_SIZE:
+                self.__glyphs.popitem(last=False)
+        return glyph
+
+    def draw(self, frame: np.ndarray, text: str, x: int, y: int, white: bool = False) -> None:  # noqa: E501
+        """Draws a text with its top left corner at (x, y), clipped by the
+        frame borders.
+
+        Args:
+          frame: the (height, width) boolean array of the frame, set for the
+            white pixels.
+          text: the text to draw; new lines start below the previous ones.
+          x: the position of the left of the text.
+          y: the position of the top of the text.
+          white: whether the text is drawn in white instead of black.
+        """
+        height, width = frame.shape
+        for line, chars in enumerate(text.split("\n")):
+            top = y + line * self.line_height
+            if top >= height:
+                break
+
+            pen = float(x)
+            for char in chars:
+                # NOTE: the rest of the line is past the right border
+                if pen >= width:
+                    break
+                glyph = self.glyph(char)
+                gx, gy = int(round(pen)) + glyph.left, top + glyph.top
+                pen += glyph.advance
+
+                x0, y0 = max(gx, 0), max(gy, 0)
+                x1, y1 = min(gx + glyph.width, width), min(gy + glyph.height, height)  # noqa: E501
+                if x0 >= x1 or y0 >= y1:
+                    continue
+
+                mask = glyph.mask()[y0 - gy:y1 - gy, x0 - gx:x1 - gx]
+                if white:
+                    frame[y0:y1, x0:x1] |= mask
+                else:
+                    frame[y0:y1, x0:x1] &= ~mask
+
+    def __rasterize(self, char: str) -> Glyph:
+        from PIL import Image, ImageDraw, ImageFont
+
+        if isinstance(self.font, ImageFont.FreeTypeFont):
+            # NOTE: same placement as `ImageDraw.text`
+            mask, (left, top) = self.font.getmask2(char, mode="1")
+            width, height = mask.size
+            advance = self.font.getlength(char)
+        else:
+            left, top = 0, 0
+            width, height = _text_size(self.font, char)
+            advance = width
+
+        image = Image.new("1", (max(width, 1), max(height, 1)), 0)
+        if width and height:
+            ImageDraw.Draw(image).text((-left, -top), char, font=self.font, fill=1)  # noqa: E501
+        bits = np.packbits(np.asarray(image)[:height, :width], axis=1)
+        return Glyph(bits, width, height, left, top, advance)
+
+
+class Fonts:
+    """Fonts available to the clients, with the glyph atlases of the most
+    recently used sizes.
+    """
+
+    # Largest font size accepted, in pixels
+    MAX_SIZE = 128
+
+    def __init__(self, atlas_cache_size: int = 8):
+        self.atlas_cache_size = atlas_cache_size
+        self.__paths: Dict[str, str] = {}
+        self.__atlases: "OrderedDict[Tuple[str, int], GlyphAtlas]" = OrderedDict()  # noqa: E501
+        self.__lock = threading.Lock()
+
+    def __contains__(self, font_id: str) -> bool:
+        return font_id in (DEFAULT_FONT, "") or font_id in self.__paths
+
+    def ids(self) -> List[str]:
+        """Returns the identifiers of the available fonts."""
+        return [DEFAULT_FONT] + sorted(self.__paths)
+
+    def register(self, font_id: str, path: str) -> None:
+        """Makes a TrueType or OpenType font available under the given
+        identifier.
+
+        Raises:
+          OSError: the font cannot be loaded.
+        """
+        from PIL import ImageFont
+
+        ImageFont.truetype(path, 12)
+        self.__paths[font_id] = path
+
+    def atlas(self, font_id: str, size: int) -> GlyphAtlas:
+        """Returns the glyph atlas of a font at the given size, in pixels
+        (ignored by the default bitmap font).
+
+        Raises:
+          KeyError: the font is unknown.
+          ValueError: the size is not supported.
+        """
+        if font_id in (DEFAULT_FONT, ""):
+            font_id, size = DEFAULT_FONT, 0
+        elif font_id not in self.__paths:
+            raise KeyError(font_id)
+        elif not 0 < size <= self.MAX_SIZE:
+            raise ValueError(f"font size must be between 1 and {self.MAX_SIZE}px")  # noqa: E501
+
+        key = (font_id, size)
+        with self.__lock:
+            atlas = self.__atlases.get(key)
+            if atlas is not None:
+                self.__atlases.move_to_end(key)
+                return atlas
+
+        from PIL import ImageFont
+
+        if font_id == DEFAULT_FONT:
+            atlas = GlyphAtlas(ImageFont.load_default())
+        else:
+            atlas = GlyphAtlas(ImageFont.truetype(self.__paths[font_id], size))
+
+        with self.__lock:
+            self.__atlases[key] = atlas
+            if len(self.__atlases) > self.atlas_cache_size:
+                self.__atlases.popitem(last=False)
+        return atlas
@@ -0,0 +1,209 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""gRPC touch input API library"""
+
+import asyncio
+import logging
+import time
+
+import grpc
+
+from stboite.grpc.v1.stboite_input_pb2_grpc import TouchInputServiceStub
+from stboite.grpc.v1.stboite_input_pb2 import TouchEvent, TouchEventBatch
+
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+# Point touched on the screen: x, y and pressure
+Point = Tuple[int, int, int]
+
+
+class GRPCTouchInput:
+    """Base class of the touch screens, streaming their events to a
+    TouchInputService.
+
+    Implementations yield the points touched at each sample of the screen
+    from `samples` (an empty sample when the screen is released), or call
+    `push` themselves. Samples are sent in batches over a single stream:
+    presses and releases are sent at once, while the moves of the fingers
+    are merged during `window` seconds, only their last position being sent.
+    Moves are also merged until the consumer has acknowledged the previous
+    batch, so a slow consumer receives fewer events instead of a growing
+    backlog.
+
+    NOTE: a batch not acknowledged is sent again on a new stream when the
+          stream breaks, so the consumer may receive an event twice but
+          never misses a press or a release.
+    """
+
+    # Events sent to the consumer
+    events_sent: int = 0
+    # Moves merged with the following one instead of being sent
+    events_merged: int = 0
+
+    def __init__(self,
+                 addr: str,
+                 window: float = 0.02,
+                 backoff: float = 0.2,
+                 max_backoff: float = 5.0):
+        """Creates a touch input streaming its events to the consumer
+        listening on `addr`.
+
+        Args:
+          addr: the address of the TouchInputService.
+          window: the time during which the moves are merged, in seconds.
+          backoff: the delay before opening a new stream when the stream
+            breaks, in seconds, doubled after each failure.
+          max_backoff: the maximum delay between two streams, in seconds.
+        """
+        self.addr = addr
+        self.window = window
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.__pending: List[TouchEvent] = []
+        # NOTE: only the last pending event can be merged, and only with a
+        #       move touching as many points
+        self.__mergeable = False
+        self.__touched = 0
+        self.__ready = asyncio.Event()
+        self.__flush_timer: Optional[asyncio.TimerHandle] = None
+        self.__stopping = False
+        self.__channel: Optional[grpc.aio.Channel] = None
+        self.__sender: Optional[asyncio.Task] = None
+        self.__reader: Optional[asyncio.Task] = None
+
+    async def samples(self) -> AsyncIterator[Sequence[Point]]:
+        """Yields the points touched at each sample of the screen; the
+        implementations not calling `push` themselves must override it.
+        """
+        return
+        yield
+
+    async def start(self) -> None:
+        """Opens the stream to the consumer and starts reading the samples
+        of the screen.
+
+        This method may only be called once. (i.e. it is not idempotent).
+        """
+        self.__channel = grpc.aio.insecure_channel(self.addr)
+        self.__sender = asyncio.create_task(self.__send())
+        self.__reader = asyncio.create_task(self.__read())
+
+    async def wait_for_termination(self) -> None:
+        """Continues current coroutine once `samples` is exhausted."""
+        await asyncio.shield(self.__reader)
+
+    async def stop(self) -> None:
+        """Stops reading the samples, sends the pending events and closes
+        the stream.
+        """
+        self.__reader.cancel()
+        self.__stopping = True
+        self.__ready.set()
+        try:
+            await self.__sender
+        finally:
+            await self.__channel.close()
+
+    def push(self, points: Sequence[Point], timestamp: Optional[float] = None) -> None:  # noqa: E501
+        """Queues a sample of the screen for the consumer.
+
+        Args:
+          points: the points touched, none when the screen is released.
+          timestamp: the time of the sample (`time.monotonic` clock), the
+            current time if not set.
+        """
+        previous, self.__touched = self.__touched, len(points)
+        if not points and not previous:
+            # NOTE: the screen is still released
+            return
+
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        event = TouchEvent(
+            points=[TouchEvent.Point(X=x, Y=y, Pressure=pressure) for x, y, pressure in points],  # noqa: E501
+            timestamp_us=int(timestamp * 1_000_000),
+        )
+
+        if not points or len(points) != previous:
+            # NOTE: presses and releases are sent at once, and never merged
+            self.__pending.append(event)
+            self.__mergeable = False
+            self.__ready.set()
+            return
+
+        if self.__mergeable:
+            self.__pending[-1] = event
+            self.events_merged += 1
+        else:
+            self.__pending.append(event)
+            self.__mergeable = True
+        if self.__flush_timer is None:
+            self.__flush_timer = asyncio.get_running_loop().call_later(self.window, self.__ready.set)  # noqa: E501
+
+    async def __read(self) -> None:
+        async for points in self.samples():
+            self.push(points)
+
+    async def __send(self) -> None:
+        stub = TouchInputServiceStub(self.__channel)
+        call = None
+        delay = self.backoff
+        while True:
+            # NOTE: the pending events are sent at once when stopping
+            if not self.__stopping:
+                await self.__ready.wait()
+            self.__ready.clear()
+            if self.__flush_timer is not None:
+                self.__flush_timer.cancel()
+                self.__flush_timer = None
+
+            batch, self.__pending = self.__pending, []
+            self.__mergeable = False
+            if not batch:
+                if self.__stopping:
+                    break
+                continue
+
+            try:
+                if call is None:
+                    call = stub.StreamTouchEvents()
+                await call.write(TouchEventBatch(events=batch))
+                # NOTE: the samples are merged until the batch is handled
+                if await call.read() is grpc.aio.EOF:
+                    raise EOFError("stream closed by the consumer")
+                self.events_sent += len(batch)
+                delay = self.backoff
+            except (grpc.aio.AioRpcError, asyncio.InvalidStateError, EOFError) as e:  # noqa: E501
+                call.cancel()
+                call = None
+                reason = e.code().name if isinstance(e, grpc.aio.AioRpcError) else e  # noqa: E501
+                # NOTE: the events sampled meanwhile follow the batch
+                self.__pending[:0] = batch
+                if self.__stopping:
+                    self.__logging.error("touch event stream broken (%s), %d events lost", reason, len(self.__pending))  # noqa: E501
+                    return
+                self.__logging.warning("touch event stream broken (%s), retrying in %.1fs", reason, delay)  # noqa: E501
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+                self.__ready.set()
+
+        if call is not None:
+            await call.done_writing()
+            while await call.read() is not grpc.aio.EOF:
+                pass
+
+    @property
+    def __logging(self) -> logging.Logger:
+        return logging.getLogger("GRPCTouchInput")
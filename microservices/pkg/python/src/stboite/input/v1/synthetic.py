@@ -0,0 +1,80 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Synthetic touch screen, replaying scripted gestures instead of sampling
+a real screen
+"""
+
+import asyncio
+
+from stboite.input.v1 import GRPCTouchInput, Point
+
+from typing import AsyncIterator, List, Sequence
+
+# Points touched at each sample of a gesture
+Gesture = List[Sequence[Point]]
+
+
+def tap(x: int, y: int, samples: int = 5, pressure: int = 32) -> Gesture:
+    """Returns a finger held still on (x, y) during `samples` samples."""
+    return [[(x, y, pressure)]] * samples
+
+
+def drag(start: Sequence[int], end: Sequence[int], samples: int = 50, pressure: int = 32) -> Gesture:  # noqa: E501
+    """Returns a finger moved in a straight line from `start` to `end`
+    (x, y) during `samples` samples.
+    """
+    steps = max(samples - 1, 1)
+    return [
+        [(
+            start[0] + (end[0] - start[0]) * i // steps,
+            start[1] + (end[1] - start[1]) * i // steps,
+            pressure,
+        )]
+        for i in range(samples)
+    ]
+
+
+class SyntheticTouchInput(GRPCTouchInput):
+    """Touch input playing gestures, each gesture being followed by the
+    release of the screen.
+    """
+
+    def __init__(self,
+                 addr: str,
+                 gestures: Sequence[Gesture],
+                 rate: float = 100.0,
+                 **kwargs):
+        """Creates a synthetic touch input.
+
+        Args:
+          addr: the address of the TouchInputService.
+          gestures: the gestures played, in order.
+          rate: the number of samples per second (0 to play the gestures as
+            fast as possible).
+          kwargs: the other arguments of `GRPCTouchInput`.
+        """
+        super().__init__(addr, **kwargs)
+        self.gestures = gestures
+        self.rate = rate
+
+    async def samples(self) -> AsyncIterator[Sequence[Point]]:
+        period = 1 / self.rate if self.rate else 0
+        loop = asyncio.get_running_loop()
+        next_sample = loop.time()
+        for gesture in self.gestures:
+            for points in list(gesture) + [[]]:
+                yield points
+                next_sample += period
+                await asyncio.sleep(max(next_sample - loop.time(), 0))
@@ -0,0 +1,130 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the assets stored on the display servers and of the
+composition of frames.
+"""
+
+import unittest
+
+import numpy as np
+
+from stboite.display.v1.assets import Asset, AssetCache, compose
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest
+
+
+def asset(size: int) -> Asset:
+    """Returns an opaque black asset using `size` bytes."""
+    return Asset(8, size, bytes(size))
+
+
+class AssetTest(unittest.TestCase):
+
+    def test_pixels_are_packed(self) -> None:
+        data = bytes([0, 255] * 5 + [255] * 10)
+        converted = Asset.convert(RenderingRequest.L, 10, 2, data)
+
+        self.assertEqual((converted.white, converted.mask), (bytes([0x55, 0x40, 0xFF, 0xC0]), None))  # noqa: E501
+        self.assertEqual(converted.size, 4)
+
+    def test_transparent_pixels_are_masked(self) -> None:
+        data = bytes([0, 0, 0, 255, 0, 0, 0, 0])
+        converted = Asset.convert(RenderingRequest.RGBA, 2, 1, data)
+
+        white, mask = converted.unpack()
+        self.assertEqual(white.tolist(), [[False, False]])
+        self.assertEqual(mask.tolist(), [[True, False]])
+        self.assertEqual(converted.size, 2)
+
+    def test_invalid_payload_is_rejected(self) -> None:
+        for pixel_type, width, height, data in [
+            (RenderingRequest.PACKED, 8, 1, bytes(1)),
+            (RenderingRequest.L, 0, 1, b""),
+            (RenderingRequest.L, 2, 2, bytes(3)),
+        ]:
+            with self.subTest(pixel_type=pixel_type, width=width, height=height), self.assertRaises(ValueError):  # noqa: E501
+                Asset.convert(pixel_type, width, height, data)
+
+
+class AssetCacheTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cache = AssetCache(max_size=100)
+
+    def test_least_recently_used_are_evicted_by_size(self) -> None:
+        self.cache.put("a", asset(40))
+        self.cache.put("b", asset(40))
+        self.cache.get("a")
+        self.cache.put("c", asset(30))
+
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNotNone(self.cache.get("c"))
+        self.assertEqual(self.cache.size, 70)
+
+    def test_large_asset_evicts_several_ones(self) -> None:
+        for asset_id in "abcd":
+            self.cache.put(asset_id, asset(25))
+        self.cache.put("e", asset(60))
+
+        self.assertEqual([asset_id for asset_id in "abcde" if self.cache.get(asset_id)], ["d", "e"])  # noqa: E501
+        self.assertEqual(self.cache.size, 85)
+
+    def test_replaced_asset_is_not_counted_twice(self) -> None:
+        self.cache.put("a", asset(60))
+        self.cache.put("b", asset(30))
+        self.cache.put("a", asset(70))
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.size, 100)
+
+    def test_asset_larger_than_the_cache_is_rejected(self) -> None:
+        self.cache.put("a", asset(10))
+        with self.assertRaises(ValueError):
+            self.cache.put("b", asset(101))
+        # NOTE: nothing is evicted
+        self.assertIsNotNone(self.cache.get("a"))
+
+
+class ComposeTest(unittest.TestCase):
+
+    def test_assets_are_clipped_by_the_frame(self) -> None:
+        black = Asset.convert(RenderingRequest.L, 3, 3, bytes(9))
+        frame = compose(4, 4, [(black, -1, -1), (black, 3, 3)])
+
+        expected = np.ones((4, 4), dtype=bool)
+        expected[0:2, 0:2] = False
+        expected[3, 3] = False
+        self.assertEqual(frame.tolist(), expected.tolist())
+
+    def test_transparent_pixels_are_kept(self) -> None:
+        black = Asset.convert(RenderingRequest.L, 2, 1, bytes(2))
+        dot = Asset.convert(RenderingRequest.RGBA, 2, 1, bytes([255, 255, 255, 255, 0, 0, 0, 0]))  # noqa: E501
+        frame = compose(2, 1, [(black, 0, 0), (dot, 0, 0)])
+
+        self.assertEqual(frame.tolist(), [[True, False]])
+
+    def test_patches_are_drawn_over_the_assets(self) -> None:
+        black = Asset.convert(RenderingRequest.L, 2, 2, bytes(4))
+        frame = compose(2, 2, [(black, 0, 0)], [((1, 0, 1, 2), RenderingRequest.ONE, bytes([1, 1]))])  # noqa: E501
+
+        self.assertEqual(frame.tolist(), [[False, True], [False, True]])
+
+    def test_patch_outside_of_the_frame_is_rejected(self) -> None:
+        with self.assertRaises(ValueError):
+            compose(2, 2, [], [((1, 1, 2, 2), RenderingRequest.ONE, bytes(4))])  # noqa: E501
+
+
+if __name__ == '__main__':
+    unittest.main()
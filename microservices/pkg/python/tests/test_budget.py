@@ -0,0 +1,83 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the bound on the number of frames handled by the displays."""
+
+import asyncio
+import unittest
+
+import grpc
+
+from stboite.display.v1 import GRPCDisplay
+from stboite.grpc.v1.stboite_display_pb2 import ComposeFrameRequest, GetCapabilitiesRequest, RenderingRequest, RenderingResponse, UploadAssetRequest  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+
+
+class BlockedDisplay(GRPCDisplay):
+    """Display holding the frames it receives until `done` is set."""
+
+    def __init__(self, slots: int):
+        super().__init__("127.0.0.1:0", max_concurrent_rpcs=slots)
+        self.handling = 0
+        self.done = asyncio.Event()
+
+    async def DisplayRendering(self, request: RenderingRequest, context: grpc.aio.ServicerContext) -> RenderingResponse:  # noqa: E501
+        self.handling += 1
+        await self.done.wait()
+        return RenderingResponse(status=RenderingResponse.OK)
+
+
+class IngestBudgetTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.display = BlockedDisplay(2)
+        await self.display.start()
+        self.channel = grpc.aio.insecure_channel(f"127.0.0.1:{self.display.port}")  # noqa: E501
+        self.stub = RenderingServiceStub(self.channel)
+
+        # NOTE: the frames fill all the slots
+        self.frames = [asyncio.ensure_future(self.stub.DisplayRendering(RenderingRequest(data=b"frame"))) for _ in range(2)]  # noqa: E501
+        while self.display.handling < 2:
+            await asyncio.sleep(0.001)
+
+    async def asyncTearDown(self) -> None:
+        self.display.done.set()
+        await asyncio.gather(*self.frames)
+        await self.channel.close()
+        await self.display.stop(None)
+
+    async def test_frames_are_rejected_without_slot(self) -> None:
+        for call in [
+            self.stub.DisplayRendering(RenderingRequest(data=b"frame")),
+            self.stub.ComposeFrame(ComposeFrameRequest()),
+        ]:
+            with self.assertRaises(grpc.aio.AioRpcError) as error:
+                await call
+            self.assertEqual(error.exception.code(), grpc.StatusCode.RESOURCE_EXHAUSTED)  # noqa: E501
+
+    async def test_control_calls_are_not_limited(self) -> None:
+        capabilities = await self.stub.GetCapabilities(GetCapabilitiesRequest())  # noqa: E501
+        self.assertTrue(capabilities.compressions)
+        response = await self.stub.UploadAsset(UploadAssetRequest(id="dot", type=RenderingRequest.L, width=1, height=1, data=b"\x00"))  # noqa: E501
+        self.assertEqual(response.status, RenderingResponse.OK)
+
+    async def test_slots_are_released(self) -> None:
+        self.display.done.set()
+        await asyncio.gather(*self.frames)
+        response = await self.stub.DisplayRendering(RenderingRequest(data=b"frame"))  # noqa: E501
+        self.assertEqual(response.status, RenderingResponse.OK)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the capture of the requests received by the display servers."""
+
+import os
+import tempfile
+import unittest
+
+import grpc
+
+from stboite.display.v1 import GRPCDisplay
+from stboite.display.v1.capture import CapturedCall, CaptureWriter, read_capture  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest, RenderingResponse  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+
+METHOD = "/stboite.display.v1.RenderingService/DisplayRendering"
+
+
+class CaptureFileTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "requests.capture")
+
+    def capture(self, *calls) -> None:
+        writer = CaptureWriter(self.path)
+        for timestamp, method, request in calls:
+            writer.write(method, request, timestamp)
+        writer.close()
+
+    def test_calls_are_read_back(self) -> None:
+        calls = [
+            CapturedCall(1.5, METHOD, b"frame A"),
+            CapturedCall(2.25, "/stboite.display.v1.RenderingService/GetCapabilities", b""),  # noqa: E501
+            CapturedCall(3.0, METHOD, b"frame A"),
+        ]
+        self.capture(*calls)
+        self.assertEqual(list(read_capture(self.path)), calls)
+
+    def test_repeated_requests_are_stored_once(self) -> None:
+        self.capture((1.0, METHOD, b"x" * 1000))
+        size = os.path.getsize(self.path)
+        self.capture((1.0, METHOD, b"x" * 1000), (2.0, METHOD, b"x" * 1000))
+
+        self.assertEqual(os.path.getsize(self.path) - size, CaptureWriter.CALL.size)  # noqa: E501
+
+    def test_truncated_last_record_is_ignored(self) -> None:
+        self.capture((1.0, METHOD, b"frame A"), (2.0, METHOD, b"frame B"))
+        full = os.path.getsize(self.path)
+        for cut in (1, CaptureWriter.CALL.size, CaptureWriter.CALL.size + 3):
+            with self.subTest(cut=cut):
+                self.capture((1.0, METHOD, b"frame A"), (2.0, METHOD, b"frame B"))  # noqa: E501
+                os.truncate(self.path, full - cut)
+                self.assertEqual(list(read_capture(self.path)), [CapturedCall(1.0, METHOD, b"frame A")])  # noqa: E501
+
+    def test_other_files_are_rejected(self) -> None:
+        with open(self.path, "wb") as file:
+            file.write(b"not a capture")
+        with self.assertRaises(ValueError):
+            list(read_capture(self.path))
+
+    def test_corrupted_records_are_rejected(self) -> None:
+        for record in [
+            bytes([9]),
+            CaptureWriter.CALL.pack(CaptureWriter.CALL_TAG, 1.0, 0, 0),
+        ]:
+            with self.subTest(record=record):
+                self.capture()
+                with open(self.path, "ab") as file:
+                    file.write(record)
+                with self.assertRaises(ValueError):
+                    list(read_capture(self.path))
+
+
+class EchoDisplay(GRPCDisplay):
+
+    async def DisplayRendering(self, request: RenderingRequest, context: grpc.aio.ServicerContext) -> RenderingResponse:  # noqa: E501
+        return RenderingResponse(status=RenderingResponse.OK)
+
+
+class CaptureInterceptorTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_received_requests_are_captured(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "requests.capture")
+
+        async def frames():
+            yield RenderingRequest(data=b"streamed")
+
+        display = EchoDisplay("127.0.0.1:0", capture_file=path)
+        await display.start()
+        try:
+            async with grpc.aio.insecure_channel(f"127.0.0.1:{display.port}") as channel:  # noqa: E501
+                stub = RenderingServiceStub(channel)
+                await stub.DisplayRendering(RenderingRequest(data=b"unary"))
+                [_ async for _ in stub.StreamRendering(frames())]
+        finally:
+            await display.stop(None)
+
+        calls = list(read_capture(path))
+        self.assertEqual([call.method.rsplit("/", 1)[1] for call in calls], ["DisplayRendering", "StreamRendering"])  # noqa: E501
+        self.assertEqual([RenderingRequest.FromString(call.request).data for call in calls], [b"unary", b"streamed"])  # noqa: E501
+        self.assertLessEqual(calls[0].timestamp, calls[1].timestamp)
+
+
+if __name__ == '__main__':
+    unittest.main()
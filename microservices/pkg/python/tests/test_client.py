@@ -0,0 +1,163 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the asynchronous client of the display servers."""
+
+import unittest
+import zlib
+
+import grpc
+import numpy as np
+
+from stboite.display.v1 import GRPCDisplay
+from stboite.display.v1.client import DisplayClient, close_channels
+from stboite.display.v1.encoding import crc, xor_delta
+from stboite.grpc.v1.stboite_display_pb2 import GetCapabilitiesRequest, GetCapabilitiesResponse, RenderingRequest, RenderingResponse  # noqa: E501
+
+WIDTH, HEIGHT = 122, 250
+
+
+class RecordingDisplay(GRPCDisplay):
+    """Display recording the frames received, failing the calls with the
+    status codes of `failures` first.
+    """
+
+    def __init__(self):
+        super().__init__("127.0.0.1:0")
+        self.requests = []
+        self.failures = []
+        self.capabilities_calls = 0
+        self.preferred_type = RenderingRequest.PACKED
+        self.reject_deltas = False
+
+    def capabilities(self) -> GetCapabilitiesResponse:
+        capabilities = super().capabilities()
+        capabilities.native_width, capabilities.native_height = WIDTH, HEIGHT
+        capabilities.preferred_type = self.preferred_type
+        return capabilities
+
+    async def GetCapabilities(self, request: GetCapabilitiesRequest, context: grpc.aio.ServicerContext) -> GetCapabilitiesResponse:  # noqa: E501
+        self.capabilities_calls += 1
+        return self.capabilities()
+
+    async def DisplayRendering(self, request: RenderingRequest, context: grpc.aio.ServicerContext) -> RenderingResponse:  # noqa: E501
+        self.requests.append(request)
+        if self.failures:
+            await context.abort(self.failures.pop(0), "failure")
+        if request.delta and self.reject_deltas:
+            return RenderingResponse(status=RenderingResponse.DELTA_BASE_MISMATCH)  # noqa: E501
+        return RenderingResponse(status=RenderingResponse.OK)
+
+
+def image(black_rows: int = 0) -> np.ndarray:
+    """Returns a landscape image of random pixels, compressing badly, with
+    its first rows in black.
+    """
+    pixels = np.random.RandomState(0).random_sample((WIDTH, HEIGHT)) < 0.5
+    pixels[:black_rows] = False
+    return pixels
+
+
+class DisplayClientTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.display = RecordingDisplay()
+        await self.display.start()
+        self.client = DisplayClient(f"127.0.0.1:{self.display.port}", timeout=5, backoff=0.001)  # noqa: E501
+
+    async def asyncTearDown(self) -> None:
+        await close_channels()
+        await self.display.stop(None)
+
+    async def test_panel_is_negotiated_once(self) -> None:
+        await self.client.display(image())
+        await self.client.display(image(1))
+
+        self.assertEqual(self.display.capabilities_calls, 1)
+        request = self.display.requests[0]
+        self.assertEqual((request.type, request.width, request.height), (RenderingRequest.PACKED, HEIGHT, WIDTH))  # noqa: E501
+        self.assertEqual(len(zlib.decompress(request.data)), (WIDTH + 7) // 8 * HEIGHT)  # noqa: E501
+
+    async def test_server_without_panel_buffers_is_rejected(self) -> None:
+        self.display.preferred_type = RenderingRequest.RGBA
+        with self.assertRaises(ValueError):
+            await self.client.display(image())
+        self.assertEqual(self.display.requests, [])
+
+    async def test_given_panel_size_is_not_negotiated(self) -> None:
+        client = DisplayClient(self.client.addr, panel_size=(WIDTH, HEIGHT))
+        await client.display(image())
+        self.assertEqual(self.display.capabilities_calls, 0)
+
+    async def test_unavailable_server_is_retried(self) -> None:
+        self.display.failures = [grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.RESOURCE_EXHAUSTED]  # noqa: E501
+        response = await self.client.display(image())
+
+        self.assertEqual(response.status, RenderingResponse.OK)
+        self.assertEqual(len(self.display.requests), 3)
+
+    async def test_retries_are_limited(self) -> None:
+        self.client.retries = 1
+        self.display.failures = [grpc.StatusCode.UNAVAILABLE] * 2
+        with self.assertRaises(grpc.aio.AioRpcError) as e:
+            await self.client.display(image())
+        self.assertEqual(e.exception.code(), grpc.StatusCode.UNAVAILABLE)
+        self.assertEqual(len(self.display.requests), 2)
+
+    async def test_other_failures_are_not_retried(self) -> None:
+        self.display.failures = [grpc.StatusCode.INVALID_ARGUMENT]
+        with self.assertRaises(grpc.aio.AioRpcError):
+            await self.client.display(image())
+        self.assertEqual(len(self.display.requests), 1)
+
+    async def test_identical_frame_is_not_sent(self) -> None:
+        await self.client.display(image())
+        response = await self.client.display(image())
+
+        self.assertTrue(response.deduplicated)
+        self.assertEqual(len(self.display.requests), 1)
+
+    async def test_frames_are_sent_as_deltas(self) -> None:
+        await self.client.display(image())
+        await self.client.display(image(1))
+
+        first, second = self.display.requests
+        self.assertFalse(first.delta)
+        self.assertTrue(second.delta)
+        base = zlib.decompress(first.data)
+        self.assertEqual(second.delta_base, crc(base))
+        self.assertEqual(bytes(xor_delta(base, zlib.decompress(second.data))), self.client.pack(image(1))[2])  # noqa: E501
+
+    async def test_rejected_delta_is_sent_again_as_a_full_frame(self) -> None:
+        await self.client.display(image())
+        self.display.reject_deltas = True
+        response = await self.client.display(image(1))
+
+        self.assertEqual(response.status, RenderingResponse.OK)
+        self.assertEqual([request.delta for request in self.display.requests], [False, True, False])  # noqa: E501
+
+    async def test_failed_call_keeps_the_base(self) -> None:
+        await self.client.display(image())
+        self.display.failures = [grpc.StatusCode.INVALID_ARGUMENT]
+        with self.assertRaises(grpc.aio.AioRpcError):
+            await self.client.display(image(1))
+        await self.client.display(image(1))
+
+        # NOTE: the frame rejected has not replaced the displayed one
+        self.assertEqual([request.delta for request in self.display.requests], [False, True, True])  # noqa: E501
+        self.assertEqual(self.display.requests[1].delta_base, self.display.requests[2].delta_base)  # noqa: E501
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the NumPy frame converter against the Waveshare `getbuffer`."""
+
+import random
+import unittest
+from typing import List
+
+import numpy as np
+from PIL import Image
+
+from stboite.display.v1.converter import PIXEL_FORMATS, FrameConverter
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest
+
+
+def getbuffer(panel_width: int, panel_height: int, image: Image.Image) -> List[int]:  # noqa: E501
+    """Reference implementation: `getbuffer` of the Waveshare 2.13inch V2
+    driver, for a panel of any size.
+    """
+    linewidth = (panel_width + 7) // 8
+    buf = [0xFF] * (linewidth * panel_height)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+
+    if imwidth == panel_width and imheight == panel_height:
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    x = imwidth - x
+                    buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
+    elif imwidth == panel_height and imheight == panel_width:
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = panel_height - x - 1
+                if pixels[x, y] == 0:
+                    newy = imwidth - newy - 1
+                    buf[int(newx / 8) + newy * linewidth] &= ~(0x80 >> (y % 8))  # noqa: E501
+    return buf
+
+
+def reference_image(pixel_type: int, width: int, height: int, data: bytes) -> Image.Image:  # noqa: E501
+    """Decodes a payload as the Waveshare server did before the converter
+    (ONE payloads use one byte per pixel, any non-zero byte being white).
+    """
+    mode = PIXEL_FORMATS[pixel_type][0]
+    if pixel_type == RenderingRequest.ONE:
+        return Image.frombytes(mode, (width, height), data, "raw", "1;8")
+    return Image.frombytes(mode, (width, height), data)
+
+
+class FrameConverterTest(unittest.TestCase):
+
+    def assertMatchesGetbuffer(self, panel_width: int, panel_height: int) -> None:  # noqa: E501
+        converter = FrameConverter(panel_width, panel_height)
+        rng = random.Random(panel_width * panel_height)
+        sizes = {"portrait": (panel_width, panel_height), "landscape": (panel_height, panel_width)}  # noqa: E501
+
+        for pixel_type, (mode, depth) in PIXEL_FORMATS.items():
+            for orientation, (width, height) in sizes.items():
+                with self.subTest(mode=mode, orientation=orientation):
+                    data = bytes(rng.getrandbits(8) for _ in range(width * height * depth))  # noqa: E501
+                    expected = bytes(getbuffer(panel_width, panel_height, reference_image(pixel_type, width, height, data)))  # noqa: E501
+                    self.assertEqual(converter.convert(pixel_type, width, height, data), expected)  # noqa: E501
+
+    def test_waveshare_2in13(self) -> None:
+        self.assertMatchesGetbuffer(122, 250)
+
+    def test_odd_sizes(self) -> None:
+        self.assertMatchesGetbuffer(13, 21)
+        self.assertMatchesGetbuffer(9, 7)
+
+    def test_packed_is_copied_through(self) -> None:
+        converter = FrameConverter(122, 250)
+        data = bytes(range(256)) * (converter.buffer_size // 256) + bytes(converter.buffer_size % 256)  # noqa: E501
+        self.assertEqual(converter.convert(RenderingRequest.PACKED, 250, 122, data), data)  # noqa: E501
+
+    def test_packed_is_unpacked(self) -> None:
+        for panel_width, panel_height in [(122, 250), (13, 21)]:
+            converter = FrameConverter(panel_width, panel_height)
+            rng = np.random.RandomState(panel_width)
+            for width, height in [(panel_width, panel_height), (panel_height, panel_width)]:  # noqa: E501
+                with self.subTest(panel=(panel_width, panel_height), size=(width, height)):  # noqa: E501
+                    white = rng.rand(height, width) > 0.5
+                    self.assertTrue((converter.unpack(converter.pack(white), width, height) == white).all())  # noqa: E501
+        with self.assertRaises(ValueError):
+            converter.unpack(bytes(10), 21, 13)
+
+    def test_invalid_payload_is_rejected(self) -> None:
+        converter = FrameConverter(122, 250)
+        with self.assertRaises(ValueError):
+            converter.convert(RenderingRequest.RGB, 250, 122, bytes(10))
+        with self.assertRaises(ValueError):
+            converter.convert(RenderingRequest.L, 100, 100, bytes(100 * 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the dithering of grayscale images against scalar references."""
+
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from stboite.display.v1.converter import DITHERINGS, FrameConverter
+from stboite.display.v1.dither import ATKINSON, Kernel, error_diffusion, ordered  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest
+
+# 8x8 Bayer matrix, as published
+BAYER = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+])
+
+
+def reference_error_diffusion(gray: np.ndarray, kernel: Kernel) -> np.ndarray:  # noqa: E501
+    """Reference implementation: error diffusion processing the pixels one
+    by one, in reading order.
+    """
+    height, width = gray.shape
+    values = gray.astype(np.float32)
+    white = np.zeros((height, width), dtype=bool)
+    for y in range(height):
+        for x in range(width):
+            white[y, x] = values[y, x] >= 128
+            error = values[y, x] - np.float32(255) * white[y, x]
+            for dy, dx, weight in kernel:
+                if 0 <= y + dy < height and 0 <= x + dx < width:
+                    values[y + dy, x + dx] += np.float32(weight) * error
+    return white
+
+
+class OrderedTest(unittest.TestCase):
+
+    def test_gradient(self) -> None:
+        # NOTE: a gradient of 64 levels, one 8x8 block per level, each block
+        #       getting as many white pixels as its level
+        gray = np.tile(np.repeat(np.arange(64) * 4, 8), (16, 1))
+        white = ordered(gray)
+
+        for level in range(64):
+            with self.subTest(level=level):
+                block = white[:8, level * 8:level * 8 + 8]
+                self.assertTrue((block == (BAYER < level)).all())
+                self.assertTrue((white[8:, level * 8:level * 8 + 8] == block).all())  # noqa: E501
+
+    def test_extremes(self) -> None:
+        self.assertFalse(ordered(np.zeros((10, 13))).any())
+        self.assertTrue(ordered(np.full((10, 13), 255)).all())
+
+
+class ErrorDiffusionTest(unittest.TestCase):
+
+    def test_atkinson_matches_the_reference(self) -> None:
+        rng = np.random.RandomState(0)
+        images = {
+            "noise": rng.randint(0, 256, (37, 53)),
+            "gradient": np.tile(np.linspace(0, 255, 61), (29, 1)),
+            "flat": np.full((17, 19), 100),
+            "column": rng.randint(0, 256, (20, 1)),
+        }
+        for name, gray in images.items():
+            with self.subTest(image=name):
+                expected = reference_error_diffusion(gray, ATKINSON)
+                self.assertTrue((error_diffusion(gray.astype(np.float32), ATKINSON) == expected).all())  # noqa: E501
+
+    def test_displays_serve_atkinson_with_floyd_steinberg(self) -> None:
+        gray = np.tile(np.linspace(0, 255, 250).astype(np.uint8), (122, 1))
+        frame = FrameConverter(122, 250).convert(RenderingRequest.L, 250, 122, gray.tobytes(), DITHERINGS[RenderingRequest.ATKINSON])  # noqa: E501
+        expected = FrameConverter(122, 250).pack(np.asarray(Image.fromarray(gray).convert("1")))  # noqa: E501
+        self.assertEqual(frame, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
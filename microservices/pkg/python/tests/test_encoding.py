@@ -0,0 +1,137 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the compression and delta encoding of the payloads."""
+
+import random
+import unittest
+import zlib
+
+from stboite.display.v1.encoding import check_payload_size, crc, decompress, rle_decode, rle_encode, xor_delta  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest
+
+SIZE = 16 * 250
+
+
+def payloads():
+    """Returns panel sized payloads, from the most to the least
+    compressible.
+    """
+    rng = random.Random(0)
+    return {
+        "white": bytes([0xFF]) * SIZE,
+        "text": bytes(rng.choice((0xFF, 0xFF, 0xFF, 0x81, 0x00)) for _ in range(SIZE)),  # noqa: E501
+        "noise": bytes(rng.getrandbits(8) for _ in range(SIZE)),
+        "pairs": bytes([0x00, 0x00, 0xFF]) * (SIZE // 3) + bytes(SIZE % 3),
+    }
+
+
+class RLETest(unittest.TestCase):
+
+    def test_round_trip(self) -> None:
+        for name, data in payloads().items():
+            with self.subTest(payload=name):
+                self.assertEqual(rle_decode(rle_encode(data), len(data)), data)  # noqa: E501
+
+    def test_runs_are_compressed(self) -> None:
+        self.assertEqual(rle_encode(bytes([0xFF]) * 128), bytes([129, 0xFF]))
+        self.assertEqual(len(rle_encode(bytes([0xFF]) * SIZE)), 2 * ((SIZE + 127) // 128))  # noqa: E501
+
+    def test_invalid_payloads_are_rejected(self) -> None:
+        encoded = rle_encode(payloads()["text"])
+        for name, data, size in [
+            ("truncated", encoded[:-1], SIZE),
+            ("too short", encoded, SIZE + 1),
+            ("too long", encoded, SIZE - 1),
+            ("missing run byte", bytes([129]), 128),
+        ]:
+            with self.subTest(case=name), self.assertRaises(ValueError):
+                rle_decode(data, size)
+
+    def test_noop_header_is_skipped(self) -> None:
+        self.assertEqual(rle_decode(bytes([128, 0, 0x42]), 1), bytearray([0x42]))  # noqa: E501
+
+
+class CheckPayloadSizeTest(unittest.TestCase):
+
+    def test_encoded_payloads_are_accepted(self) -> None:
+        for name, data in payloads().items():
+            with self.subTest(payload=name):
+                check_payload_size(RenderingRequest.RAW, len(data), SIZE)
+                check_payload_size(RenderingRequest.RLE, len(rle_encode(data)), SIZE)  # noqa: E501
+                check_payload_size(RenderingRequest.ZLIB, len(zlib.compress(data, 0)), SIZE)  # noqa: E501
+                check_payload_size(RenderingRequest.ZLIB, len(zlib.compress(data, 9)), SIZE)  # noqa: E501
+
+    def test_oversized_payloads_are_rejected(self) -> None:
+        for compression, length in [
+            (RenderingRequest.RAW, SIZE - 1),
+            (RenderingRequest.RAW, SIZE + 1),
+            (RenderingRequest.RLE, SIZE + SIZE // 64),
+            (RenderingRequest.ZLIB, 2 * SIZE),
+        ]:
+            with self.subTest(compression=compression, length=length), self.assertRaises(ValueError):  # noqa: E501
+                check_payload_size(compression, length, SIZE)
+
+    def test_unknown_compression_is_rejected(self) -> None:
+        with self.assertRaises(ValueError):
+            check_payload_size(42, SIZE, SIZE)
+
+
+class DecompressTest(unittest.TestCase):
+
+    def test_zlib_round_trip(self) -> None:
+        data = payloads()["text"]
+        self.assertEqual(decompress(RenderingRequest.ZLIB, zlib.compress(data), SIZE), data)  # noqa: E501
+
+    def test_raw_is_returned_as_is(self) -> None:
+        data = payloads()["noise"]
+        self.assertIs(decompress(RenderingRequest.RAW, data, SIZE), data)
+
+    def test_zlib_never_expands_more_than_expected(self) -> None:
+        bomb = zlib.compress(bytes(100 * SIZE))
+        for name, data in [
+            ("too large", bomb),
+            ("too small", zlib.compress(bytes(SIZE - 1))),
+            ("truncated", zlib.compress(bytes(SIZE))[:-4]),
+            ("trailing data", zlib.compress(bytes(SIZE)) + b"\x00"),
+            ("corrupted", b"\x78\x9c" + bytes(16)),
+        ]:
+            with self.subTest(case=name), self.assertRaises(ValueError):
+                decompress(RenderingRequest.ZLIB, data, SIZE)
+
+
+class XORDeltaTest(unittest.TestCase):
+
+    def test_delta_round_trip(self) -> None:
+        base, frame = payloads()["text"], payloads()["noise"]
+        delta = xor_delta(base, frame)
+        self.assertEqual(xor_delta(base, bytes(delta)), frame)
+
+    def test_bytearray_is_updated_in_place(self) -> None:
+        base = payloads()["text"]
+        delta = bytearray(SIZE)
+        self.assertIs(xor_delta(base, delta), delta)
+        self.assertEqual(delta, base)
+
+    def test_size_mismatch_is_rejected(self) -> None:
+        with self.assertRaises(ValueError):
+            xor_delta(bytes(SIZE), bytes(SIZE - 1))
+
+    def test_crc_identifies_the_base(self) -> None:
+        self.assertEqual(crc(payloads()["text"]), crc(bytes(payloads()["text"])))  # noqa: E501
+        self.assertNotEqual(crc(payloads()["text"]), crc(payloads()["noise"]))  # noqa: E501
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the metrics of the display servers."""
+
+import asyncio
+import unittest
+from unittest import mock
+
+from stboite.display.v1.metrics import Counter, DisplayMetrics, Gauge, Histogram, Registry, serve_metrics  # noqa: E501
+
+
+class MetricTest(unittest.TestCase):
+
+    def test_counter_exposition(self) -> None:
+        counter = Counter("frames_total", "Frames.", ["mode"])
+        counter.labels("full").inc()
+        counter.labels("partial").inc(2)
+        counter.labels("full").inc()
+
+        self.assertEqual(counter.collect(), [
+            "# HELP frames_total Frames.",
+            "# TYPE frames_total counter",
+            'frames_total{mode="full"} 2.0',
+            'frames_total{mode="partial"} 2.0',
+        ])
+
+    def test_labels_must_match(self) -> None:
+        with self.assertRaises(ValueError):
+            Counter("frames_total", "Frames.", ["mode"]).labels()
+
+    def test_gauge_function_is_read_when_collected(self) -> None:
+        depth = [3]
+        gauge = Gauge("depth", "Depth.")
+        gauge.labels().function = lambda: depth[0]
+        depth[0] = 5
+        self.assertEqual(gauge.collect()[-1], "depth 5")
+
+    def test_histogram_buckets_are_cumulative(self) -> None:
+        histogram = Histogram("latency", "Latency.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.collect()[2:], [
+            'latency_bucket{le="0.1"} 2',
+            'latency_bucket{le="1.0"} 3',
+            'latency_bucket{le="+Inf"} 4',
+            "latency_sum 2.65",
+            "latency_count 4",
+        ])
+
+
+class DisplayMetricsTest(unittest.TestCase):
+
+    def test_deep_sleep_time_is_counted(self) -> None:
+        metrics = DisplayMetrics()
+        with mock.patch("time.monotonic", side_effect=[10.0, 12.5, 15.0, 16.0]):  # noqa: E501
+            metrics.enter_deep_sleep()
+            # NOTE: the time spent so far is exposed while still asleep
+            self.assertEqual(metrics.deep_sleep.labels().get(), 2.5)
+            metrics.leave_deep_sleep()
+            self.assertEqual(metrics.deep_sleep.labels().get(), 5.0)
+            metrics.leave_deep_sleep()
+        self.assertEqual(metrics.deep_sleep.labels().get(), 5.0)
+
+    def test_all_metrics_are_rendered(self) -> None:
+        metrics = DisplayMetrics()
+        metrics.frames_received.inc()
+        metrics.stage_duration.labels("decode").observe(0.002)
+
+        text = metrics.render()
+        self.assertIn("stboite_display_frames_received_total 1.0\n", text)
+        self.assertIn('stboite_display_stage_duration_seconds_count{stage="decode"} 1\n', text)  # noqa: E501
+        self.assertEqual(text.count("# TYPE"), len(metrics.metrics))
+
+
+class ServeMetricsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def get(self, port: int, path: str) -> bytes:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.0\r\nHost: localhost\r\n\r\n".encode())  # noqa: E501
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def test_metrics_are_served(self) -> None:
+        registry = Registry()
+        registry.register(Counter("frames_total", "Frames.")).inc()
+        server = await serve_metrics(registry, "127.0.0.1:0")
+        port = server.sockets[0].getsockname()[1]
+        try:
+            response = await self.get(port, "/metrics?format=text")
+            self.assertTrue(response.startswith(b"HTTP/1.0 200 OK\r\n"))
+            self.assertTrue(response.endswith(b"\r\n\r\n" + registry.render().encode()))  # noqa: E501
+
+            response = await self.get(port, "/")
+            self.assertTrue(response.startswith(b"HTTP/1.0 404 Not Found\r\n"))  # noqa: E501
+        finally:
+            server.close()
+            await server.wait_closed()
+
+
+if __name__ == '__main__':
+    unittest.main()
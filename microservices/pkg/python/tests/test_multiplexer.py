@@ -0,0 +1,153 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the frames forwarded by the display multiplexer."""
+
+import socket
+import unittest
+import zlib
+
+import grpc
+import numpy as np
+
+from stboite.display.v1 import GRPCDisplay
+from stboite.display.v1.converter import FrameConverter
+from stboite.display.v1.multiplexer import DisplayMultiplexer
+from stboite.grpc.v1.stboite_display_pb2 import GetCapabilitiesResponse, RenderingRequest, RenderingResponse  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+
+from typing import Optional, Tuple
+
+WIDTH, HEIGHT = 250, 122
+
+
+class RecordingDisplay(GRPCDisplay):
+    """Display recording the frames it receives."""
+
+    def __init__(self, panel: Optional[Tuple[int, int]] = None, compressions: Optional[list] = None):  # noqa: E501
+        super().__init__("127.0.0.1:0")
+        self.panel = panel
+        self.compressions = compressions
+        self.received = []
+
+    def capabilities(self) -> GetCapabilitiesResponse:
+        capabilities = super().capabilities()
+        capabilities.width, capabilities.height = WIDTH, HEIGHT
+        capabilities.pixel_types.extend([RenderingRequest.ONE, RenderingRequest.L])  # noqa: E501
+        if self.compressions is not None:
+            del capabilities.compressions[:]
+            capabilities.compressions.extend(self.compressions)
+        if self.panel:
+            capabilities.native_width, capabilities.native_height = self.panel
+            capabilities.linewidth = (self.panel[0] + 7) // 8
+            capabilities.orientation = GetCapabilitiesResponse.TRANSPOSED
+            capabilities.bit_depth = 1
+            capabilities.preferred_type = RenderingRequest.PACKED
+            capabilities.pixel_types.append(RenderingRequest.PACKED)
+        return capabilities
+
+    async def DisplayRendering(self, request: RenderingRequest, context: grpc.aio.ServicerContext) -> RenderingResponse:  # noqa: E501
+        self.received.append(request)
+        return RenderingResponse(status=RenderingResponse.OK)
+
+    def frame(self) -> bytes:
+        """Returns the payload of the last frame received, decompressed."""
+        request = self.received[-1]
+        if request.compression == RenderingRequest.ZLIB:
+            return zlib.decompress(request.data)
+        return request.data
+
+
+def white(seed: int = 0) -> np.ndarray:
+    return np.random.RandomState(seed).rand(HEIGHT, WIDTH) > 0.5
+
+
+class MultiplexerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        # NOTE: two displays of the same panel, one of them without zlib,
+        #       and a display without panel buffers
+        self.zlib = RecordingDisplay((122, 250))
+        self.raw = RecordingDisplay((122, 250), [RenderingRequest.RAW])
+        self.plain = RecordingDisplay()
+        self.displays = [self.zlib, self.raw, self.plain]
+        for display in self.displays:
+            await display.start()
+        self.addrs = [f"127.0.0.1:{display.port}" for display in self.displays]  # noqa: E501
+
+    async def asyncTearDown(self) -> None:
+        for display in self.displays:
+            await display.stop(None)
+
+    async def render(self, request: RenderingRequest, addrs: Optional[list] = None) -> RenderingResponse:  # noqa: E501
+        multiplexer = DisplayMultiplexer("127.0.0.1:0", addrs or self.addrs)
+        await multiplexer.start()
+        try:
+            async with grpc.aio.insecure_channel(f"127.0.0.1:{multiplexer.port}") as channel:  # noqa: E501
+                return await RenderingServiceStub(channel).DisplayRendering(request)  # noqa: E501
+        finally:
+            await multiplexer.stop(None)
+
+    async def test_frames_are_converted_once_per_panel(self) -> None:
+        image = white()
+        response = await self.render(RenderingRequest(type=RenderingRequest.L, width=WIDTH, height=HEIGHT, data=(image * 255).astype(np.uint8).tobytes()))  # noqa: E501
+
+        self.assertEqual(response.status, RenderingResponse.OK)
+        self.assertEqual(set(response.devices), set(self.addrs))
+        packed = FrameConverter(122, 250).pack(image)
+        self.assertEqual(self.zlib.received[0].compression, RenderingRequest.ZLIB)  # noqa: E501
+        self.assertEqual(self.raw.received[0].compression, RenderingRequest.RAW)  # noqa: E501
+        for display in (self.zlib, self.raw):
+            self.assertEqual(display.received[0].type, RenderingRequest.PACKED)
+            self.assertEqual(display.frame(), packed)
+        # NOTE: the display without panel buffers gets the frame as is
+        self.assertEqual(self.plain.received[0].type, RenderingRequest.L)
+        self.assertEqual(self.plain.frame(), (image * 255).astype(np.uint8).tobytes())  # noqa: E501
+
+    async def test_panel_buffers_are_unpacked_for_other_displays(self) -> None:  # noqa: E501
+        image = white(1)
+        packed = FrameConverter(122, 250).pack(image)
+        response = await self.render(RenderingRequest(type=RenderingRequest.PACKED, width=WIDTH, height=HEIGHT, data=packed))  # noqa: E501
+
+        self.assertEqual(response.status, RenderingResponse.OK)
+        self.assertEqual(self.zlib.frame(), packed)
+        self.assertEqual(self.raw.frame(), packed)
+        request = self.plain.received[0]
+        self.assertEqual((request.type, request.width, request.height), (RenderingRequest.ONE, WIDTH, HEIGHT))  # noqa: E501
+        self.assertEqual(self.plain.frame(), image.astype(np.uint8).tobytes())
+
+    async def test_panel_buffers_not_fitting_other_panels_are_rejected(self) -> None:  # noqa: E501
+        other = RecordingDisplay((128, 250))
+        await other.start()
+        self.displays.append(other)
+        response = await self.render(RenderingRequest(type=RenderingRequest.PACKED, width=WIDTH, height=HEIGHT, data=FrameConverter(122, 250).pack(white(2))), self.addrs[:1] + [f"127.0.0.1:{other.port}"])  # noqa: E501
+
+        self.assertEqual(response.status, RenderingResponse.INVALID_PAYLOAD)
+        self.assertEqual(response.devices[self.addrs[0]].status, RenderingResponse.OK)  # noqa: E501
+        self.assertEqual(other.received, [])
+
+    async def test_unreachable_display_is_reported(self) -> None:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            unreachable = f"127.0.0.1:{sock.getsockname()[1]}"
+        response = await self.render(RenderingRequest(type=RenderingRequest.ONE, width=WIDTH, height=HEIGHT, data=bytes(WIDTH * HEIGHT)), self.addrs + [unreachable])  # noqa: E501
+
+        self.assertEqual(response.status, RenderingResponse.UNAVAILABLE)
+        self.assertEqual(response.devices[unreachable].status, RenderingResponse.UNAVAILABLE)  # noqa: E501
+        for addr in self.addrs:
+            self.assertEqual(response.devices[addr].status, RenderingResponse.OK)  # noqa: E501
+
+
+if __name__ == '__main__':
+    unittest.main()
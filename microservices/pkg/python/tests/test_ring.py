@@ -0,0 +1,147 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the frame rings shared by the local clients."""
+
+import os
+import secrets
+import tempfile
+import unittest
+
+import grpc
+
+from stboite.display.v1 import GRPCDisplay
+from stboite.display.v1.ring import FrameRing
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest, RenderingResponse  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+
+
+class RingTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ring = FrameRing.create(f"stboite-test-{secrets.token_hex(4)}", 2, 64)  # noqa: E501
+        self.addCleanup(self.ring.unlink)
+        self.addCleanup(self.ring.close)
+
+
+class FrameRingTest(RingTestCase):
+
+    def test_slots_are_read_by_other_processes(self) -> None:
+        self.ring.write(1, b"frame")
+        reader = FrameRing.open(self.ring.name)
+        self.addCleanup(reader.close)
+
+        self.assertEqual((reader.slots, reader.slot_size), (2, 64))
+        self.assertEqual(reader.read(1, 5), b"frame")
+        # NOTE: the data read is a copy of the slot
+        self.ring.write(1, b"FRAME")
+        self.assertEqual(reader.read(1, 5), b"FRAME")
+
+    def test_invalid_slots_are_rejected(self) -> None:
+        reader = FrameRing.open(self.ring.name)
+        self.addCleanup(reader.close)
+        for index, size in [(-1, 1), (2, 1), (0, 65)]:
+            with self.subTest(index=index, size=size), self.assertRaises(ValueError):  # noqa: E501
+                reader.read(index, size)
+
+    def test_readers_do_not_map_the_ring(self) -> None:
+        reader = FrameRing.open(self.ring.name)
+        self.addCleanup(reader.close)
+        with self.assertRaises(ValueError):
+            reader.slot(0, 1)
+
+    def test_truncated_ring_cannot_be_read(self) -> None:
+        reader = FrameRing.open(self.ring.name)
+        self.addCleanup(reader.close)
+        os.truncate(FrameRing.path(self.ring.name), FrameRing.HEADER_SIZE + 70)  # noqa: E501
+
+        self.assertEqual(reader.read(0, 64), bytes(64))
+        with self.assertRaises(ValueError):
+            reader.read(1, 64)
+
+    def test_invalid_segments_are_rejected(self) -> None:
+        for size, header in [(8, b""), (FrameRing.HEADER_SIZE, b"XXXX"), (FrameRing.HEADER_SIZE + 64, None)]:  # noqa: E501
+            with self.subTest(size=size):
+                name = f"stboite-test-{secrets.token_hex(4)}"
+                path = FrameRing.path(name)
+                self.addCleanup(os.unlink, path)
+                with open(path, "wb") as file:
+                    file.write(header if header is not None else FrameRing.HEADER.pack(FrameRing.MAGIC, FrameRing.VERSION, 2, 64))  # noqa: E501
+                os.truncate(path, size)
+                with self.assertRaises(ValueError):
+                    FrameRing.open(name)
+
+    def test_names_must_be_plain_file_names(self) -> None:
+        for name in ["", "../ring", ".ring", "dir/ring"]:
+            with self.subTest(name=name), self.assertRaises(ValueError):
+                FrameRing.path(name)
+
+
+class PayloadDisplay(GRPCDisplay):
+    """Display answering with the payload it has read."""
+
+    async def DisplayRendering(self, request: RenderingRequest, context: grpc.aio.ServicerContext) -> RenderingResponse:  # noqa: E501
+        try:
+            data = self.payload(request, context)
+        except ValueError as e:
+            return RenderingResponse(status=RenderingResponse.INVALID_PAYLOAD, details=str(e))  # noqa: E501
+        return RenderingResponse(status=RenderingResponse.OK, details=data.decode())  # noqa: E501
+
+
+class PayloadTest(RingTestCase, unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        local_socket = os.path.join(directory.name, "display.sock")
+        self.display = PayloadDisplay("127.0.0.1:0", local_socket=local_socket)  # noqa: E501
+        await self.display.start()
+        self.channel = grpc.aio.insecure_channel(f"unix:{local_socket}")
+        self.stub = RenderingServiceStub(self.channel)
+
+    async def asyncTearDown(self) -> None:
+        await self.channel.close()
+        await self.display.stop(None)
+
+    def request(self, index: int = 0, size: int = 5) -> RenderingRequest:
+        return RenderingRequest(slot=RenderingRequest.SharedSlot(ring=self.ring.name, index=index, size=size))  # noqa: E501
+
+    async def test_payload_is_read_from_the_ring(self) -> None:
+        self.ring.write(0, b"frame")
+        response = await self.stub.DisplayRendering(self.request())
+        self.assertEqual((response.status, response.details), (RenderingResponse.OK, "frame"))  # noqa: E501
+
+    async def test_truncated_ring_is_rejected(self) -> None:
+        self.ring.write(1, b"frame")
+        await self.stub.DisplayRendering(self.request())
+        os.truncate(FrameRing.path(self.ring.name), FrameRing.HEADER_SIZE)
+
+        response = await self.stub.DisplayRendering(self.request(1))
+        self.assertEqual(response.status, RenderingResponse.INVALID_PAYLOAD)
+        # NOTE: the server keeps serving the other requests
+        response = await self.stub.DisplayRendering(RenderingRequest(data=b"frame"))  # noqa: E501
+        self.assertEqual(response.status, RenderingResponse.OK)
+
+    async def test_unknown_ring_is_rejected(self) -> None:
+        response = await self.stub.DisplayRendering(RenderingRequest(slot=RenderingRequest.SharedSlot(ring="stboite-test-unknown", size=1)))  # noqa: E501
+        self.assertEqual(response.status, RenderingResponse.INVALID_PAYLOAD)
+
+    async def test_rings_are_only_read_on_the_local_socket(self) -> None:
+        async with grpc.aio.insecure_channel(f"127.0.0.1:{self.display.port}") as channel:  # noqa: E501
+            response = await RenderingServiceStub(channel).DisplayRendering(self.request())  # noqa: E501
+        self.assertEqual(response.status, RenderingResponse.INVALID_PAYLOAD)
+
+
+if __name__ == '__main__':
+    unittest.main()
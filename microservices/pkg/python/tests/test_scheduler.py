@@ -0,0 +1,141 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the deadlines scheduling the maintenance of the displays."""
+
+import asyncio
+import unittest
+
+from stboite.display.v1 import GRPCDisplay
+from stboite.display.v1.scheduler import Deadline
+
+
+class DeadlineTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.calls = []
+        self.deadline = Deadline(0.05, self.callback)
+
+    async def callback(self) -> None:
+        self.calls.append(asyncio.get_running_loop().time())
+
+    async def test_expires_once_after_its_delay(self) -> None:
+        armed_at = asyncio.get_running_loop().time()
+        self.deadline.arm()
+        self.assertTrue(self.deadline.armed)
+        await asyncio.sleep(0.2)
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertGreaterEqual(self.calls[0] - armed_at, 0.05)
+        self.assertFalse(self.deadline.armed)
+
+    async def test_rearming_postpones_the_expiration(self) -> None:
+        self.deadline.arm()
+        for _ in range(4):
+            await asyncio.sleep(0.03)
+            self.deadline.arm()
+        self.assertEqual(self.calls, [])
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_explicit_delay_replaces_the_default(self) -> None:
+        self.deadline.arm(0.01)
+        await asyncio.sleep(0.03)
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_disarmed_deadline_never_expires(self) -> None:
+        self.deadline.arm()
+        self.deadline.disarm()
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.calls, [])
+
+    async def test_no_delay_disables_the_deadline(self) -> None:
+        deadline = Deadline(None, self.callback)
+        deadline.arm()
+        self.assertFalse(deadline.armed)
+
+    async def test_cancel_interrupts_the_running_callback(self) -> None:
+        started, finished = asyncio.Event(), asyncio.Event()
+
+        async def slow() -> None:
+            started.set()
+            await asyncio.sleep(1)
+            finished.set()
+        deadline = Deadline(0, slow)
+        deadline.arm()
+        await started.wait()
+        deadline.cancel()
+        await asyncio.sleep(0.01)
+        self.assertFalse(finished.is_set())
+
+    async def test_failing_callback_is_logged(self) -> None:
+        async def failing() -> None:
+            raise RuntimeError("boom")
+        deadline = Deadline(0, failing)
+        with self.assertLogs("Deadline", "ERROR"):
+            deadline.arm()
+            await asyncio.sleep(0.01)
+
+        # NOTE: the deadline can still be used
+        deadline.arm()
+        self.assertTrue(deadline.armed)
+
+
+class Display(GRPCDisplay):
+    IDLE_TIMEOUT = 0.05
+    REFRESH_INTERVAL = 0.08
+
+    def __init__(self):
+        super().__init__("127.0.0.1:0")
+        self.events = []
+
+    async def on_idle(self) -> None:
+        self.events.append("idle")
+
+    async def on_refresh_due(self) -> None:
+        self.events.append("refresh")
+
+
+class GRPCDisplaySchedulingTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.display = Display()
+        await self.display.start()
+
+    async def asyncTearDown(self) -> None:
+        await self.display.stop(None)
+
+    async def test_idle_is_suspended_while_a_frame_is_handled(self) -> None:
+        self.display.frame_received()
+        await asyncio.sleep(0.07)
+        self.assertNotIn("idle", self.display.events)
+
+        self.display.frame_handled(refreshed=False)
+        await asyncio.sleep(0.07)
+        self.assertEqual(self.display.events.count("idle"), 1)
+
+    async def test_refresh_is_rearmed_after_running(self) -> None:
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.display.events.count("refresh"), 2)
+
+    async def test_refreshed_frames_postpone_the_refresh(self) -> None:
+        for _ in range(4):
+            await asyncio.sleep(0.04)
+            self.display.frame_handled(refreshed=True)
+        self.assertNotIn("refresh", self.display.events)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the frames pushed over StreamRendering."""
+
+import asyncio
+import unittest
+
+import grpc
+
+from stboite.display.v1 import GRPCDisplay
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest, RenderingResponse  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+
+
+class LatestFrameDisplay(GRPCDisplay):
+    """Display answering the frames once `refresh` is called, the frames
+    received before the newest one being dropped.
+    """
+
+    def __init__(self):
+        super().__init__("127.0.0.1:0")
+        self.waiting = []
+        self.max_waiting = 0
+        self.displayed = []
+
+    async def DisplayRendering(self, request: RenderingRequest, context: grpc.aio.ServicerContext) -> RenderingResponse:  # noqa: E501
+        if request.data == b"fail":
+            raise RuntimeError("decoding failed")
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiting.append(waiter)
+        self.max_waiting = max(self.max_waiting, len(self.waiting))
+        await waiter
+        if waiter is not self.latest:
+            return RenderingResponse(status=RenderingResponse.OK, dropped=True)
+        self.displayed.append(request.data)
+        return RenderingResponse(status=RenderingResponse.OK)
+
+    def refresh(self) -> None:
+        """Answers the frames waiting, displaying the newest one."""
+        self.latest = self.waiting[-1]
+        for waiter in self.waiting:
+            waiter.set_result(None)
+        self.waiting = []
+
+
+class StreamRenderingTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.display = LatestFrameDisplay()
+        await self.display.start()
+        self.channel = grpc.aio.insecure_channel(f"127.0.0.1:{self.display.port}")  # noqa: E501
+        self.stub = RenderingServiceStub(self.channel)
+        self.sent = 0
+
+    async def asyncTearDown(self) -> None:
+        await self.channel.close()
+        await self.display.stop(None)
+
+    async def frames(self, payloads):
+        for data in payloads:
+            self.sent += 1
+            yield RenderingRequest(data=data)
+
+    async def wait_for_frames(self, count: int) -> None:
+        while len(self.display.waiting) < count:
+            await asyncio.sleep(0.001)
+
+    async def test_stale_frames_are_dropped(self) -> None:
+        call = self.stub.StreamRendering(self.frames([b"1", b"2", b"3"]))
+        await self.wait_for_frames(3)
+        self.display.refresh()
+        responses = [response async for response in call]
+
+        self.assertEqual([response.sequence for response in responses], [1, 2, 3])  # noqa: E501
+        self.assertEqual([response.response.dropped for response in responses], [True, True, False])  # noqa: E501
+        self.assertEqual(self.display.displayed, [b"3"])
+
+    async def test_ready_once_nothing_is_in_flight(self) -> None:
+        async def frames():
+            yield RenderingRequest(data=b"1")
+            yield RenderingRequest(data=b"2")
+            await second_sent.wait()
+            yield RenderingRequest(data=b"3")
+        second_sent = asyncio.Event()
+
+        call = self.stub.StreamRendering(frames())
+        await self.wait_for_frames(2)
+        self.display.refresh()
+        ready = [(await call.read()).ready for _ in range(2)]
+        second_sent.set()
+        await self.wait_for_frames(1)
+        self.display.refresh()
+        ready.append((await call.read()).ready)
+
+        # NOTE: the first response is sent while the second frame is still
+        #       in flight
+        self.assertEqual(ready, [False, True, True])
+        self.assertEqual(await call.read(), grpc.aio.EOF)
+
+    async def test_frames_are_not_read_while_at_the_cap(self) -> None:
+        call = self.stub.StreamRendering(self.frames([str(i).encode() for i in range(10)]))  # noqa: E501
+        await self.wait_for_frames(GRPCDisplay.MAX_STREAM_FRAMES)
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(self.display.waiting), GRPCDisplay.MAX_STREAM_FRAMES)  # noqa: E501
+
+        while self.sent < 10 or self.display.waiting:
+            if self.display.waiting:
+                self.display.refresh()
+            await asyncio.sleep(0.005)
+        responses = [response async for response in call]
+
+        self.assertEqual(len(responses), 10)
+        self.assertLessEqual(self.display.max_waiting, GRPCDisplay.MAX_STREAM_FRAMES)  # noqa: E501
+        self.assertEqual(self.display.displayed[-1], b"9")
+
+    async def test_failing_frame_does_not_end_the_stream(self) -> None:
+        call = self.stub.StreamRendering(self.frames([b"1", b"fail", b"3"]))
+        await self.wait_for_frames(2)
+        self.display.refresh()
+        responses = {response.sequence: response.response async for response in call}  # noqa: E501
+
+        self.assertEqual(responses[2].status, RenderingResponse.INTERNAL)
+        self.assertEqual(responses[3].status, RenderingResponse.OK)
+        self.assertEqual(self.display.displayed, [b"3"])
+
+
+if __name__ == '__main__':
+    unittest.main()
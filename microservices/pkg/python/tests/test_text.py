@@ -0,0 +1,99 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the text rendering from glyph atlases."""
+
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from stboite.display.v1.text import DEFAULT_FONT, Fonts
+
+
+def white_frame(width: int, height: int) -> np.ndarray:
+    return np.ones((height, width), dtype=bool)
+
+
+class GlyphAtlasTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.atlas = Fonts().atlas(DEFAULT_FONT, 0)
+        self.reference = white_frame(60, 60)
+        self.atlas.draw(self.reference, "MW", 10, 10)
+
+    def test_text_is_clipped_on_the_top_left(self) -> None:
+        frame = white_frame(20, 20)
+        self.atlas.draw(frame, "MW", -2, -3)
+
+        self.assertFalse(frame.all())
+        self.assertEqual(frame.tolist(), self.reference[13:33, 12:32].tolist())  # noqa: E501
+
+    def test_text_is_clipped_on_the_bottom_right(self) -> None:
+        frame = white_frame(20, 20)
+        self.atlas.draw(frame, "MW", 15, 15)
+
+        expected = white_frame(20, 20)
+        expected[15:, 15:] = self.reference[10:15, 10:15]
+        self.assertFalse(frame.all())
+        self.assertEqual(frame.tolist(), expected.tolist())
+
+    def test_white_text_is_drawn_over_black(self) -> None:
+        frame = ~white_frame(60, 60)
+        self.atlas.draw(frame, "MW", 10, 10, white=True)
+        self.assertEqual(frame.tolist(), (~self.reference).tolist())
+
+    def test_glyphs_past_the_right_border_are_not_looked_up(self) -> None:
+        frame = white_frame(20, 20)
+        with mock.patch.object(self.atlas, "glyph", wraps=self.atlas.glyph) as glyph:  # noqa: E501
+            self.atlas.draw(frame, "M" * 10000 + "é\nM", 0, 0)
+
+        # NOTE: the next line is still drawn
+        self.assertLess(glyph.call_count, 20)
+        self.assertEqual(glyph.call_args, mock.call("M"))
+        self.assertFalse(frame[self.atlas.line_height:].all())
+
+    def test_least_recently_used_glyphs_are_evicted(self) -> None:
+        self.atlas.GLYPH_CACHE_SIZE = 2
+        prerendered = len(self.atlas)
+        e_acute, u_umlaut = self.atlas.glyph("é"), self.atlas.glyph("ü")
+        self.assertIs(self.atlas.glyph("é"), e_acute)
+        self.atlas.glyph("ß")
+
+        self.assertEqual(len(self.atlas), prerendered + 2)
+        self.assertIs(self.atlas.glyph("é"), e_acute)
+        # NOTE: the glyph evicted is rasterized again
+        self.assertIsNot(self.atlas.glyph("ü"), u_umlaut)
+
+    def test_prerendered_glyphs_are_never_evicted(self) -> None:
+        self.atlas.GLYPH_CACHE_SIZE = 1
+        glyph = self.atlas.glyph("a")
+        for char in "éüß":
+            self.atlas.glyph(char)
+        self.assertIs(self.atlas.glyph("a"), glyph)
+
+
+class FontsTest(unittest.TestCase):
+
+    def test_atlases_are_shared(self) -> None:
+        fonts = Fonts()
+        self.assertIs(fonts.atlas(DEFAULT_FONT, 0), fonts.atlas("", 12))
+
+    def test_unknown_font_is_rejected(self) -> None:
+        with self.assertRaises(KeyError):
+            Fonts().atlas("unknown", 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the touch events streamed in batches."""
+
+import asyncio
+import unittest
+
+import grpc
+from google.protobuf.empty_pb2 import Empty
+
+from stboite.grpc.v1.stboite_input_pb2_grpc import TouchInputServiceServicer, add_TouchInputServiceServicer_to_server  # noqa: E501
+from stboite.input.v1 import GRPCTouchInput
+from stboite.input.v1.synthetic import SyntheticTouchInput, drag, tap
+
+
+class Consumer(TouchInputServiceServicer):
+    """Consumer recording the batches received, acknowledging them once
+    `gate` is set.
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.streams = 0
+        self.failures = 0
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    def events(self) -> list:
+        """Returns the points of the events received, in order."""
+        return [[(p.X, p.Y, p.Pressure) for p in event.points] for batch in self.batches for event in batch]  # noqa: E501
+
+    async def StreamTouchEvents(self, request_iterator, context):
+        self.streams += 1
+        async for batch in request_iterator:
+            self.batches.append(list(batch.events))
+            if self.failures:
+                self.failures -= 1
+                await context.abort(grpc.StatusCode.UNAVAILABLE, "consumer restarting")  # noqa: E501
+            await self.gate.wait()
+            yield Empty()
+
+
+async def until(predicate, timeout: float = 2.0) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        if loop.time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.001)
+
+
+class TouchInputTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.consumer = Consumer()
+        self.server = grpc.aio.server()
+        add_TouchInputServiceServicer_to_server(self.consumer, self.server)
+        self.addr = f"127.0.0.1:{self.server.add_insecure_port('127.0.0.1:0')}"  # noqa: E501
+        await self.server.start()
+
+    async def asyncTearDown(self) -> None:
+        await self.server.stop(None)
+
+
+class GRPCTouchInputTest(TouchInputTestCase):
+
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.input = GRPCTouchInput(self.addr, window=0.02, backoff=0.01)
+        await self.input.start()
+
+    async def test_moves_are_merged_until_acknowledged(self) -> None:
+        self.consumer.gate.clear()
+        self.input.push([(1, 1, 10)])
+        await until(lambda: self.consumer.batches)
+        for x in range(2, 7):
+            self.input.push([(x, 1, 10)])
+        self.input.push([])
+        self.consumer.gate.set()
+        await self.input.stop()
+
+        self.assertEqual(self.consumer.events(), [[(1, 1, 10)], [(6, 1, 10)], []])  # noqa: E501
+        self.assertEqual(len(self.consumer.batches), 2)
+        self.assertEqual((self.input.events_sent, self.input.events_merged), (3, 4))  # noqa: E501
+
+    async def test_moves_are_sent_after_the_window(self) -> None:
+        self.input.push([(1, 1, 10)])
+        await until(lambda: self.input.events_sent == 1)
+        self.input.push([(2, 1, 10)])
+        await asyncio.sleep(0.005)
+        self.assertEqual(len(self.consumer.batches), 1)
+
+        await until(lambda: len(self.consumer.batches) == 2)
+        await self.input.stop()
+        self.assertEqual(self.consumer.events(), [[(1, 1, 10)], [(2, 1, 10)]])  # noqa: E501
+
+    async def test_other_fingers_are_not_merged(self) -> None:
+        self.consumer.gate.clear()
+        self.input.push([(1, 1, 10)])
+        await until(lambda: self.consumer.batches)
+        self.input.push([(2, 1, 10)])
+        self.input.push([(2, 1, 10), (5, 5, 10)])
+        self.input.push([(3, 1, 10), (6, 5, 10)])
+        self.consumer.gate.set()
+        await self.input.stop()
+
+        self.assertEqual(self.consumer.events(), [
+            [(1, 1, 10)],
+            [(2, 1, 10)],
+            [(2, 1, 10), (5, 5, 10)],
+            [(3, 1, 10), (6, 5, 10)],
+        ])
+
+    async def test_released_screen_is_sent_once(self) -> None:
+        self.input.push([])
+        self.input.push([(1, 1, 10)], timestamp=1.5)
+        self.input.push([])
+        self.input.push([])
+        await self.input.stop()
+
+        self.assertEqual(self.consumer.events(), [[(1, 1, 10)], []])
+        self.assertEqual(self.consumer.batches[0][0].timestamp_us, 1_500_000)
+
+    async def test_batch_is_sent_again_on_a_new_stream(self) -> None:
+        self.consumer.failures = 1
+        self.input.push([(1, 1, 10)])
+        await until(lambda: self.input.events_sent == 1)
+        await self.input.stop()
+
+        self.assertEqual(self.consumer.streams, 2)
+        self.assertEqual(self.consumer.events(), [[(1, 1, 10)], [(1, 1, 10)]])  # noqa: E501
+
+
+class SyntheticTouchInputTest(TouchInputTestCase):
+
+    def test_gestures(self) -> None:
+        self.assertEqual(tap(3, 4, samples=2), [[(3, 4, 32)], [(3, 4, 32)]])
+        self.assertEqual(drag((0, 0), (10, 20), samples=3), [[(0, 0, 32)], [(5, 10, 32)], [(10, 20, 32)]])  # noqa: E501
+
+    async def test_gestures_are_played(self) -> None:
+        touch_input = SyntheticTouchInput(self.addr, [tap(3, 4), drag((0, 0), (10, 20), samples=10)], rate=0)  # noqa: E501
+        await touch_input.start()
+        await touch_input.wait_for_termination()
+        await touch_input.stop()
+
+        # NOTE: the presses and the releases are all sent, the moves being
+        #       merged
+        events = self.consumer.events()
+        self.assertEqual(events[0], [(3, 4, 32)])
+        self.assertEqual(events.count([]), 2)
+        self.assertEqual(events[-2:], [[(10, 20, 32)], []])
+        self.assertEqual(touch_input.events_sent + touch_input.events_merged, 17)  # noqa: E501
+
+
+if __name__ == '__main__':
+    unittest.main()
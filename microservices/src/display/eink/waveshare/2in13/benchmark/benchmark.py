@@ -0,0 +1,297 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Benchmarks of the display pipeline, from the protobuf decoding to the
+gRPC round-trip against an emulated screen.
+
+Results are written as JSON, one entry per benchmark with the latency
+statistics in seconds.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import secrets
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import grpc
+from PIL import Image, ImageDraw
+
+from stboite.display.v1.converter import PIXEL_FORMATS, FrameConverter
+from stboite.display.v1.ring import FrameRing
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))  # noqa: E501
+from epd_backend import EPDEmulator, dirty_windows  # noqa: E402
+from waveshare_2in13 import eInk_Waveshare_2in13  # noqa: E402
+
+SIZE = (250, 122)
+
+
+def frame(index: int, mode: str = "RGBA") -> Image.Image:
+    """Returns a status-like frame, different for each index."""
+    image = Image.new(mode, SIZE, "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((10, 31, 70, 91), outline="black", width=3)
+    draw.text((90, 40), "backup in progress", fill="black")
+    draw.text((90, 60), f"{index:08d}", fill="black")
+    return image
+
+
+def request(index: int, pixel_type: int = RenderingRequest.RGBA, **kwargs) -> RenderingRequest:  # noqa: E501
+    """Returns the rendering request of the frame of the given index."""
+    mode = "1" if pixel_type == RenderingRequest.ONE else PIXEL_FORMATS[pixel_type][0]  # noqa: E501
+    image = frame(index, mode)
+    # NOTE: ONE payloads use one byte per pixel
+    data = image.convert("L").tobytes() if mode == "1" else image.tobytes()
+    return RenderingRequest(type=pixel_type, width=SIZE[0], height=SIZE[1], data=data, **kwargs)  # noqa: E501
+
+
+def summary(name: str, samples: List[float], **extra) -> Dict:
+    """Returns the statistics of the given latency samples."""
+    percentiles = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99  # noqa: E501
+    return dict(
+        name=name,
+        unit="s",
+        samples=len(samples),
+        mean=statistics.fmean(samples),
+        min=min(samples),
+        p50=percentiles[49],
+        p90=percentiles[89],
+        p99=percentiles[98],
+        max=max(samples),
+        **extra,
+    )
+
+
+def measure(fn: Callable[[], object], repeat: int) -> List[float]:
+    """Returns the duration of each call of the given function."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_protobuf(repeat: int) -> List[Dict]:
+    results = []
+    for pixel_type in PIXEL_FORMATS:
+        payload = request(0, pixel_type).SerializeToString()
+        samples = measure(lambda: RenderingRequest.FromString(payload), repeat)
+        results.append(summary(f"protobuf_decode/{RenderingRequest.PixelType.Name(pixel_type)}", samples, bytes=len(payload)))  # noqa: E501
+    return results
+
+
+def bench_conversion(repeat: int) -> List[Dict]:
+    converter = FrameConverter(EPDEmulator.width, EPDEmulator.height)
+    results = []
+    for pixel_type, (mode, _) in PIXEL_FORMATS.items():
+        name = RenderingRequest.PixelType.Name(pixel_type)
+        req = request(0, pixel_type)
+        if pixel_type != RenderingRequest.ONE:
+            samples = measure(lambda: Image.frombytes(mode, SIZE, req.data), repeat)  # noqa: E501
+            results.append(summary(f"image_frombytes/{name}", samples))
+        samples = measure(lambda: converter.convert(req.type, req.width, req.height, req.data), repeat)  # noqa: E501
+        results.append(summary(f"convert/{name}", samples))
+    return results
+
+
+def bench_scheduling(repeat: int) -> List[Dict]:
+    converter = FrameConverter(EPDEmulator.width, EPDEmulator.height)
+    linewidth = converter.linewidth
+    previous = converter.convert(RenderingRequest.L, *SIZE, frame(0, "L").tobytes())  # noqa: E501
+    digit = converter.convert(RenderingRequest.L, *SIZE, frame(1, "L").tobytes())  # noqa: E501
+    inverted = bytes(~b & 0xFF for b in previous)
+
+    return [
+        summary("dirty_windows/same", measure(lambda: dirty_windows(previous, previous, linewidth), repeat)),  # noqa: E501
+        summary("dirty_windows/digit", measure(lambda: dirty_windows(previous, digit, linewidth), repeat)),  # noqa: E501
+        summary("dirty_windows/full", measure(lambda: dirty_windows(previous, inverted, linewidth), repeat)),  # noqa: E501
+    ]
+
+
+async def bench_grpc(repeat: int, clients: int, time_scale: float) -> List[Dict]:  # noqa: E501
+    epd = EPDEmulator(time_scale=time_scale)
+    service = eInk_Waveshare_2in13("127.0.0.1:0", epd)
+    await service.start()
+
+    results = []
+    try:
+        async with grpc.aio.insecure_channel(f"127.0.0.1:{service.port}") as channel:  # noqa: E501
+            stub = RenderingServiceStub(channel)
+            index = 0
+
+            async def client(wait_for_refresh: bool, samples: List[float]) -> None:  # noqa: E501
+                nonlocal index
+                for _ in range(repeat):
+                    index += 1
+                    req = request(index, wait_for_refresh=wait_for_refresh)
+                    start = time.perf_counter()
+                    await stub.DisplayRendering(req)
+                    samples.append(time.perf_counter() - start)
+
+            for concurrency in sorted({1, clients}):
+                for wait_for_refresh in (False, True):
+                    refreshes = epd.full_refreshes + epd.partial_refreshes
+                    samples: List[float] = []
+                    start = time.perf_counter()
+                    await asyncio.gather(*(client(wait_for_refresh, samples) for _ in range(concurrency)))  # noqa: E501
+                    elapsed = time.perf_counter() - start
+
+                    # NOTE: wait for the last frame to be displayed before
+                    #       counting the refreshes
+                    await stub.DisplayRendering(request(index, wait_for_refresh=True))  # noqa: E501
+
+                    name = "grpc_rendering/{}/clients={}".format("wait_for_refresh" if wait_for_refresh else "queued", concurrency)  # noqa: E501
+                    results.append(summary(
+                        name, samples,
+                        throughput=len(samples) / elapsed,
+                        refreshes=epd.full_refreshes + epd.partial_refreshes - refreshes,  # noqa: E501
+                    ))
+
+            # NOTE: frames pushed on a single stream, either as fast as
+            #       possible or only once the previous ones are handled
+            for paced in (False, True):
+                refreshes = epd.full_refreshes + epd.partial_refreshes
+                samples = []
+                dropped = 0
+                start = time.perf_counter()
+                call = stub.StreamRendering()
+                for _ in range(repeat * clients):
+                    index += 1
+                    sent = time.perf_counter()
+                    await call.write(request(index))
+                    if paced:
+                        while not (response := await call.read()).ready:
+                            dropped += response.response.dropped
+                        dropped += response.response.dropped
+                        samples.append(time.perf_counter() - sent)
+                await call.done_writing()
+                while (response := await call.read()) is not grpc.aio.EOF:
+                    dropped += response.response.dropped
+                elapsed = time.perf_counter() - start
+
+                name = "grpc_stream/{}".format("paced" if paced else "flood")
+                results.append(summary(
+                    name, samples or [elapsed],
+                    throughput=repeat * clients / elapsed,
+                    dropped=dropped,
+                    refreshes=epd.full_refreshes + epd.partial_refreshes - refreshes,  # noqa: E501
+                ))
+
+            # NOTE: duplicated frames must not refresh the screen
+            req = request(index)
+            await stub.DisplayRendering(req)
+            samples = [await _timed(stub.DisplayRendering(req)) for _ in range(repeat)]  # noqa: E501
+            results.append(summary("grpc_rendering/deduplicated", samples))
+    finally:
+        await service.stop(None)
+
+    return results
+
+
+async def bench_local(repeat: int, time_scale: float) -> List[Dict]:
+    """Compares the transports of co-located clients: TCP, Unix socket and
+    Unix socket with the frames passed through a frame ring.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        local_socket = os.path.join(tmpdir, "display.sock")
+        service = eInk_Waveshare_2in13("127.0.0.1:0", EPDEmulator(time_scale=time_scale), local_socket=local_socket)  # noqa: E501
+        await service.start()
+
+        ring = FrameRing.create(f"stboite-benchmark-{secrets.token_hex(4)}", 1, SIZE[0] * SIZE[1] * 4)  # noqa: E501
+        try:
+            for name, addr, shared in (
+                ("tcp", f"127.0.0.1:{service.port}", False),
+                ("unix", f"unix:{local_socket}", False),
+                ("unix_frame_ring", f"unix:{local_socket}", True),
+            ):
+                async with grpc.aio.insecure_channel(addr) as channel:
+                    stub = RenderingServiceStub(channel)
+                    samples = []
+                    for index in range(repeat):
+                        data = frame(index).tobytes()
+                        start = time.perf_counter()
+                        if shared:
+                            ring.write(0, data)
+                            req = RenderingRequest(
+                                type=RenderingRequest.RGBA, width=SIZE[0], height=SIZE[1],  # noqa: E501
+                                slot=RenderingRequest.SharedSlot(ring=ring.name, index=0, size=len(data)),  # noqa: E501
+                            )
+                        else:
+                            req = RenderingRequest(type=RenderingRequest.RGBA, width=SIZE[0], height=SIZE[1], data=data)  # noqa: E501
+                        await stub.DisplayRendering(req)
+                        samples.append(time.perf_counter() - start)
+                    results.append(summary(f"grpc_local/{name}", samples))
+        finally:
+            ring.close()
+            ring.unlink()
+            await service.stop(None)
+
+    return results
+
+
+async def _timed(call) -> float:
+    start = time.perf_counter()
+    await call
+    return time.perf_counter() - start
+
+
+async def main(args: argparse.Namespace) -> Dict:
+    results = []
+    results += bench_protobuf(args.repeat)
+    results += bench_conversion(args.repeat)
+    results += bench_scheduling(args.repeat)
+    results += await bench_grpc(args.grpc_repeat, args.clients, args.time_scale)  # noqa: E501
+    results += await bench_local(args.grpc_repeat, args.time_scale)
+
+    return dict(
+        environment=dict(
+            python=platform.python_version(),
+            machine=platform.machine(),
+            grpc=grpc.__version__,
+            time_scale=args.time_scale,
+        ),
+        benchmarks=results,
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the Waveshare 2.13inch display pipeline.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument("-o", "--output", help="JSON file to write the results to (stdout if not set).", default=None)  # noqa: E501
+    parser.add_argument("--repeat", help="Number of samples of the local benchmarks.", type=int, default=200)  # noqa: E501
+    parser.add_argument("--grpc-repeat", help="Number of frames sent by each gRPC client.", type=int, default=20)  # noqa: E501
+    parser.add_argument("--clients", help="Number of concurrent gRPC clients.", type=int, default=8)  # noqa: E501
+    parser.add_argument("--time-scale", help="Factor applied to the latencies of the emulated screen.", type=float, default=0.01)  # noqa: E501
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
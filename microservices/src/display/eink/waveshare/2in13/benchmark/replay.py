@@ -0,0 +1,205 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Replays the requests recorded by a display server (see --capture-file)
+against a real or an emulated screen.
+
+The requests are sent at their original pace, scaled by --speed (0 to send
+them as fast as possible), and the report holds the latency statistics of
+each method, the status of the responses and the number of refreshes.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import urllib.request
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import grpc
+
+from stboite.display.v1.capture import CapturedCall, read_capture
+from stboite.grpc.v1 import stboite_display_pb2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))  # noqa: E501
+from benchmark import summary  # noqa: E402
+from epd_backend import EPDEmulator  # noqa: E402
+from waveshare_2in13 import eInk_Waveshare_2in13  # noqa: E402
+
+SERVICE = stboite_display_pb2.DESCRIPTOR.services_by_name["RenderingService"]  # noqa: E501
+REFRESHES = re.compile(r'^stboite_display_refreshes_total\{mode="(\w+)"\} (\S+)$', re.MULTILINE)  # noqa: E501
+
+
+def refreshes(metrics_url: str) -> Dict[str, int]:
+    """Returns the refreshes counted by a display server, by mode."""
+    with urllib.request.urlopen(metrics_url) as response:
+        metrics = response.read().decode()
+    return {mode: int(float(value)) for mode, value in REFRESHES.findall(metrics)}  # noqa: E501
+
+
+class Replay:
+    """Sends captured calls to a display server and measures their
+    latency.
+
+    The frames of the streaming calls are sent on a single stream, their
+    latency being the time until their response.
+    """
+
+    def __init__(self, channel: grpc.aio.Channel):
+        self.channel = channel
+        self.samples: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Counter] = {}
+        self.__stream: Optional[grpc.aio.StreamStreamCall] = None
+        self.__stream_sent: List[float] = []
+        self.__stream_reader: Optional[asyncio.Task] = None
+        # NOTE: a stream only accepts one pending write
+        self.__stream_lock = asyncio.Lock()
+
+    async def send(self, call: CapturedCall) -> None:
+        """Sends a captured call, as serialized when captured."""
+        name = call.method.rsplit("/", 1)[-1]
+        method = SERVICE.methods_by_name.get(name)
+        if method is None:
+            raise ValueError(f"unknown method {call.method!r}")
+        response_type = getattr(stboite_display_pb2, method.output_type.name)
+
+        if method.client_streaming:
+            if self.__stream is None:
+                self.__stream = self.channel.stream_stream(call.method, response_deserializer=response_type.FromString)()  # noqa: E501
+                self.__stream_reader = asyncio.create_task(self.__read_stream(name))  # noqa: E501
+            async with self.__stream_lock:
+                self.__stream_sent.append(time.perf_counter())
+                await self.__stream.write(call.request)
+            return
+
+        start = time.perf_counter()
+        response = await self.channel.unary_unary(call.method, response_deserializer=response_type.FromString)(call.request)  # noqa: E501
+        self.__record(name, time.perf_counter() - start, response)
+
+    async def close(self) -> None:
+        """Waits for the responses of the frames sent on the stream."""
+        if self.__stream is not None:
+            async with self.__stream_lock:
+                await self.__stream.done_writing()
+            await self.__stream_reader
+
+    async def __read_stream(self, name: str) -> None:
+        while (response := await self.__stream.read()) is not grpc.aio.EOF:
+            sent = self.__stream_sent[response.sequence - 1]
+            self.__record(name, time.perf_counter() - sent, response.response)
+
+    def __record(self, name: str, latency: float, response) -> None:
+        self.samples.setdefault(name, []).append(latency)
+        # NOTE: only the rendering responses have a status
+        if hasattr(response, "status"):
+            status = "dropped" if response.dropped else stboite_display_pb2.RenderingResponse.StatusCode.Name(response.status)  # noqa: E501
+            self.statuses.setdefault(name, Counter())[status] += 1
+
+
+async def replay(calls: List[CapturedCall], addr: str, speed: float) -> Tuple[Replay, float]:  # noqa: E501
+    """Sends the captured calls to a display server, each call being sent
+    at its original time (divided by `speed`) without waiting for the
+    previous ones to complete.
+
+    Returns:
+      The replay, with the latency samples, and its duration in seconds.
+    """
+    async with grpc.aio.insecure_channel(addr) as channel:
+        session = Replay(channel)
+        tasks = []
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for call in calls:
+            if speed > 0:
+                delay = start + (call.timestamp - calls[0].timestamp) / speed - loop.time()  # noqa: E501
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(session.send(call)))
+            # NOTE: let the call be sent before the next one
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        await session.close()
+        return session, loop.time() - start
+
+
+async def main(args: argparse.Namespace) -> Dict:
+    calls = list(read_capture(args.capture))
+    if not calls:
+        raise ValueError(f"{args.capture} holds no request")
+
+    epd = None
+    if args.addr:
+        addr = args.addr
+    else:
+        epd = EPDEmulator(time_scale=args.time_scale)
+        service = eInk_Waveshare_2in13("127.0.0.1:0", epd)
+        await service.start()
+        addr = f"127.0.0.1:{service.port}"
+
+    try:
+        before = refreshes(args.metrics_url) if args.metrics_url else {}
+        session, elapsed = await replay(calls, addr, args.speed)
+        if epd is not None:
+            counts = dict(full=epd.full_refreshes, partial=epd.partial_refreshes)  # noqa: E501
+        elif args.metrics_url:
+            after = refreshes(args.metrics_url)
+            counts = {mode: count - before.get(mode, 0) for mode, count in after.items()}  # noqa: E501
+        else:
+            counts = None
+    finally:
+        if epd is not None:
+            await service.stop(None)
+
+    return dict(
+        environment=dict(
+            capture=args.capture,
+            addr=args.addr or "emulator",
+            speed=args.speed,
+            time_scale=None if args.addr else args.time_scale,
+        ),
+        requests=len(calls),
+        captured_duration=calls[-1].timestamp - calls[0].timestamp,
+        duration=elapsed,
+        refreshes=counts,
+        methods=[
+            summary(name, samples, statuses=dict(session.statuses.get(name, {})))  # noqa: E501
+            for name, samples in sorted(session.samples.items())
+        ],
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Replays the requests captured by a display server.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument("capture", help="Capture file written by the display server.")  # noqa: E501
+    parser.add_argument("-o", "--output", help="JSON file to write the report to (stdout if not set).", default=None)  # noqa: E501
+    parser.add_argument("--addr", help="Address of the display server to replay the requests against (in-process emulated screen if not set).", default=None)  # noqa: E501
+    parser.add_argument("--metrics-url", help="Prometheus metrics of the display server, to count its refreshes (ignored with the emulated screen).", default=None)  # noqa: E501
+    parser.add_argument("--speed", help="Factor applied to the pace of the requests (0 to send them as fast as possible).", type=float, default=1.0)  # noqa: E501
+    parser.add_argument("--time-scale", help="Factor applied to the latencies of the emulated screen.", type=float, default=1.0)  # noqa: E501
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
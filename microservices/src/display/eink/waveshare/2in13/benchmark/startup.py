@@ -0,0 +1,139 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Startup time of the display server, started as a new process with an
+emulated screen, from its launch to:
+
+  - the end of its imports (measured separately, by a process importing
+    the server module and exiting);
+  - the first GetCapabilities call answered;
+  - the first frame displayed (DisplayRendering with wait_for_refresh).
+
+Results are written as JSON, one entry per measure and startup mode with
+the latency statistics in seconds.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import grpc
+
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+from stboite.grpc.v1.stboite_display_pb2 import GetCapabilitiesRequest
+
+from benchmark import request, summary
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "waveshare_2in13.py")  # noqa: E501
+
+# Delay between two connection attempts, in seconds
+POLL_INTERVAL = 0.002
+
+
+def free_port() -> int:
+    """Returns a TCP port currently free on the loopback interface."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_imports() -> float:
+    """Returns the time taken by a new process to import the server."""
+    directory = os.path.dirname(SERVER)
+    started_at = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import waveshare_2in13"], cwd=directory, check=True)  # noqa: E501
+    return time.perf_counter() - started_at
+
+
+async def measure_startup(args: List[str], timeout: float) -> Dict[str, float]:  # noqa: E501
+    """Starts the server with the given arguments and returns the time
+    taken to answer its first calls.
+    """
+    addr = f"127.0.0.1:{free_port()}"
+    started_at = time.perf_counter()
+    process = subprocess.Popen([sys.executable, SERVER, "--emulator", "--log-level", "warning", "--listen-addr", addr, *args])  # noqa: E501
+    try:
+        # NOTE: a new channel is opened for each attempt, a channel failing
+        #       to connect waiting at least 100ms before its next attempt
+        while True:
+            channel = grpc.aio.insecure_channel(addr)
+            try:
+                await RenderingServiceStub(channel).GetCapabilities(GetCapabilitiesRequest(), timeout=timeout)  # noqa: E501
+                break
+            except grpc.aio.AioRpcError as e:
+                if e.code() != grpc.StatusCode.UNAVAILABLE or time.perf_counter() - started_at > timeout:  # noqa: E501
+                    raise
+                await channel.close()
+                await asyncio.sleep(POLL_INTERVAL)
+        answered = time.perf_counter() - started_at
+
+        async with channel:
+            await RenderingServiceStub(channel).DisplayRendering(request(0, wait_for_refresh=True), timeout=timeout)  # noqa: E501
+            displayed = time.perf_counter() - started_at
+    finally:
+        process.terminate()
+        process.wait()
+    return dict(first_call=answered, first_frame=displayed)
+
+
+async def main(args: argparse.Namespace) -> Dict:
+    modes = {"eager": [], "fast": ["--fast-start"]}
+    results: List[Dict] = [summary("imports", [measure_imports() for _ in range(args.repeat)])]  # noqa: E501
+
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, mode_args in modes.items():
+            if args.restart:
+                # NOTE: the state is left by a first run, as after a restart
+                mode_args = [*mode_args, "--state-file", os.path.join(directory, f"{mode}.state")]  # noqa: E501
+                await measure_startup(mode_args, args.timeout)
+
+            samples: Dict[str, List[float]] = {}
+            for _ in range(args.repeat):
+                for name, value in (await measure_startup(mode_args, args.timeout)).items():  # noqa: E501
+                    samples.setdefault(name, []).append(value)
+            results.extend(summary(f"{name}/{mode}", values) for name, values in samples.items())  # noqa: E501
+
+    return dict(
+        python=platform.python_version(),
+        machine=platform.machine(),
+        restart=args.restart,
+        results=results,
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Startup time of the display server with an emulated screen.",  # noqa: E501
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("-o", "--output", help="JSON file to write the results to (stdout if not set).", default=None)  # noqa: E501
+    parser.add_argument("--repeat", help="Number of startups measured for each mode.", type=int, default=5)  # noqa: E501
+    parser.add_argument("--restart", help="Start the server with the state left by a previous run, instead of a blank screen.", action="store_true")  # noqa: E501
+    parser.add_argument("--timeout", help="Maximum time to wait for each call, in seconds.", type=float, default=30.0)  # noqa: E501
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
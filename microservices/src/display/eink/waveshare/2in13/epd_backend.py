@@ -0,0 +1,411 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Backends driving the Waveshare 2.13inch eInk screen"""
+
+import abc
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Window defines a rectangular area of the panel buffer as
+# (first row, first byte column, last row, last byte column), all inclusive.
+Window = Tuple[int, int, int, int]
+
+
+class EPDBackend(abc.ABC):
+    """Interface between the display server and an eInk panel.
+
+    Frames are exchanged as panel buffers: one bit per pixel (0 is black),
+    `linewidth` bytes per row and `height` rows, in the panel native
+    orientation.
+    """
+
+    # Panel size, in its native orientation
+    width: int = 122
+    height: int = 250
+
+    @property
+    def linewidth(self) -> int:
+        """Number of bytes of a panel buffer row."""
+        return (self.width + 7) // 8
+
+    @abc.abstractmethod
+    def init_full_update(self) -> None:
+        """Initializes the panel for full refreshes."""
+
+    @abc.abstractmethod
+    def init_partial_update(self) -> None:
+        """Initializes the panel for partial refreshes."""
+
+    @abc.abstractmethod
+    def clear(self, color: int) -> None:
+        """Fills the whole panel with the given byte."""
+
+    @abc.abstractmethod
+    def display_base(self, frame: bytes) -> None:
+        """Fully refreshes the panel with the given frame, which becomes the
+        base image of the next partial refreshes.
+        """
+
+    @abc.abstractmethod
+    def display_partial(self,
+                        frame: bytes,
+                        windows: Optional[Sequence[Window]] = None) -> None:
+        """Partially refreshes the panel with the given frame.
+
+        Args:
+          frame: the whole panel buffer.
+          windows: the areas of the frame that changed since the last
+            refresh, or None to send the whole frame.
+        """
+
+    @abc.abstractmethod
+    def restore(self, frame: bytes) -> None:
+        """Loads the frame already shown by the panel (e.g. before a restart
+        of the server) as the base image of the next partial refreshes,
+        without refreshing the panel.
+        """
+
+    @abc.abstractmethod
+    def sleep(self) -> None:
+        """Enters the panel in deep sleep mode."""
+
+    @abc.abstractmethod
+    def exit(self) -> None:
+        """Releases the hardware resources used by the panel."""
+
+
+class Waveshare2in13V2(EPDBackend):
+    """Backend using the Waveshare Touch e-Paper HAT library"""
+
+    def __init__(self):
+        from TP_lib import epd2in13_V2
+
+        self.__epd = epd2in13_V2.EPD_2IN13_V2()
+        self.width = self.__epd.width
+        self.height = self.__epd.height
+
+    def init_full_update(self) -> None:
+        self.__epd.init(self.__epd.FULL_UPDATE)
+
+    def init_partial_update(self) -> None:
+        self.__epd.init(self.__epd.PART_UPDATE)
+
+    def clear(self, color: int) -> None:
+        self.__epd.Clear(color)
+
+    def display_base(self, frame: bytes) -> None:
+        self.__epd.displayPartBaseImage(frame)
+
+    def display_partial(self,
+                        frame: bytes,
+                        windows: Optional[Sequence[Window]] = None) -> None:
+        if windows is None:
+            self.__epd.displayPartial_Wait(frame)
+            return
+
+        # NOTE: the panel RAM is written from the last row to the first one
+        #       (data entry mode 0x01: X increment, Y decrement)
+        last_row = self.height - 1
+        for (row0, col0, row1, col1) in windows:
+            self.__set_window(col0, last_row - row0, col1, last_row - row1)
+            window = np.frombuffer(frame, dtype=np.uint8).reshape(-1, self.linewidth)[row0:row1 + 1, col0:col1 + 1]  # noqa: E501
+            self.__write_ram(0x24, window.tobytes())
+            self.__set_window(col0, last_row - row0, col1, last_row - row1)
+            self.__write_ram(0x26, (~window).tobytes())
+
+        # NOTE: restore the whole RAM window expected by the full frame
+        #       operations of the Waveshare library
+        self.__set_window(0, last_row, self.linewidth - 1, 0)
+
+        self.__epd.send_command(0x22)
+        self.__epd.send_data(0x0C)
+        self.__epd.send_command(0x20)
+        self.__epd.ReadBusy()
+
+    def restore(self, frame: bytes) -> None:
+        # NOTE: same RAM writes as `displayPartBaseImage`, without turning
+        #       on the display
+        last_row = self.height - 1
+        self.__set_window(0, last_row, self.linewidth - 1, 0)
+        self.__write_ram(0x24, frame)
+        self.__set_window(0, last_row, self.linewidth - 1, 0)
+        self.__write_ram(0x26, frame)
+
+    def sleep(self) -> None:
+        self.__epd.sleep()
+
+    def exit(self) -> None:
+        self.__epd.Dev_exit()
+
+    def __set_window(self, x_start: int, y_start: int, x_end: int, y_end: int) -> None:  # noqa: E501
+        self.__send(0x44, bytes([x_start, x_end]))  # RAM X start/end (in bytes)  # noqa: E501
+        self.__send(0x45, bytes([y_start & 0xFF, y_start >> 8, y_end & 0xFF, y_end >> 8]))  # RAM Y start/end  # noqa: E501
+        self.__send(0x4E, bytes([x_start]))  # RAM X address counter
+        self.__send(0x4F, bytes([y_start & 0xFF, y_start >> 8]))  # RAM Y address counter  # noqa: E501
+
+    def __write_ram(self, command: int, data: bytes) -> None:
+        self.__send(command, data)
+
+    def __send(self, command: int, data: bytes) -> None:
+        self.__epd.send_command(command)
+        # NOTE: the data is sent in a single SPI transfer, instead of one
+        #       transfer per byte with `send_data`
+        self.__epd.send_data2(data)
+
+
+class EPDEmulator(EPDBackend):
+    """In-memory emulation of the Waveshare 2.13inch V2 screen
+
+    The emulator keeps the displayed frame in memory, counts the panel
+    operations and blocks the calling thread as long as the real panel
+    would, so the server can be run and measured without the HAT.
+    """
+
+    # Latencies of the real panel, in seconds
+    INIT_FULL_LATENCY = 0.5
+    INIT_PARTIAL_LATENCY = 0.45
+    FULL_REFRESH_LATENCY = 2.0
+    PARTIAL_REFRESH_LATENCY = 0.3
+    SLEEP_LATENCY = 2.0
+    # Time needed to send one byte to the panel RAM
+    SPI_BYTE_LATENCY = 20e-6
+
+    def __init__(self, time_scale: float = 1.0, snapshot: Optional[str] = None):  # noqa: E501
+        """Creates an emulated screen.
+
+        Args:
+          time_scale: factor applied to the latencies of the real panel, 0
+            to never block.
+          snapshot: path of a PNG file updated after each refresh.
+        """
+        self.time_scale = time_scale
+        self.snapshot = snapshot
+
+        self.framebuffer = bytearray([0xFF]) * (self.linewidth * self.height)  # noqa: E501
+        self.asleep = True
+        self.init_cycles = 0
+        self.full_refreshes = 0
+        self.partial_refreshes = 0
+        self.sleep_cycles = 0
+        self.bytes_sent = 0
+        self.__lock = threading.Lock()
+
+    def init_full_update(self) -> None:
+        with self.__lock:
+            self.__wait(self.INIT_FULL_LATENCY)
+            self.asleep = False
+            self.init_cycles += 1
+
+    def init_partial_update(self) -> None:
+        with self.__lock:
+            self.__wait(self.INIT_PARTIAL_LATENCY)
+            self.asleep = False
+            self.init_cycles += 1
+
+    def clear(self, color: int) -> None:
+        self.display_base(bytes([color]) * len(self.framebuffer))
+
+    def display_base(self, frame: bytes) -> None:
+        with self.__lock:
+            self.__check_awake()
+            self.__wait(2 * len(frame) * self.SPI_BYTE_LATENCY + self.FULL_REFRESH_LATENCY)  # noqa: E501
+            self.framebuffer[:] = frame
+            self.bytes_sent += 2 * len(frame)
+            self.full_refreshes += 1
+            self.__save_snapshot()
+
+    def display_partial(self,
+                        frame: bytes,
+                        windows: Optional[Sequence[Window]] = None) -> None:
+        with self.__lock:
+            self.__check_awake()
+            if windows is None:
+                windows = [(0, 0, self.height - 1, self.linewidth - 1)]
+
+            screen = np.frombuffer(self.framebuffer, dtype=np.uint8).reshape(-1, self.linewidth)  # noqa: E501
+            source = np.frombuffer(frame, dtype=np.uint8).reshape(-1, self.linewidth)  # noqa: E501
+            sent = 0
+            for (row0, col0, row1, col1) in windows:
+                screen[row0:row1 + 1, col0:col1 + 1] = source[row0:row1 + 1, col0:col1 + 1]  # noqa: E501
+                sent += 2 * (row1 - row0 + 1) * (col1 - col0 + 1)
+
+            self.__wait(sent * self.SPI_BYTE_LATENCY + self.PARTIAL_REFRESH_LATENCY)  # noqa: E501
+            self.bytes_sent += sent
+            self.partial_refreshes += 1
+            self.__save_snapshot()
+
+    def restore(self, frame: bytes) -> None:
+        with self.__lock:
+            self.__check_awake()
+            self.__wait(2 * len(frame) * self.SPI_BYTE_LATENCY)
+            # NOTE: the emulated panel has lost its content with the previous
+            #       process, unlike a real one
+            self.framebuffer[:] = frame
+            self.bytes_sent += 2 * len(frame)
+            self.__save_snapshot()
+
+    def sleep(self) -> None:
+        with self.__lock:
+            self.__wait(self.SLEEP_LATENCY)
+            self.asleep = True
+            self.sleep_cycles += 1
+
+    def exit(self) -> None:
+        logging.getLogger("EPDEmulator").info(
+            "emulated screen stopped after %d full refreshes, %d partial refreshes and %d sleep cycles",  # noqa: E501
+            self.full_refreshes, self.partial_refreshes, self.sleep_cycles
+        )
+
+    def image(self) -> "Image.Image":
+        """Returns the displayed frame, as a landscape black and white
+        image.
+        """
+        from PIL import Image
+
+        bits = np.unpackbits(np.frombuffer(self.framebuffer, dtype=np.uint8).reshape(-1, self.linewidth), axis=1)  # noqa: E501
+        return Image.fromarray(bits[:, :self.width].T.astype(bool))
+
+    def save(self, path: str) -> None:
+        """Dumps the displayed frame to the given PNG file."""
+        self.image().save(path, format="PNG")
+
+    def __check_awake(self) -> None:
+        if self.asleep:
+            raise RuntimeError("the screen must be initialized before being refreshed")  # noqa: E501
+
+    def __wait(self, latency: float) -> None:
+        if self.time_scale > 0:
+            time.sleep(latency * self.time_scale)
+
+    def __save_snapshot(self) -> None:
+        if self.snapshot:
+            self.save(self.snapshot)
+
+
+class GhostingPolicy:
+    """Decides when the panel must be fully refreshed, according to the
+    partial refreshes undergone by each of its pixels.
+
+    Partial refreshes leave a faint trace of the previous content (ghosting)
+    on the pixels they change. Instead of fully refreshing the panel after a
+    fixed number of partial refreshes, the policy counts how many times each
+    pixel changed since the last full refresh and only asks for a full
+    refresh once one of them exceeds its budget. Frames changing a small
+    area (like a clock) can then be displayed much longer with partial
+    refreshes than frames changing the whole panel.
+    """
+
+    def __init__(self,
+                 width: int,
+                 height: int,
+                 budget: int = 15,
+                 max_partial_refreshes: Optional[int] = 100):
+        """Creates a policy for a panel of the given native size.
+
+        Args:
+          width: the panel width, in its native orientation.
+          height: the panel height, in its native orientation.
+          budget: number of changes of a pixel after which the panel must
+            be fully refreshed.
+          max_partial_refreshes: number of partial refreshes after which
+            the panel must be fully refreshed, whatever changed, or None
+            for no limit.
+
+        Raises:
+          ValueError: the budget is not between 1 and 254.
+        """
+        if not 0 < budget < 255:
+            raise ValueError("ghosting budget must be between 1 and 254")
+
+        self.budget = budget
+        self.max_partial_refreshes = max_partial_refreshes
+        self.linewidth = (width + 7) // 8
+        # NOTE: one byte per pixel, saturated as full refreshes may be
+        #       postponed past the budget
+        self.counts = np.zeros((height, self.linewidth * 8), dtype=np.uint8)
+        self.partial_refreshes = 0
+
+    def record(self, previous: bytes, current: bytes) -> None:
+        """Counts the pixels changed by the partial refresh from the
+        `previous` panel buffer to the `current` one.
+        """
+        changed = np.unpackbits(np.bitwise_xor(np.frombuffer(previous, dtype=np.uint8), np.frombuffer(current, dtype=np.uint8)))  # noqa: E501
+        np.add(self.counts, changed.reshape(self.counts.shape), out=self.counts, where=self.counts < 255)  # noqa: E501
+        self.partial_refreshes += 1
+
+    def full_refresh_due(self, budget: bool = True) -> bool:
+        """Returns whether the ghosting budget of the panel is exhausted.
+
+        Args:
+          budget: whether the budget of the pixels is checked, the limit of
+            partial refreshes being always checked.
+        """
+        if self.max_partial_refreshes is not None and self.partial_refreshes >= self.max_partial_refreshes:  # noqa: E501
+            return True
+        return budget and int(self.counts.max()) >= self.budget
+
+    def reset(self) -> None:
+        """Resets the counts, once the panel has been fully refreshed."""
+        self.counts.fill(0)
+        self.partial_refreshes = 0
+
+
+def dirty_windows(previous: bytes,
+                  current: bytes,
+                  linewidth: int,
+                  max_gap: int = 4) -> List[Window]:
+    """Computes the areas of the panel buffer that differ between two frames.
+
+    Changed rows are grouped in bands, split when more than `max_gap`
+    unchanged rows separate them; each band is reduced to the byte columns
+    that changed.
+
+    Args:
+      previous: the panel buffer currently displayed.
+      current: the panel buffer to display.
+      linewidth: number of bytes of a panel buffer row.
+      max_gap: number of unchanged rows above which a band is split.
+
+    Returns:
+      The list of windows that changed, empty when both frames are the same.
+    """
+    diff = (np.frombuffer(previous, dtype=np.uint8) != np.frombuffer(current, dtype=np.uint8)).reshape(-1, linewidth)  # noqa: E501
+    rows = np.flatnonzero(diff.any(axis=1))
+    if rows.size == 0:
+        return []
+
+    splits = np.flatnonzero(np.diff(rows) > max_gap + 1)
+    starts = np.concatenate((rows[:1], rows[splits + 1]))
+    ends = np.concatenate((rows[splits], rows[-1:]))
+
+    windows = []
+    for start, end in zip(starts, ends):
+        columns = np.flatnonzero(diff[start:end + 1].any(axis=0))
+        windows.append((int(start), int(columns[0]), int(end), int(columns[-1])))  # noqa: E501
+    return windows
+
+
+def region_window(x: int, y: int, width: int, height: int) -> Window:
+    """Converts an area of a landscape (250x122) frame into the panel
+    buffer window covering it.
+    """
+    return (x, y // 8, x + width - 1, (y + height - 1) // 8)
@@ -15,34 +15,44 @@
 
 import argparse
 import asyncio
-import grpc
 import logging
 import os
 
 from PIL import Image, ImageDraw, ImageChops, ImageFont
 
-from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
-from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest, RenderingResponse
+from stboite.display.v1.client import DisplayClient, close_channels
+from stboite.grpc.v1.stboite_display_pb2 import ComposeFrameRequest, RenderingResponse  # noqa: E501
 
-async def run(addr: str) -> None:
-    async with grpc.aio.insecure_channel(target=addr) as channel:
-        stub = RenderingServiceStub(channel)
+async def run(addr: str, use_assets: bool, frame_ring: int) -> None:
+    client = DisplayClient(addr, frame_ring=frame_ring)
 
-        curdir = os.path.dirname(os.path.realpath(__file__))
-        image = Image.new('RGBA', (250, 122), '#ffffff')
+    curdir = os.path.dirname(os.path.realpath(__file__))
+    image = Image.new('RGBA', (250, 122), '#ffffff')
 
-        # SyncThings logo
-        imagedir = os.path.join(curdir, 'assets/images')
-        logo = Image.open(os.path.join(imagedir, 'logo.syncthings.bmp'))
-        image.paste(logo, (10, 31))
+    # SyncThings logo
+    imagedir = os.path.join(curdir, 'assets/images')
+    logo = Image.open(os.path.join(imagedir, 'logo.syncthings.bmp'))
 
-        response = await stub.DisplayRendering(RenderingRequest(
-            type=RenderingRequest.PixelType.RGBA,
-            width=250,
-            height=122,
-            data=image.tobytes(),
-        ))
+    try:
+        if use_assets:
+            # NOTE: the logo is only sent once, the frames then refer to it
+            response = await client.upload_asset('logo.syncthings', logo)
+            print(f"upload status: {RenderingResponse.StatusCode.Name(response.status)}, details: {response.details}") # noqa
+
+            response = await client.compose_frame(ComposeFrameRequest(
+                width=250,
+                height=122,
+                assets=[ComposeFrameRequest.Placement(asset_id='logo.syncthings', x=10, y=31)],  # noqa: E501
+            ))
+        else:
+            image.paste(logo, (10, 31))
+            # NOTE: the frame is converted and packed for the screen before
+            #       being sent
+            response = await client.display(image)
         print(f"status: {RenderingResponse.StatusCode.Name(response.status)}, details: {response.details}") # noqa
+    finally:
+        client.close()
+        await close_channels()
 
 
 if __name__ == '__main__':
@@ -51,7 +61,9 @@ if __name__ == '__main__':
     )
 
     parser.add_argument("--addr", help="gRPC API address.", default="localhost:48765")  # noqa: E501
+    parser.add_argument("--use-assets", help="Upload the logo as an asset and compose the frame from it.", action="store_true")  # noqa: E501
+    parser.add_argument("--frame-ring", help="Number of slots of the shared memory ring used to pass the frames to a server listening on a Unix socket (unix:PATH address), 0 to disable it.", type=int, default=0)  # noqa: E501
     args = parser.parse_args()
 
     logging.basicConfig()
-    asyncio.run(run(args.addr))
+    asyncio.run(run(args.addr, args.use_assets, args.frame_ring))
@@ -0,0 +1,116 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""State of the panel persisted across restarts of the display server"""
+
+import mmap
+import os
+import struct
+import zlib
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from epd_backend import GhostingPolicy
+
+
+class Snapshot(NamedTuple):
+    """Panel state restored from the state file"""
+
+    # Panel buffer displayed when the state was saved
+    frame: bytes
+    # Wall-clock time of the last refresh of the panel
+    last_refresh: float
+
+
+class PanelState:
+    """Last displayed frame and refresh state of the panel, kept in a
+    memory-mapped file.
+
+    eInk panels keep their content without power: restoring the frame they
+    display after a restart avoids clearing them and lets the next frame be
+    displayed with a partial refresh.
+
+    The file holds a header, the panel buffer and the ghosting counters of
+    the panel. Saving only copies them in the mapped memory, the kernel
+    writing them back to the file; the header holds a checksum of the panel
+    buffer so a partially written state is ignored.
+    """
+
+    MAGIC = b"STBD"
+    VERSION = 1
+    # magic, version, frame size, partial refreshes, last refresh, frame CRC
+    HEADER = struct.Struct("<4sHIIdI")
+
+    def __init__(self, path: str, frame_size: int, ghosting: GhostingPolicy):
+        """Opens (or creates) the state file of a panel.
+
+        Args:
+          path: the path of the state file.
+          frame_size: the size of a panel buffer, in bytes.
+          ghosting: the ghosting policy of the panel, whose counters are
+            saved with the frame.
+        """
+        self.frame_size = frame_size
+        self.ghosting = ghosting
+        size = self.HEADER.size + frame_size + ghosting.counts.nbytes
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self.__mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        offset = self.HEADER.size
+        self.__frame = np.frombuffer(self.__mmap, dtype=np.uint8, count=frame_size, offset=offset)  # noqa: E501
+        offset += frame_size
+        self.__counts = np.frombuffer(self.__mmap, dtype=np.uint8, count=ghosting.counts.size, offset=offset).reshape(ghosting.counts.shape)  # noqa: E501
+
+    def load(self) -> Optional[Snapshot]:
+        """Restores the saved state, the ghosting counters included.
+
+        Returns:
+          The saved state, or None if the file holds no valid state.
+        """
+        magic, version, frame_size, partial_refreshes, last_refresh, checksum = self.HEADER.unpack_from(self.__mmap)  # noqa: E501
+        if (magic, version, frame_size) != (self.MAGIC, self.VERSION, self.frame_size):  # noqa: E501
+            return None
+
+        frame = self.__frame.tobytes()
+        if zlib.crc32(frame) != checksum:
+            return None
+
+        self.ghosting.counts[:] = self.__counts
+        self.ghosting.partial_refreshes = partial_refreshes
+        return Snapshot(frame, last_refresh)
+
+    def save(self, frame: bytes, last_refresh: float) -> None:
+        """Saves the displayed frame and the ghosting counters."""
+        # NOTE: invalidate the state while it is being written
+        self.HEADER.pack_into(self.__mmap, 0, b"\0" * 4, 0, 0, 0, 0, 0)
+        self.__frame[:] = np.frombuffer(frame, dtype=np.uint8)
+        self.__counts[:] = self.ghosting.counts
+        self.HEADER.pack_into(
+            self.__mmap, 0,
+            self.MAGIC, self.VERSION, self.frame_size,
+            self.ghosting.partial_refreshes, last_refresh, zlib.crc32(frame)
+        )
+
+    def close(self) -> None:
+        """Writes the state back to the file and unmaps it."""
+        self.__mmap.flush()
+        del self.__frame, self.__counts
+        self.__mmap.close()
@@ -0,0 +1,103 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the capabilities reported by the display server."""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import grpc
+import numpy as np
+
+from stboite.grpc.v1.stboite_display_pb2 import GetCapabilitiesRequest, GetCapabilitiesResponse, RenderingRequest, RenderingResponse  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))  # noqa: E501
+from epd_backend import EPDEmulator  # noqa: E402
+from waveshare_2in13 import eInk_Waveshare_2in13  # noqa: E402
+
+
+class CapabilitiesTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.local_socket = os.path.join(directory.name, "display.sock")
+
+        self.epd = EPDEmulator(time_scale=0)
+        self.display = eInk_Waveshare_2in13("127.0.0.1:0", self.epd, local_socket=self.local_socket)  # noqa: E501
+        await self.display.start()
+        self.channel = grpc.aio.insecure_channel(f"127.0.0.1:{self.display.port}")  # noqa: E501
+        self.stub = RenderingServiceStub(self.channel)
+
+    async def asyncTearDown(self) -> None:
+        await self.channel.close()
+        await self.display.stop(None)
+
+    async def test_panel_is_described(self) -> None:
+        capabilities = await self.stub.GetCapabilities(GetCapabilitiesRequest())  # noqa: E501
+
+        self.assertEqual((capabilities.width, capabilities.height), (250, 122))  # noqa: E501
+        self.assertEqual((capabilities.native_width, capabilities.native_height, capabilities.linewidth), (122, 250, 16))  # noqa: E501
+        self.assertEqual(capabilities.orientation, GetCapabilitiesResponse.TRANSPOSED)  # noqa: E501
+        self.assertEqual(capabilities.bit_depth, 1)
+        self.assertEqual(capabilities.preferred_type, RenderingRequest.PACKED)
+
+    async def test_features_are_described(self) -> None:
+        capabilities = await self.stub.GetCapabilities(GetCapabilitiesRequest())  # noqa: E501
+
+        self.assertIn(RenderingRequest.PACKED, capabilities.pixel_types)
+        self.assertIn(RenderingRequest.RGBA, capabilities.pixel_types)
+        # NOTE: Pillow cannot reduce LAB images to black and white
+        self.assertNotIn(RenderingRequest.LAB, capabilities.pixel_types)
+        self.assertEqual(set(capabilities.compressions), {RenderingRequest.RAW, RenderingRequest.RLE, RenderingRequest.ZLIB})  # noqa: E501
+        self.assertTrue(capabilities.partial_regions and capabilities.delta_frames and capabilities.frame_rings)  # noqa: E501
+        self.assertEqual(capabilities.max_animation_frames, eInk_Waveshare_2in13.ANIMATION_MAX_FRAMES)  # noqa: E501
+        self.assertEqual(capabilities.asset_cache_size, eInk_Waveshare_2in13.ASSET_CACHE_SIZE)  # noqa: E501
+        self.assertIn("default", capabilities.fonts)
+        self.assertIn(RenderingRequest.ATKINSON, capabilities.ditherings)
+
+    async def test_frame_rings_require_the_local_socket(self) -> None:
+        display = eInk_Waveshare_2in13("127.0.0.1:0", EPDEmulator(time_scale=0))  # noqa: E501
+        await display.start()
+        try:
+            async with grpc.aio.insecure_channel(f"127.0.0.1:{display.port}") as channel:  # noqa: E501
+                capabilities = await RenderingServiceStub(channel).GetCapabilities(GetCapabilitiesRequest())  # noqa: E501
+        finally:
+            await display.stop(None)
+        self.assertFalse(capabilities.frame_rings)
+
+    async def test_panel_buffer_is_copied_as_is(self) -> None:
+        capabilities = await self.stub.GetCapabilities(GetCapabilitiesRequest())  # noqa: E501
+        buffer = np.random.RandomState(0).randint(0, 256, capabilities.linewidth * capabilities.native_height, dtype=np.uint8).tobytes()  # noqa: E501
+
+        response = await self.stub.DisplayRendering(RenderingRequest(
+            type=capabilities.preferred_type,
+            width=capabilities.width,
+            height=capabilities.height,
+            data=buffer,
+            wait_for_refresh=True,
+        ))
+        self.assertEqual(response.status, RenderingResponse.OK)
+        self.assertEqual(bytes(self.epd.framebuffer), buffer)
+
+    async def test_other_sizes_are_not_allowed(self) -> None:
+        response = await self.stub.DisplayRendering(RenderingRequest(type=RenderingRequest.L, width=100, height=100, data=bytes(100 * 100)))  # noqa: E501
+        self.assertEqual(response.status, RenderingResponse.DIMENSION_NOT_ALLOWED)  # noqa: E501
+
+
+if __name__ == '__main__':
+    unittest.main()
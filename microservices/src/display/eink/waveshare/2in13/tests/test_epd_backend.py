@@ -0,0 +1,139 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the windowed partial refreshes of the eInk screen backends."""
+
+import os
+import sys
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))  # noqa: E501
+from epd_backend import EPDEmulator, Waveshare2in13V2, dirty_windows, region_window  # noqa: E402, E501
+
+LINEWIDTH = 16
+HEIGHT = 250
+
+
+def changed(rows, columns, value: int = 0x00) -> bytes:
+    """Returns a white panel buffer with the given bytes set to `value`."""
+    frame = np.full((HEIGHT, LINEWIDTH), 0xFF, dtype=np.uint8)
+    frame[rows, columns] = value
+    return frame.tobytes()
+
+
+class DirtyWindowsTest(unittest.TestCase):
+
+    def test_nothing_changed(self) -> None:
+        frame = changed(slice(10, 20), slice(2, 4))
+        self.assertEqual(dirty_windows(frame, frame, LINEWIDTH), [])
+
+    def test_window_is_aligned_on_bytes(self) -> None:
+        white = changed(slice(0, 0), slice(0, 0))
+        # NOTE: a single pixel changed in the middle of the byte column 5
+        frame = changed(slice(42, 43), slice(5, 6), 0xEF)
+        self.assertEqual(dirty_windows(white, frame, LINEWIDTH), [(42, 5, 42, 5)])  # noqa: E501
+
+    def test_close_rows_are_merged_in_a_band(self) -> None:
+        white = changed(slice(0, 0), slice(0, 0))
+        frame = np.frombuffer(changed(slice(10, 12), slice(1, 2)), dtype=np.uint8).reshape(HEIGHT, LINEWIDTH).copy()  # noqa: E501
+        frame[15, 7] = 0x00
+        frame[100, 3] = 0x00
+        self.assertEqual(dirty_windows(white, frame.tobytes(), LINEWIDTH, max_gap=4), [(10, 1, 15, 7), (100, 3, 100, 3)])  # noqa: E501
+
+    def test_region_covers_its_bytes(self) -> None:
+        # NOTE: the landscape x gives the panel row, the landscape y the bit
+        #       column
+        self.assertEqual(region_window(10, 3, 5, 10), (10, 0, 14, 1))
+        self.assertEqual(region_window(0, 8, 250, 8), (0, 1, 249, 1))
+
+
+class EmulatorPartialRefreshTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.epd = EPDEmulator(time_scale=0)
+        self.epd.init_partial_update()
+
+    def test_only_windows_are_sent(self) -> None:
+        frame = changed(slice(0, HEIGHT), slice(0, LINEWIDTH))
+        self.epd.display_partial(frame, [(10, 2, 19, 3)])
+
+        screen = np.frombuffer(self.epd.framebuffer, dtype=np.uint8).reshape(HEIGHT, LINEWIDTH)  # noqa: E501
+        self.assertTrue((screen[10:20, 2:4] == 0x00).all())
+        self.assertEqual(int((screen == 0x00).sum()), 20)
+        self.assertEqual(self.epd.bytes_sent, 2 * 20)
+
+    def test_dirty_windows_reproduce_the_frame(self) -> None:
+        frame = changed(slice(30, 60), slice(4, 9))
+        self.epd.display_partial(frame, dirty_windows(bytes(self.epd.framebuffer), frame, LINEWIDTH))  # noqa: E501
+        self.assertEqual(bytes(self.epd.framebuffer), frame)
+        self.assertEqual(self.epd.bytes_sent, 2 * 30 * 5)
+
+
+class FakeEPD:
+    """Records the SPI transfers of the Waveshare library"""
+
+    FULL_UPDATE = 0
+    PART_UPDATE = 1
+    width = 122
+    height = 250
+
+    def __init__(self):
+        self.transfers = []
+
+    def send_command(self, command: int) -> None:
+        self.transfers.append(("command", command))
+
+    def send_data(self, data: int) -> None:
+        self.transfers.append(("data", bytes([data])))
+
+    def send_data2(self, data: bytes) -> None:
+        self.transfers.append(("data", bytes(data)))
+
+    def ReadBusy(self) -> None:
+        pass
+
+
+class Waveshare2in13V2Test(unittest.TestCase):
+
+    def setUp(self) -> None:
+        lib = types.ModuleType("TP_lib")
+        lib.epd2in13_V2 = types.SimpleNamespace(EPD_2IN13_V2=FakeEPD)
+        with mock.patch.dict(sys.modules, {"TP_lib": lib}):
+            self.epd = Waveshare2in13V2()
+        self.fake = self.epd._Waveshare2in13V2__epd
+
+    def test_window_is_sent_in_bulk(self) -> None:
+        frame = changed(slice(10, 20), slice(2, 4))
+        self.epd.display_partial(frame, [(10, 2, 19, 3)])
+
+        writes = [self.fake.transfers[i + 1][1] for i, transfer in enumerate(self.fake.transfers) if transfer in (("command", 0x24), ("command", 0x26))]  # noqa: E501
+        self.assertEqual(writes, [bytes([0x00]) * 20, bytes([0xFF]) * 20])
+        # NOTE: one transfer per command, fewer than the bytes written
+        self.assertLess(len(self.fake.transfers), 2 * 20)
+
+    def test_restore_writes_each_ram_once(self) -> None:
+        frame = changed(slice(0, HEIGHT), slice(0, LINEWIDTH))
+        self.epd.restore(frame)
+
+        data = [transfer[1] for transfer in self.fake.transfers if transfer[0] == "data"]  # noqa: E501
+        self.assertEqual(data.count(frame), 2)
+        self.assertLess(len(self.fake.transfers), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
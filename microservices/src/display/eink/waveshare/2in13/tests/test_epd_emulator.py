@@ -0,0 +1,92 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the in-memory emulation of the Waveshare 2.13inch screen."""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))  # noqa: E501
+from epd_backend import EPDEmulator  # noqa: E402
+
+
+class EPDEmulatorTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.epd = EPDEmulator(time_scale=0)
+
+    def test_refresh_requires_init(self) -> None:
+        with self.assertRaises(RuntimeError):
+            self.epd.display_base(bytes(len(self.epd.framebuffer)))
+        self.epd.init_full_update()
+        self.epd.display_base(bytes(len(self.epd.framebuffer)))
+
+        self.epd.sleep()
+        with self.assertRaises(RuntimeError):
+            self.epd.display_partial(bytes(len(self.epd.framebuffer)))
+
+    def test_cycles_are_counted(self) -> None:
+        frame = bytes(len(self.epd.framebuffer))
+        self.epd.init_full_update()
+        self.epd.clear(0xFF)
+        self.epd.init_partial_update()
+        self.epd.display_partial(frame)
+        self.epd.display_partial(frame)
+        self.epd.sleep()
+
+        self.assertEqual(
+            (self.epd.init_cycles, self.epd.full_refreshes, self.epd.partial_refreshes, self.epd.sleep_cycles),  # noqa: E501
+            (2, 1, 2, 1)
+        )
+        # NOTE: both RAMs are written by each refresh
+        self.assertEqual(self.epd.bytes_sent, 3 * 2 * len(frame))
+        self.assertEqual(bytes(self.epd.framebuffer), frame)
+
+    def test_latencies_are_scaled(self) -> None:
+        epd = EPDEmulator(time_scale=0.01)
+        start = time.perf_counter()
+        epd.init_full_update()
+        epd.display_base(bytes(len(epd.framebuffer)))
+        elapsed = time.perf_counter() - start
+
+        expected = 0.01 * (epd.INIT_FULL_LATENCY + epd.FULL_REFRESH_LATENCY)
+        self.assertGreaterEqual(elapsed, expected)
+        self.assertLess(elapsed, expected + 0.5)
+
+    def test_frame_is_dumped_as_landscape_png(self) -> None:
+        # NOTE: the first panel row (the left column of the landscape image)
+        #       is black
+        frame = np.full((self.epd.height, self.epd.linewidth), 0xFF, dtype=np.uint8)  # noqa: E501
+        frame[0, :] = 0x00
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "screen.png")
+            epd = EPDEmulator(time_scale=0, snapshot=path)
+            epd.init_full_update()
+            epd.display_base(frame.tobytes())
+
+            with Image.open(path) as image:
+                self.assertEqual(image.size, (250, 122))
+                pixels = np.asarray(image.convert("L"))
+        self.assertTrue((pixels[:, 0] == 0).all())
+        self.assertTrue((pixels[:, 1:] == 255).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
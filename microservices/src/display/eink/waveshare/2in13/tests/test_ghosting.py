@@ -0,0 +1,129 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the ghosting-aware full refresh policy."""
+
+import os
+import sys
+import unittest
+
+import grpc
+import numpy as np
+
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))  # noqa: E501
+from epd_backend import EPDEmulator, GhostingPolicy  # noqa: E402
+from waveshare_2in13 import eInk_Waveshare_2in13  # noqa: E402
+
+WIDTH, HEIGHT = 122, 250
+LINEWIDTH = 16
+
+
+def frame(value: int = 0xFF, rows=slice(None), columns=slice(None)) -> bytes:  # noqa: E501
+    """Returns a white panel buffer with the given bytes (all by default)
+    set to `value`.
+    """
+    buffer = np.full((HEIGHT, LINEWIDTH), 0xFF, dtype=np.uint8)
+    buffer[rows, columns] = value
+    return buffer.tobytes()
+
+
+class GhostingPolicyTest(unittest.TestCase):
+
+    def test_small_area_exhausts_only_its_budget(self) -> None:
+        policy = GhostingPolicy(WIDTH, HEIGHT, budget=3, max_partial_refreshes=None)  # noqa: E501
+        white, digit = frame(), frame(0x00, slice(0, 8), slice(0, 1))
+
+        # NOTE: the pixels of the digit change on each refresh
+        policy.record(white, digit)
+        self.assertFalse(policy.full_refresh_due())
+        policy.record(digit, white)
+        self.assertFalse(policy.full_refresh_due())
+        policy.record(white, digit)
+        self.assertTrue(policy.full_refresh_due())
+
+        # NOTE: only the changed pixels are counted
+        self.assertEqual(int(policy.counts.sum()), 3 * 8 * 8)
+
+    def test_changes_elsewhere_do_not_add_up(self) -> None:
+        policy = GhostingPolicy(WIDTH, HEIGHT, budget=3, max_partial_refreshes=None)  # noqa: E501
+        previous = frame()
+        for row in range(0, HEIGHT, 10):
+            current = frame(0x00, slice(row, row + 1), slice(0, LINEWIDTH))
+            policy.record(previous, current)
+            previous = current
+        # NOTE: each row is changed by two refreshes at most
+        self.assertFalse(policy.full_refresh_due())
+        self.assertEqual(policy.partial_refreshes, HEIGHT // 10)
+
+    def test_partial_refreshes_are_limited(self) -> None:
+        policy = GhostingPolicy(WIDTH, HEIGHT, budget=200, max_partial_refreshes=3)  # noqa: E501
+        for _ in range(3):
+            self.assertFalse(policy.full_refresh_due(budget=False))
+            policy.record(frame(), frame())
+        self.assertTrue(policy.full_refresh_due(budget=False))
+
+    def test_budget_can_be_ignored(self) -> None:
+        policy = GhostingPolicy(WIDTH, HEIGHT, budget=1, max_partial_refreshes=None)  # noqa: E501
+        policy.record(frame(), frame(0x00))
+        self.assertTrue(policy.full_refresh_due())
+        self.assertFalse(policy.full_refresh_due(budget=False))
+
+    def test_counts_saturate(self) -> None:
+        policy = GhostingPolicy(WIDTH, HEIGHT, budget=254, max_partial_refreshes=None)  # noqa: E501
+        for _ in range(300):
+            policy.record(frame(), frame(0x00))
+        self.assertEqual(int(policy.counts.max()), 255)
+        self.assertTrue(policy.full_refresh_due())
+
+    def test_reset_after_a_full_refresh(self) -> None:
+        policy = GhostingPolicy(WIDTH, HEIGHT, budget=1, max_partial_refreshes=1)  # noqa: E501
+        policy.record(frame(), frame(0x00))
+        policy.reset()
+        self.assertFalse(policy.full_refresh_due())
+        self.assertEqual(int(policy.counts.sum()), 0)
+
+    def test_budget_is_bounded(self) -> None:
+        for budget in (0, 255):
+            with self.subTest(budget=budget), self.assertRaises(ValueError):
+                GhostingPolicy(WIDTH, HEIGHT, budget=budget)
+
+
+class FullRefreshTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_full_refresh_once_the_budget_is_exhausted(self) -> None:
+        epd = EPDEmulator(time_scale=0)
+        display = eInk_Waveshare_2in13("127.0.0.1:0", epd, ghosting=GhostingPolicy(WIDTH, HEIGHT, budget=3, max_partial_refreshes=None))  # noqa: E501
+        await display.start()
+        try:
+            async with grpc.aio.insecure_channel(f"127.0.0.1:{display.port}") as channel:  # noqa: E501
+                stub = RenderingServiceStub(channel)
+                white, digit = frame(), frame(0x00, slice(0, 8), slice(0, 1))
+                refreshes = []
+                for data in [digit, white, digit, white]:
+                    await stub.DisplayRendering(RenderingRequest(type=RenderingRequest.PACKED, width=250, height=122, data=data, wait_for_refresh=True))  # noqa: E501
+                    refreshes.append((epd.full_refreshes, epd.partial_refreshes))  # noqa: E501
+        finally:
+            await display.stop(None)
+
+        # NOTE: the panel is cleared by a first full refresh; the frame
+        #       changing the digit pixels for the third time exhausts their
+        #       budget and is displayed with a full refresh, resetting it
+        self.assertEqual(refreshes, [(1, 1), (1, 2), (2, 2), (2, 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the panel state persisted across restarts."""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))  # noqa: E501
+from epd_backend import GhostingPolicy  # noqa: E402
+from panel_state import PanelState, Snapshot  # noqa: E402
+
+WIDTH, HEIGHT = 122, 250
+FRAME_SIZE = 16 * HEIGHT
+
+
+def ghosting() -> GhostingPolicy:
+    return GhostingPolicy(WIDTH, HEIGHT, budget=10, max_partial_refreshes=None)  # noqa: E501
+
+
+class PanelStateTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "display.state")
+        self.frame = bytes(range(256)) * (FRAME_SIZE // 256) + bytes(FRAME_SIZE % 256)  # noqa: E501
+
+    def save(self) -> GhostingPolicy:
+        """Saves a state with some ghosting counters, as a first run of the
+        display server would.
+        """
+        policy = ghosting()
+        policy.record(bytes([0xFF]) * FRAME_SIZE, self.frame)
+        state = PanelState(self.path, FRAME_SIZE, policy)
+        state.save(self.frame, 1234.5)
+        state.close()
+        return policy
+
+    def load(self, frame_size: int = FRAME_SIZE, policy=None):
+        state = PanelState(self.path, frame_size, policy or ghosting())
+        try:
+            return state.load()
+        finally:
+            state.close()
+
+    def corrupt(self, offset: int) -> None:
+        with open(self.path, "r+b") as file:
+            file.seek(offset)
+            byte = file.read(1)
+            file.seek(offset)
+            file.write(bytes([byte[0] ^ 0xFF]))
+
+    def test_new_file_holds_no_state(self) -> None:
+        self.assertIsNone(self.load())
+        self.assertEqual(os.path.getsize(self.path), PanelState.HEADER.size + FRAME_SIZE + ghosting().counts.nbytes)  # noqa: E501
+
+    def test_state_is_restored(self) -> None:
+        saved = self.save()
+        policy = ghosting()
+
+        self.assertEqual(self.load(policy=policy), Snapshot(self.frame, 1234.5))  # noqa: E501
+        self.assertEqual(policy.counts.tolist(), saved.counts.tolist())
+        self.assertEqual(policy.partial_refreshes, 1)
+
+    def test_corrupted_frame_is_ignored(self) -> None:
+        self.save()
+        self.corrupt(PanelState.HEADER.size + 100)
+
+        policy = ghosting()
+        self.assertIsNone(self.load(policy=policy))
+        # NOTE: the counters are left untouched
+        self.assertEqual(int(policy.counts.sum()), 0)
+
+    def test_invalid_header_is_ignored(self) -> None:
+        for offset in (0, 4):
+            with self.subTest(field=("magic", "version")[offset // 4]):
+                self.save()
+                self.corrupt(offset)
+                self.assertIsNone(self.load())
+
+    def test_interrupted_save_is_ignored(self) -> None:
+        self.save()
+        state = PanelState(self.path, FRAME_SIZE, ghosting())
+        # NOTE: the header is cleared first while saving
+        state._PanelState__mmap[:PanelState.HEADER.size] = bytes(PanelState.HEADER.size)  # noqa: E501
+        state.close()
+        self.assertIsNone(self.load())
+
+    def test_truncated_file_is_ignored(self) -> None:
+        self.save()
+        os.truncate(self.path, PanelState.HEADER.size + FRAME_SIZE // 2)
+
+        self.assertIsNone(self.load())
+        # NOTE: the file is resized, ready for the next save
+        self.assertEqual(os.path.getsize(self.path), PanelState.HEADER.size + FRAME_SIZE + ghosting().counts.nbytes)  # noqa: E501
+
+    def test_frame_size_mismatch_is_ignored(self) -> None:
+        self.save()
+        self.assertIsNone(self.load(frame_size=FRAME_SIZE - 16))
+
+    def test_state_can_be_saved_again(self) -> None:
+        self.save()
+        self.assertIsNone(self.load(frame_size=FRAME_SIZE - 16))
+        self.save()
+        self.assertEqual(self.load(), Snapshot(self.frame, 1234.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
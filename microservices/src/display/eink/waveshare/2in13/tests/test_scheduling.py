@@ -0,0 +1,131 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the scheduling of the frames by priority and deadline."""
+
+import asyncio
+import os
+import sys
+import unittest
+
+import grpc
+
+from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest, RenderingResponse  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))  # noqa: E501
+from epd_backend import EPDEmulator, GhostingPolicy  # noqa: E402
+from waveshare_2in13 import eInk_Waveshare_2in13  # noqa: E402
+
+FRAME_SIZE = 16 * 250
+
+
+class RecordingEPDEmulator(EPDEmulator):
+    """Emulated screen recording the frames it displays."""
+
+    def __init__(self):
+        super().__init__(time_scale=0)
+        self.displayed = []
+
+    def display_base(self, frame: bytes) -> None:
+        super().display_base(frame)
+        self.displayed.append(bytes(frame))
+
+    def display_partial(self, frame: bytes, windows=None) -> None:
+        super().display_partial(frame, windows)
+        self.displayed.append(bytes(frame))
+
+
+def frame(value: int) -> bytes:
+    return bytes([value]) * FRAME_SIZE
+
+
+def request(value: int, **kwargs) -> RenderingRequest:
+    return RenderingRequest(type=RenderingRequest.PACKED, width=250, height=122, data=frame(value), wait_for_refresh=True, **kwargs)  # noqa: E501
+
+
+class SchedulingTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.epd = RecordingEPDEmulator()
+        self.display = eInk_Waveshare_2in13("127.0.0.1:0", self.epd, ghosting=GhostingPolicy(122, 250, budget=1, max_partial_refreshes=None))  # noqa: E501
+        await self.display.start()
+        self.channel = grpc.aio.insecure_channel(f"127.0.0.1:{self.display.port}")  # noqa: E501
+        self.stub = RenderingServiceStub(self.channel)
+        self.epd.displayed.clear()
+        # NOTE: holding the panel lock emulates a refresh in progress
+        self.lock = self.display._eInk_Waveshare_2in13__lock
+
+    async def asyncTearDown(self) -> None:
+        await self.channel.close()
+        await self.display.stop(None)
+
+    async def send(self, *requests: RenderingRequest, busy: float = 0) -> list:  # noqa: E501
+        """Sends the requests one after the other while the panel is busy,
+        for `busy` more seconds once they are all queued, and returns their
+        responses.
+        """
+        calls = []
+        async with self.lock:
+            pending = self.display._eInk_Waveshare_2in13__pending
+            for rendering_request in requests:
+                calls.append(asyncio.ensure_future(self.stub.DisplayRendering(rendering_request)))  # noqa: E501
+                while not calls[-1].done() and rendering_request.data not in [p.frame for p in pending]:  # noqa: E501
+                    await asyncio.sleep(0.001)
+            await asyncio.sleep(busy)
+        return await asyncio.gather(*calls)
+
+    async def test_frames_are_displayed_by_priority(self) -> None:
+        low, urgent, newer = await self.send(request(0x01), request(0x02, priority=5), request(0x03))  # noqa: E501
+
+        self.assertEqual(self.epd.displayed, [frame(0x02), frame(0x03)])
+        # NOTE: the newer frame of the same priority replaces the first one
+        self.assertTrue(low.dropped)
+        self.assertFalse(urgent.dropped or newer.dropped)
+
+    async def test_lower_priority_frame_does_not_replace_higher_ones(self) -> None:  # noqa: E501
+        urgent, low = await self.send(request(0x02, priority=5), request(0x01))  # noqa: E501
+
+        self.assertEqual(self.epd.displayed, [frame(0x02), frame(0x01)])
+        self.assertFalse(urgent.dropped or low.dropped)
+
+    async def test_frame_expiring_while_queued_is_answered(self) -> None:
+        async with self.lock:
+            response = await asyncio.wait_for(self.stub.DisplayRendering(request(0x01, deadline_ms=20)), 5)  # noqa: E501
+            # NOTE: answered while the panel is still busy
+            self.assertEqual(response.status, RenderingResponse.DEADLINE_EXCEEDED)  # noqa: E501
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(self.epd.displayed, [])
+        self.assertEqual(self.display.metrics.frames_expired.labels().get(), 1)  # noqa: E501
+
+    async def test_expired_frame_leaves_the_others(self) -> None:
+        expired, kept = await self.send(request(0x02, priority=5, deadline_ms=20), request(0x01), busy=0.05)  # noqa: E501
+        self.assertEqual(expired.status, RenderingResponse.DEADLINE_EXCEEDED)
+        self.assertEqual(kept.status, RenderingResponse.OK)
+        self.assertEqual(self.epd.displayed, [frame(0x01)])
+
+    async def test_priority_frame_postpones_the_full_refresh(self) -> None:
+        full, partial = self.epd.full_refreshes, self.epd.partial_refreshes
+        await self.stub.DisplayRendering(request(0x01, priority=1))
+        self.assertEqual((self.epd.full_refreshes - full, self.epd.partial_refreshes - partial), (0, 1))  # noqa: E501
+
+        # NOTE: the ghosting budget is exhausted, the next frame gets the
+        #       full refresh
+        await self.stub.DisplayRendering(request(0x02))
+        self.assertEqual((self.epd.full_refreshes - full, self.epd.partial_refreshes - partial), (1, 1))  # noqa: E501
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the Waveshare 2.13inch display server against an emulated
+screen.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import grpc
+
+from stboite.display.v1.converter import FrameConverter
+from stboite.display.v1.encoding import crc, xor_delta
+from stboite.grpc.v1.stboite_display_pb2 import ComposeFrameRequest, PlayAnimationRequest, RenderingRequest, RenderingResponse, UploadAssetRequest  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceStub
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))  # noqa: E501
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "benchmark"))  # noqa: E501
+from benchmark import request  # noqa: E402
+from epd_backend import EPDEmulator  # noqa: E402
+from waveshare_2in13 import eInk_Waveshare_2in13  # noqa: E402
+
+
+class DisplayTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.epd = EPDEmulator(time_scale=0)
+        self.display = eInk_Waveshare_2in13("127.0.0.1:0", self.epd)
+        await self.display.start()
+        self.channel = grpc.aio.insecure_channel(f"127.0.0.1:{self.display.port}")  # noqa: E501
+        self.stub = RenderingServiceStub(self.channel)
+
+    async def asyncTearDown(self) -> None:
+        await self.channel.close()
+        await self.display.stop(None)
+
+
+class DisplayRenderingTest(DisplayTestCase):
+
+    async def test_resent_frame_follows_frame_being_decoded(self) -> None:
+        # NOTE: the decoding of the frame B is held until A is sent again
+        decode = self.display._eInk_Waveshare_2in13__decode
+        release = threading.Event()
+
+        def held_decode(rendering_request, payload, base):
+            if rendering_request.data == request(1).data:
+                release.wait(5)
+            return decode(rendering_request, payload, base)
+        self.display._eInk_Waveshare_2in13__decode = held_decode
+
+        response = await self.stub.DisplayRendering(request(0, wait_for_refresh=True))  # noqa: E501
+        self.assertFalse(response.deduplicated)
+        frame_a = bytes(self.epd.framebuffer)
+
+        frame_b = asyncio.ensure_future(self.stub.DisplayRendering(request(1, wait_for_refresh=True)))  # noqa: E501
+        while not self.display._eInk_Waveshare_2in13__decoding:
+            await asyncio.sleep(0.001)
+
+        resent = asyncio.ensure_future(self.stub.DisplayRendering(request(0, wait_for_refresh=True)))  # noqa: E501
+        await asyncio.sleep(0.05)
+        release.set()
+        responses = await asyncio.gather(frame_b, resent)
+
+        self.assertTrue(all(response.status == response.OK for response in responses))  # noqa: E501
+        self.assertTrue(responses[0].dropped)
+        self.assertEqual(bytes(self.epd.framebuffer), frame_a)
+
+    async def test_delta_follows_frame_being_decoded(self) -> None:
+        # NOTE: the decoding of the full frame is held until its delta is
+        #       sent
+        decode = self.display._eInk_Waveshare_2in13__decode
+        release = threading.Event()
+        frame_a = bytes([0x0F]) * len(self.epd.framebuffer)
+        frame_b = bytes([0xF0]) * len(self.epd.framebuffer)
+
+        def held_decode(rendering_request, payload, base):
+            if rendering_request.data == frame_a:
+                release.wait(5)
+            return decode(rendering_request, payload, base)
+        self.display._eInk_Waveshare_2in13__decode = held_decode
+
+        full = asyncio.ensure_future(self.stub.DisplayRendering(RenderingRequest(type=RenderingRequest.PACKED, width=250, height=122, data=frame_a)))  # noqa: E501
+        while not self.display._eInk_Waveshare_2in13__decoding:
+            await asyncio.sleep(0.001)
+
+        delta = asyncio.ensure_future(self.stub.DisplayRendering(RenderingRequest(  # noqa: E501
+            type=RenderingRequest.PACKED, width=250, height=122, data=bytes(xor_delta(frame_a, frame_b)),  # noqa: E501
+            delta=True, delta_base=crc(frame_a), wait_for_refresh=True
+        )))
+        await asyncio.sleep(0.05)
+        release.set()
+        responses = await asyncio.gather(full, delta)
+
+        self.assertEqual([response.status for response in responses], [RenderingResponse.OK] * 2)  # noqa: E501
+        self.assertEqual(bytes(self.epd.framebuffer), frame_b)
+
+    async def test_animation_stopped_by_accepted_frames_only(self) -> None:
+        frames = [PlayAnimationRequest.Frame(frame=request(i), duration_ms=10) for i in range(2)]  # noqa: E501
+        response = await self.stub.PlayAnimation(PlayAnimationRequest(frames=frames))  # noqa: E501
+        self.assertEqual(response.status, RenderingResponse.OK)
+        animation = self.display._eInk_Waveshare_2in13__animation
+
+        response = await self.stub.DisplayRendering(request(2, wait_for_refresh=True, delta=True))  # noqa: E501
+        self.assertEqual(response.status, RenderingResponse.INVALID_PAYLOAD)
+        self.assertFalse(animation.done())
+
+        response = await self.stub.DisplayRendering(request(2, wait_for_refresh=True))  # noqa: E501
+        self.assertEqual(response.status, RenderingResponse.OK)
+        self.assertFalse(response.dropped)
+        self.assertTrue(animation.done())
+
+
+class ComposeFrameTest(DisplayTestCase):
+
+    async def test_oversized_frame_is_rejected(self) -> None:
+        for width, height in [(0, 0), (1 << 20, 1 << 20)]:
+            with self.assertRaises(grpc.aio.AioRpcError) as e:
+                await self.stub.ComposeFrame(ComposeFrameRequest(width=width, height=height))  # noqa: E501
+            self.assertEqual(e.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)  # noqa: E501
+
+    async def test_long_text_is_rejected(self) -> None:
+        text = ComposeFrameRequest.Text(text="M" * (eInk_Waveshare_2in13.MAX_TEXT_LENGTH + 1))  # noqa: E501
+        with self.assertRaises(grpc.aio.AioRpcError) as e:
+            await self.stub.ComposeFrame(ComposeFrameRequest(width=250, height=122, texts=[text]))  # noqa: E501
+        self.assertEqual(e.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)  # noqa: E501
+
+    async def test_composed_frame_is_packed_once(self) -> None:
+        await self.stub.UploadAsset(UploadAssetRequest(id="dot", type=RenderingRequest.L, width=8, height=4, data=bytes(32)))  # noqa: E501
+        placement = ComposeFrameRequest.Placement(asset_id="dot", x=3, y=5)
+        with mock.patch.object(FrameConverter, "white_pixels", side_effect=AssertionError("composed frame converted again")):  # noqa: E501
+            response = await self.stub.ComposeFrame(ComposeFrameRequest(width=250, height=122, assets=[placement], wait_for_refresh=True))  # noqa: E501
+        self.assertEqual(response.status, RenderingResponse.OK)
+
+        # NOTE: same panel buffer as the frame sent with one byte per pixel
+        one = bytearray(b"\x01" * 250 * 122)
+        for y in range(5, 9):
+            one[y * 250 + 3:y * 250 + 11] = bytes(8)
+        expected = FrameConverter(122, 250).convert(RenderingRequest.ONE, 250, 122, bytes(one))  # noqa: E501
+        self.assertEqual(bytes(self.epd.framebuffer), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,20 +16,27 @@
 
 import argparse
 import asyncio
+import hashlib
 import logging
 import signal
-from datetime import datetime
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import grpc
-from PIL import Image
-from stboite.grpc.v1.stboite_display_pb2_grpc import RenderingServiceServicer, add_RenderingServiceServicer_to_server
-from stboite.grpc.v1.stboite_display_pb2 import RenderingRequest, RenderingResponse
-from TP_lib import epd2in13_V2
+import numpy as np
+from stboite.display.v1 import GRPCDisplay
+from stboite.display.v1.converter import DITHERINGS, FrameConverter
+from stboite.display.v1.encoding import check_payload_size, crc, decompress, xor_delta  # noqa: E501
+from stboite.grpc.v1.stboite_display_pb2 import GetCapabilitiesResponse, PlayAnimationRequest, RenderingRequest, RenderingResponse, StopAnimationRequest  # noqa: E501
 
+from epd_backend import EPDBackend, EPDEmulator, GhostingPolicy, Waveshare2in13V2, Window, dirty_windows, region_window  # noqa: E501
+from panel_state import PanelState, Snapshot
 
-class eInk_Waveshare_2in13(RenderingServiceServicer):
+
+class eInk_Waveshare_2in13(GRPCDisplay):
     """Implements the gRPC display server to the eInk Waveshare 2.13inch screen
     """
     class Mode(Enum):
@@ -37,157 +44,760 @@ class eInk_Waveshare_2in13(RenderingServiceServicer):
         PARTIAL_UPDATE = 1
         FULL_UPDATE = 2
 
-    __epd: epd2in13_V2.EPD_2IN13_V2
-    __lock = asyncio.Lock()
+    class PendingFrame:
+        """Frame waiting to be displayed by the render worker"""
+
+        def __init__(self, sequence: int, fingerprint: Tuple, frame: bytes, windows: Optional[List[Window]], priority: int = 0, expires_at: Optional[float] = None, animated: bool = False):  # noqa: E501
+            self.sequence = sequence
+            self.fingerprint = fingerprint
+            self.frame = frame
+            # NOTE: None means that the changed areas must be computed
+            #       against the displayed frame
+            self.windows = windows
+            self.priority = priority
+            # NOTE: event loop time after which the frame is discarded (None
+            #       if it has no deadline)
+            self.expires_at = expires_at
+            self.expiry: Optional[asyncio.TimerHandle] = None
+            self.animated = animated
+            self.waiters: List[Tuple[Tuple, asyncio.Future]] = []
+            self.submitted_at = time.perf_counter()
+
+        def expired(self) -> bool:
+            """Returns whether the deadline of the frame has passed."""
+            return self.expires_at is not None and asyncio.get_running_loop().time() >= self.expires_at  # noqa: E501
+
+    # NOTE: number of converted frames kept in memory, indexed by their
+    #       fingerprint, to avoid decoding again frames sent periodically
+    FRAME_CACHE_SIZE = 16
+    # NOTE: maximum number of frames of an animation, all kept in memory
+    ANIMATION_MAX_FRAMES = 64
+    # NOTE: maximum number of requests decoded at the same time, the others
+    #       waiting for their turn, to bound the memory used by the
+    #       conversions whatever the number of clients
+    MAX_DECODING = 2
+
+    # NOTE: precautions given by Waveshare:
+    #
+    #  - When using the e-Paper, it is recommended that the refresh interval
+    #    be at least 180s, and refresh at least once every 24 hours.
+    #
+    #  - The screen should be set to sleep mode or disconnected from power
+    #    when it doesn't need to be refreshed.
+    IDLE_TIMEOUT = 60
+    REFRESH_INTERVAL = 24 * 60 * 60
+
+    FRAME_SIZE = (250, 122)
+
+    __converter: FrameConverter
+    __decoding: int = 0
+    # NOTE: resolved with the frame of the last accepted request once
+    #       decoded (None if it is not displayed), the base of the delta
+    #       frames accepted after it
+    __accepted: Optional["asyncio.Future[Optional[bytes]]"] = None
+    # NOTE: None until the panel is initialized by the screen thread
+    __epd: Optional[EPDBackend]
+    __executor: ThreadPoolExecutor
+    __lock: asyncio.Lock
+    # NOTE: frames waiting for the render worker, by decreasing priority
+    __pending: List[PendingFrame]
+    __pending_event: asyncio.Event
+    __received_sequence: int = 0
+    # Sequence of the last frame submitted by an animation
+    __animated_sequence: int = 0
+    __submitted_sequence: int = 0
+    __submitted_priority: int = 0
+    __render_task: asyncio.Task
+    __animation: Optional[asyncio.Task] = None
 
     __current_mode: Mode = Mode.DEEP_SLEEP
-    __frame_before_refresh: int = 0
-    __last_frame: any
-    __last_refresh: datetime
-    __running: bool = True
-
-    def __init__(self):
-        self.__epd = epd2in13_V2.EPD_2IN13_V2()
-        self.__full_update_mode()
-        self.__epd.Clear(0xFF)
-        # TODO: display a splashscreen
-        self.__last_refresh = datetime.now()
+    __ghosting: GhostingPolicy
+    __frame_cache: "OrderedDict[Tuple, bytes]"
+    __last_fingerprint: Optional[Tuple] = None
+    __last_frame: bytes
+    __last_refresh: float
+    __state: Optional[PanelState] = None
+    __panel_ready: "asyncio.Future[None]"
+
+    def __init__(self,
+                 listen_addr: str,
+                 epd: Optional[EPDBackend] = None,
+                 metrics_addr: Optional[str] = None,
+                 ghosting: Optional[GhostingPolicy] = None,
+                 state_file: Optional[str] = None,
+                 local_socket: Optional[str] = None,
+                 capture_file: Optional[str] = None,
+                 max_concurrent_rpcs: Optional[int] = None,
+                 fast_start: bool = False):
+        super().__init__(listen_addr, metrics_addr, local_socket, capture_file, max_concurrent_rpcs)  # noqa: E501
+        # NOTE: frames being decoded or waiting for the render worker
+        self.metrics.queue_depth.labels().function = lambda: self.__decoding + len(self.__pending)  # noqa: E501
+
+        self.__pending = []
+        self.__decode_slots = asyncio.Semaphore(self.MAX_DECODING)
+        self.__frame_cache = OrderedDict()
+        # NOTE: the Waveshare panel is created with the other panel
+        #       operations, its library being slow to load; its size is
+        #       known beforehand
+        self.__epd = epd
+        width, height = (epd.width, epd.height) if epd else (Waveshare2in13V2.width, Waveshare2in13V2.height)  # noqa: E501
+        self.__converter = FrameConverter(width, height)
+        self.__ghosting = ghosting or GhostingPolicy(width, height)
+
+        snapshot = None
+        if state_file:
+            self.__state = PanelState(state_file, self.__converter.buffer_size, self.__ghosting)  # noqa: E501
+            snapshot = self.__state.load()
+
+        if snapshot is not None:
+            self.__logging.info("panel state restored from %s", state_file)
+            self.__last_frame = snapshot.frame
+            self.__last_refresh = snapshot.last_refresh
+        else:
+            self.__last_frame = bytes([0xFF]) * self.__converter.buffer_size
+            self.__last_refresh = time.time()
+
+        # NOTE: all calls to the screen are done by a dedicated thread, to
+        #       keep the gRPC server responsive during refreshes
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="epd")  # noqa: E501
+        self.__panel_ready = asyncio.get_event_loop().create_future()
+        if fast_start:
+            # NOTE: the server answers while the panel is initialized by the
+            #       screen thread; the other panel operations run after it in
+            #       the same thread, and the render worker waits for it
+            asyncio.get_event_loop().run_in_executor(self.__executor, self.__init_panel, snapshot).add_done_callback(self.__panel_initialized)  # noqa: E501
+        else:
+            self.__init_panel(snapshot)
+            self.__panel_ready.set_result(None)
+        # NOTE: each server has its own lock, bound to the event loop it runs
+        #       in
+        self.__lock = asyncio.Lock()
+        self.__pending_event = asyncio.Event()
+        self.__render_task = asyncio.get_event_loop().create_task(self.__render_worker())  # noqa: E501
+
+    def __init_panel(self, snapshot: Optional[Snapshot]) -> None:
+        """Initializes the panel, clearing it unless it still shows the
+        frame of the given snapshot.
+        """
+        started_at = time.perf_counter()
+        if self.__epd is None:
+            self.__epd = Waveshare2in13V2()
+
+        if snapshot is not None:
+            # NOTE: the panel still shows the frame displayed before the
+            #       restart; no need to clear it, but the controller has lost
+            #       its registers and LUT with the reset, so it is fully
+            #       initialized before its RAM is restored, as before the
+            #       partial refreshes following `display_base`
+            self.__full_update_mode()
+            self.__epd.restore(snapshot.frame)
+            self.__partial_update_mode()
+        else:
+            self.__full_update_mode()
+            self.__epd.clear(0xFF)
+            self.__refreshed()
+            # TODO: display a splashscreen
+        self.__logging.info("panel initialized in %.2fs", time.perf_counter() - started_at)  # noqa: E501
+
+    def __panel_initialized(self, future: "asyncio.Future[None]") -> None:
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            # NOTE: the server is stopped, a restart being the only way to
+            #       recover the panel
+            self.__logging.error("failed to initialize the panel", exc_info=future.exception())  # noqa: E501
+            self.pre_stop()
+            return
+        self.__panel_ready.set_result(None)
+
+    async def start(self) -> None:
+        await super().start()
+        # NOTE: the panel may have been refreshed long before a restart
+        elapsed = time.time() - self.__last_refresh
+        self.schedule_refresh(max(self.REFRESH_INTERVAL - elapsed, 0))
+
+    def capabilities(self) -> GetCapabilitiesResponse:
+        capabilities = super().capabilities()
+        capabilities.native_width = self.__converter.panel_width
+        capabilities.native_height = self.__converter.panel_height
+        capabilities.linewidth = self.__converter.linewidth
+        # NOTE: landscape frames are transposed by `FrameConverter.pack`
+        capabilities.orientation = GetCapabilitiesResponse.TRANSPOSED
+        capabilities.bit_depth = 1
+        capabilities.preferred_type = RenderingRequest.PACKED
+        capabilities.pixel_types.extend(pixel_type for pixel_type in RenderingRequest.PixelType.values() if self.__converter.supports(pixel_type))  # noqa: E501
+        capabilities.ditherings.extend(DITHERINGS)
+        capabilities.partial_regions = True
+        capabilities.delta_frames = True
+        capabilities.max_animation_frames = self.ANIMATION_MAX_FRAMES
+        return capabilities
+
+    def pack(self, white: np.ndarray) -> Optional[bytes]:
+        # NOTE: composed frames have the size of `FRAME_SIZE`
+        return self.__converter.pack(white)
 
     async def DisplayRendering(
         self,
         request: RenderingRequest,
         context: grpc.aio.ServicerContext
     ) -> RenderingResponse:
-        mode = RenderingRequest.PixelType.Name(request.type)
         size = (request.width, request.height)
-        data = request.data
+        received_at = asyncio.get_running_loop().time()
+        self.metrics.frames_received.inc()
 
-        if size != (250, 122):
-            return RenderingResponse(
-                status=RenderingResponse.DIMENSION_NOT_ALLOWED,
-                details="rendering frame dimension size must be exactly 250x122px"  # noqa: E501
+        if not self.__converter.supports(request.type):
+            return self.__reject(
+                RenderingResponse.PIXEL_TYPE_NOT_ALLOWED,
+                f"pixel type {RenderingRequest.PixelType.Name(request.type)} is not supported"  # noqa: E501
             )
 
-        self.__last_frame = self.__epd.getbuffer(Image.frombytes(mode, size, data))  # noqa: E501
-        self.__frame_before_refresh -= 1
+        if size != self.FRAME_SIZE:
+            return self.__reject(
+                RenderingResponse.DIMENSION_NOT_ALLOWED,
+                "rendering frame dimension size must be exactly 250x122px"
+            )
 
-        async with self.__lock:
-            if self.__frame_before_refresh < 0 or self.__current_mode is self.Mode.DEEP_SLEEP:  # noqa: E501
-                self.__frame_before_refresh = 15
-                self.__full_display()
-            else:
-                self.__partial_display()
+        if request.dithering not in DITHERINGS:
+            return self.__reject(
+                RenderingResponse.INVALID_PAYLOAD,
+                f"dithering {request.dithering} is not supported"
+            )
 
-        return RenderingResponse(status=RenderingResponse.OK)
+        region = request.region if request.HasField("region") else None
+        if region and (region.width == 0 or region.height == 0 or region.x + region.width > size[0] or region.y + region.height > size[1]):  # noqa: E501
+            return self.__reject(
+                RenderingResponse.INVALID_PAYLOAD,
+                "rendering region must be a non-empty area inside the frame"
+            )
 
+        if request.delta and request.type != RenderingRequest.PACKED:
+            return self.__reject(
+                RenderingResponse.INVALID_PAYLOAD,
+                "delta frames must use the PACKED pixel type"
+            )
 
-    async def wait_for_termination(self) -> None:
-        """Asynchronous loop running in parallel to the gRPC server and
-        handling some precautions given by Waveshare:
+        try:
+            data = self.payload(request, context)
+            # NOTE: reject payloads not matching the image before decoding
+            check_payload_size(request.compression, len(data), self.__converter.payload_size(request.type, request.width, request.height))  # noqa: E501
+        except ValueError as e:
+            return self.__reject(RenderingResponse.INVALID_PAYLOAD, str(e))
+
+        fingerprint = self.__fingerprint(request, data)
+        # NOTE: a frame being decoded or waiting for the render worker will
+        #       replace the last one displayed, so this one must follow it
+        if fingerprint == self.__last_fingerprint and not self.__pending and not self.__decoding:  # noqa: E501
+            self.metrics.frames_deduplicated.inc()
+            return RenderingResponse(status=RenderingResponse.OK, deduplicated=True)  # noqa: E501
+
+        # NOTE: the sequence and the delta base are assigned when the frame
+        #       is accepted, in the order of the requests, the frames decoded
+        #       concurrently being displayed in that order
+        self.__received_sequence += 1
+        sequence = self.__received_sequence
+        animation = self.__animation
+        previous = self.__accepted
+        accepted = self.__accepted = asyncio.get_running_loop().create_future()  # noqa: E501
+        accepted.add_done_callback(self.__base_resolved)
+        try:
+            base = None
+            if request.delta:
+                # NOTE: the previous frame may still be decoded
+                base = await asyncio.shield(previous) if previous is not None else None  # noqa: E501
+                if base is None:
+                    base = max(self.__pending, key=lambda pending: pending.sequence).frame if self.__pending else self.__last_frame  # noqa: E501
+                if crc(base) != request.delta_base:
+                    return self.__reject(
+                        RenderingResponse.DELTA_BASE_MISMATCH,
+                        "delta base is not the last frame sent to the device"
+                    )
+
+            frame = self.__frame_cache.get(fingerprint)
+            if frame is None:
+                self.__decoding += 1
+                try:
+                    async with self.__decode_slots:
+                        start = time.perf_counter()
+                        try:
+                            frame = await asyncio.get_running_loop().run_in_executor(  # noqa: E501
+                                None, self.__decode, request, data, base
+                            )
+                        finally:
+                            self.metrics.stage_duration.labels("decode").observe(time.perf_counter() - start)  # noqa: E501
+                except ValueError as e:
+                    return self.__reject(RenderingResponse.INVALID_PAYLOAD, str(e))  # noqa: E501
+                finally:
+                    self.__decoding -= 1
+                self.__frame_cache[fingerprint] = frame
+                if len(self.__frame_cache) > self.FRAME_CACHE_SIZE:
+                    self.__frame_cache.popitem(last=False)
+            else:
+                self.__frame_cache.move_to_end(fingerprint)
+
+            windows = [region_window(region.x, region.y, region.width, region.height)] if region else None  # noqa: E501
+            expires_at = received_at + request.deadline_ms / 1000 if request.deadline_ms else None  # noqa: E501
+            pending = self.PendingFrame(sequence, fingerprint, frame, windows, request.priority, expires_at)  # noqa: E501
+            if pending.expired():
+                self.metrics.frames_expired.inc()
+                return RenderingResponse(
+                    status=RenderingResponse.DEADLINE_EXCEEDED,
+                    details="frame deadline passed while decoding it"
+                )
+            accepted.set_result(frame)
+        finally:
+            # NOTE: a frame not displayed leaves the base of the next ones
+            #       unchanged
+            if accepted.done():
+                pass
+            elif previous is None:
+                accepted.set_result(None)
+            elif previous.done():
+                accepted.set_result(previous.result())
+            else:
+                previous.add_done_callback(lambda done: accepted.set_result(done.result()))  # noqa: E501
+
+        # NOTE: a new frame interrupts the animation played when it was
+        #       received, once accepted; the frames submitted by the animation
+        #       while it was decoded must not replace it
+        if animation is not None and not animation.done():
+            animation.cancel()
+            if self.__animated_sequence > sequence:
+                self.__received_sequence += 1
+                pending.sequence = self.__received_sequence
+
+        pending = self.__submit(pending)
+        if not request.wait_for_refresh:
+            return RenderingResponse(status=RenderingResponse.OK)
+        if pending is None:
+            return RenderingResponse(
+                status=RenderingResponse.OK,
+                details="frame replaced by a newer one before being displayed",  # noqa: E501
+                dropped=True
+            )
 
-         - For the screen that supports partial update, please note that
-           you cannot refresh the screen with the partial mode all the time.
-           After several partial updating, you need to fully refresh the
-           screen once. Otherwise, the screen display effect will be
-           abnormal, which cannot be repaired!
+        waiter = asyncio.get_running_loop().create_future()
+        pending.waiters.append((fingerprint, waiter))
+        return await waiter
 
-         - When using the e-Paper, it is recommended that the refresh interval
-           be at least 180s, and refresh at least once every 24 hours.
-        """
+    async def PlayAnimation(
+        self,
+        request: PlayAnimationRequest,
+        context: grpc.aio.ServicerContext
+    ) -> RenderingResponse:
+        if not 0 < len(request.frames) <= self.ANIMATION_MAX_FRAMES:
+            return self.__reject(
+                RenderingResponse.INVALID_PAYLOAD,
+                f"animation must have between 1 and {self.ANIMATION_MAX_FRAMES} frames"  # noqa: E501
+            )
 
-        while self.__running:
-            # NOTE: to reduce energy & CPU consumption, the loop will only run
-            #       once each 5 seconds
-            await asyncio.sleep(5)
+        for index, animation_frame in enumerate(request.frames):
+            frame = animation_frame.frame
+            if not self.__converter.supports(frame.type):
+                return self.__reject(
+                    RenderingResponse.PIXEL_TYPE_NOT_ALLOWED,
+                    f"pixel type {RenderingRequest.PixelType.Name(frame.type)} is not supported"  # noqa: E501
+                )
+            if (frame.width, frame.height) != self.FRAME_SIZE:
+                return self.__reject(
+                    RenderingResponse.DIMENSION_NOT_ALLOWED,
+                    "rendering frame dimension size must be exactly 250x122px"
+                )
+            if frame.delta and (index == 0 or frame.type != RenderingRequest.PACKED):  # noqa: E501
+                return self.__reject(
+                    RenderingResponse.INVALID_PAYLOAD,
+                    "delta frames must use the PACKED pixel type and follow another frame"  # noqa: E501
+                )
+            if frame.dithering not in DITHERINGS:
+                return self.__reject(
+                    RenderingResponse.INVALID_PAYLOAD,
+                    f"dithering {frame.dithering} is not supported"
+                )
+
+        try:
+            payloads = [self.payload(animation_frame.frame, context) for animation_frame in request.frames]  # noqa: E501
+        except ValueError as e:
+            return self.__reject(RenderingResponse.INVALID_PAYLOAD, str(e))
+
+        def decode() -> List[bytes]:
+            frames: List[bytes] = []
+            for index, (animation_frame, payload) in enumerate(zip(request.frames, payloads)):  # noqa: E501
+                base = frames[-1] if animation_frame.frame.delta else None
+                if base is not None and crc(base) != animation_frame.frame.delta_base:  # noqa: E501
+                    raise ValueError(f"delta base of frame {index} is not the previous frame")  # noqa: E501
+                frames.append(self.__decode(animation_frame.frame, payload, base))  # noqa: E501
+            return frames
+
+        async with self.__decode_slots:
+            start = time.perf_counter()
+            try:
+                frames = await asyncio.get_running_loop().run_in_executor(None, decode)  # noqa: E501
+            except ValueError as e:
+                return self.__reject(RenderingResponse.INVALID_PAYLOAD, str(e))  # noqa: E501
+            finally:
+                self.metrics.stage_duration.labels("decode").observe(time.perf_counter() - start)  # noqa: E501
+
+        durations = [animation_frame.duration_ms / 1000 for animation_frame in request.frames]  # noqa: E501
+        self.__stop_animation()
+        animation = self.__animation = asyncio.get_running_loop().create_task(
+            self.__play(frames, durations, request.loops, request.priority)
+        )
+        if not request.wait_for_completion:
+            return RenderingResponse(status=RenderingResponse.OK)
+
+        try:
+            # NOTE: the playback goes on if the call is cancelled
+            await asyncio.shield(animation)
+        except asyncio.CancelledError:
+            if not animation.cancelled():
+                raise
+            return RenderingResponse(
+                status=RenderingResponse.OK,
+                details="animation interrupted before its end",
+                dropped=True
+            )
+        return RenderingResponse(status=RenderingResponse.OK)
 
-            elapsed = datetime.now() - self.__last_refresh
+    async def StopAnimation(
+        self,
+        request: StopAnimationRequest,
+        context: grpc.aio.ServicerContext
+    ) -> RenderingResponse:
+        if not self.__stop_animation():
+            return RenderingResponse(status=RenderingResponse.OK, details="no animation is being played")  # noqa: E501
+        return RenderingResponse(status=RenderingResponse.OK)
 
-            if elapsed.total_seconds() < 60:
-                # NOTE: ignore deep sleep if the screen as been refreshed the
-                #       last minute
+    async def __play(self, frames: List[bytes], durations: List[float], loops: int, priority: int) -> None:  # noqa: E501
+        """Displays the frames of an animation, `loops` times (forever if
+        0).
+        """
+        loop = asyncio.get_running_loop()
+        fingerprints = [("animation", hashlib.blake2b(frame, digest_size=16).digest()) for frame in frames]  # noqa: E501
+
+        played = 0
+        while not loops or played < loops:
+            played += 1
+            for frame, fingerprint, duration in zip(frames, fingerprints, durations):  # noqa: E501
+                next_frame_at = loop.time() + duration
+                self.__received_sequence += 1
+                self.__animated_sequence = self.__received_sequence
+                pending = self.__submit(self.PendingFrame(self.__received_sequence, fingerprint, frame, None, priority, animated=True))  # noqa: E501
+
+                waiter = loop.create_future()
+                pending.waiters.append((fingerprint, waiter))
+                try:
+                    await waiter
+                except Exception:  # pylint: disable=broad-except
+                    # NOTE: already logged by the render worker
+                    self.__logging.warning("animation interrupted by a display failure")  # noqa: E501
+                    return
+                await asyncio.sleep(max(next_frame_at - loop.time(), 0))
+
+    def __stop_animation(self) -> bool:
+        """Interrupts the animation being played, if any.
+
+        Returns:
+          Whether an animation was being played.
+        """
+        if self.__animation is None or self.__animation.done():
+            return False
+        self.__animation.cancel()
+        return True
+
+    def __reject(self, status: int, details: str) -> RenderingResponse:
+        """Returns the response of an invalid request."""
+        self.metrics.frames_rejected.labels(RenderingResponse.StatusCode.Name(status)).inc()  # noqa: E501
+        return RenderingResponse(status=status, details=details)
+
+    def __base_resolved(self, accepted: "asyncio.Future[Optional[bytes]]") -> None:  # noqa: E501
+        if self.__accepted is accepted:
+            self.__accepted = None
+
+    def __decode(self, request: RenderingRequest, payload: Union[bytes, memoryview], base: Optional[bytes]) -> bytes:  # noqa: E501
+        """Converts the request payload into a panel buffer."""
+        size = self.__converter.payload_size(request.type, request.width, request.height)  # noqa: E501
+        check_payload_size(request.compression, len(payload), size)
+        data = decompress(request.compression, payload, size)
+        if request.delta:
+            return bytes(xor_delta(base, data))
+        return self.__converter.convert(request.type, request.width, request.height, data, DITHERINGS[request.dithering])  # noqa: E501
+
+    def __submit(self, pending: PendingFrame) -> Optional[PendingFrame]:
+        """Puts the given frame in the render worker mailbox.
+
+        Frames are displayed by decreasing priority; a frame replaces the
+        frames not yet displayed received before it with a lower or equal
+        priority (only the newest frame of a priority is displayed).
+
+        Returns:
+          The frame that will be displayed instead of the given one, or None
+          if a newer frame has already been displayed.
+        """
+        newer = [previous for previous in self.__pending if previous.sequence > pending.sequence and previous.priority >= pending.priority]  # noqa: E501
+        if newer:
+            # NOTE: a frame received later has been decoded first
+            self.metrics.frames_dropped.inc()
+            return newer[0]
+        if pending.sequence < self.__submitted_sequence and pending.priority <= self.__submitted_priority:  # noqa: E501
+            self.metrics.frames_dropped.inc()
+            return None
+
+        replaced = [previous for previous in self.__pending if previous.sequence < pending.sequence and previous.priority <= pending.priority]  # noqa: E501
+        for previous in replaced:
+            self.metrics.frames_dropped.inc()
+            self.__pending.remove(previous)
+            if previous.expiry is not None:
+                previous.expiry.cancel()
+            pending.waiters += previous.waiters
+            if previous.windows is None or pending.windows is None:
+                pending.windows = None
+            else:
+                pending.windows = previous.windows + pending.windows
+
+        index = next((i for i, previous in enumerate(self.__pending) if previous.priority < pending.priority), len(self.__pending))  # noqa: E501
+        self.__pending.insert(index, pending)
+        # NOTE: the changed areas of the frames displayed after this one are
+        #       no longer relative to the frame displayed before them
+        for following in self.__pending[index + 1:]:
+            following.windows = None
+        if pending.expires_at is not None:
+            pending.expiry = asyncio.get_running_loop().call_at(pending.expires_at, self.__expire, pending)  # noqa: E501
+
+        if pending.sequence > self.__submitted_sequence:
+            self.__submitted_sequence = pending.sequence
+            self.__submitted_priority = pending.priority
+        self.__pending_event.set()
+        self.frame_received()
+        return pending
+
+    def __expire(self, pending: PendingFrame) -> None:
+        """Discards a frame whose deadline passed while waiting for the
+        render worker.
+        """
+        if pending not in self.__pending:
+            return
+        self.__pending.remove(pending)
+        self.__discard(pending)
+        if not self.__pending:
+            self.frame_handled(refreshed=False)
+
+    def __discard(self, pending: PendingFrame) -> None:
+        """Answers the requests of a frame whose deadline has passed."""
+        self.metrics.frames_expired.inc()
+        self.__resolve(pending, RenderingResponse(
+            status=RenderingResponse.DEADLINE_EXCEEDED,
+            details="frame deadline passed before it could be displayed"
+        ))
+
+    @staticmethod
+    def __resolve(pending: PendingFrame, response: RenderingResponse) -> None:  # noqa: E501
+        """Answers the requests waiting for a frame, or for the frames it
+        replaced.
+        """
+        for fingerprint, waiter in pending.waiters:
+            if waiter.done():
                 continue
+            if fingerprint != pending.fingerprint:
+                waiter.set_result(RenderingResponse(
+                    status=response.status,
+                    details="frame replaced by a newer one before being displayed",  # noqa: E501
+                    dropped=True
+                ))
+            else:
+                waiter.set_result(response)
+
+    async def __render_worker(self) -> None:
+        """Displays the frames put in the mailbox, one at a time."""
+        # NOTE: the frames received while the panel is initialized wait in
+        #       the mailbox, the newer ones replacing the older ones
+        await asyncio.shield(self.__panel_ready)
+        while True:
+            await self.__pending_event.wait()
+            start = time.perf_counter()
+
+            # NOTE: the next frame is chosen once the screen is available, so
+            #       that frames received meanwhile are chosen by priority
+            async with self.__lock:
+                if not self.__pending:
+                    self.__pending_event.clear()
+                    continue
+                pending = self.__pending.pop(0)
+                if pending.expiry is not None:
+                    pending.expiry.cancel()
 
-            if self.__current_mode is self.Mode.DEEP_SLEEP and elapsed.days > 0:  # noqa: E501
-                self.__logging.debug("last frame has been displayed 1 day ago, screen update required")  # noqa: E501
-                async with self.__lock:
-                    self.__full_display()
-                    self.__sleep_mode()
+                locked_at = max(start, pending.submitted_at)
+                self.metrics.stage_duration.labels("queue").observe(locked_at - pending.submitted_at)  # noqa: E501
+                self.metrics.stage_duration.labels("lock").observe(time.perf_counter() - locked_at)  # noqa: E501
+
+                if pending.expired():
+                    self.__discard(pending)
+                    self.frame_handled(refreshed=False)
                     continue
 
-            if self.__current_mode is self.Mode.DEEP_SLEEP:
-                # NOTE: already in deep sleep mode, ignore
-                continue
+                try:
+                    response = await self.__render(pending)
+                except Exception as e:  # pylint: disable=broad-except
+                    self.__logging.exception("failed to display frame")
+                    self.frame_handled(refreshed=False)
+                    for _, waiter in pending.waiters:
+                        if not waiter.done():
+                            waiter.set_exception(e)
+                    continue
 
-            async with self.__lock:
-                self.__logging.debug("last frame has been displayed 1 min ago, enter in deep sleep mode")  # noqa: E501
-                self.__sleep_mode()
+            self.frame_handled(refreshed=not response.deduplicated)
+            self.__resolve(pending, response)
+
+    async def __render(self, pending: PendingFrame) -> RenderingResponse:
+        """Displays the given frame, using a partial refresh when possible.
+
+        This method must be called with the lock held.
+        """
+        if pending.fingerprint == self.__last_fingerprint:
+            self.metrics.frames_deduplicated.inc()
+            return RenderingResponse(status=RenderingResponse.OK, deduplicated=True)  # noqa: E501
+
+        windows = pending.windows
+        if windows is None:
+            windows = dirty_windows(self.__last_frame, pending.frame, self.__converter.linewidth)  # noqa: E501
+
+        self.__last_fingerprint = pending.fingerprint
+        if not windows:
+            # NOTE: the frame differs from the last one but not once
+            #       converted for the screen
+            self.metrics.frames_deduplicated.inc()
+            return RenderingResponse(status=RenderingResponse.OK, deduplicated=True)  # noqa: E501
+
+        self.__ghosting.record(self.__last_frame, pending.frame)
+        self.__last_frame = pending.frame
+        start = time.perf_counter()
+        # NOTE: a full refresh takes several seconds, frames with a priority
+        #       postpone the one due because of ghosting, and so do the
+        #       frames of an animation until the limit of partial refreshes
+        if pending.animated:
+            full_refresh_due = self.__ghosting.full_refresh_due(budget=False)
+        else:
+            full_refresh_due = self.__ghosting.full_refresh_due() and not pending.priority  # noqa: E501
+        if full_refresh_due or self.__current_mode is self.Mode.DEEP_SLEEP:
+            await self.__run(self.__full_display)
+            self.metrics.refreshes.labels("full").inc()
+        else:
+            await self.__run(lambda: self.__partial_display(windows))
+            self.metrics.refreshes.labels("partial").inc()
+        self.metrics.stage_duration.labels("refresh").observe(time.perf_counter() - start)  # noqa: E501
 
-    def cancel(self) -> None:
-        self.__running = False
+        return RenderingResponse(status=RenderingResponse.OK)
+
+    async def __run(self, fn: Callable[[], None]) -> None:
+        """Runs the given blocking call to the screen in the screen thread."""
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, fn)  # noqa: E501
+
+    @staticmethod
+    def __fingerprint(request: RenderingRequest, payload: Union[bytes, memoryview]) -> Tuple:  # noqa: E501
+        """Returns a key identifying the frame content, used to detect
+        frames that are sent several times.
+        """
+        digest = hashlib.blake2b(payload, digest_size=16).digest()
+        delta_base = request.delta_base if request.delta else None
+        # NOTE: the same pixels dithered differently give another frame
+        dithering = request.dithering if request.type != RenderingRequest.PACKED else None  # noqa: E501
+        return (request.type, request.width, request.height, request.compression, delta_base, dithering, digest)  # noqa: E501
+
+    async def on_idle(self) -> None:
+        sequence = self.__submitted_sequence
+        async with self.__lock:
+            if self.__submitted_sequence != sequence or self.__pending:
+                # NOTE: a frame arrived while waiting for the lock
+                return
+            await self.__run(self.__sleep_mode)
+
+    async def on_refresh_due(self) -> None:
+        async with self.__lock:
+            self.__logging.debug("last frame has been displayed 1 day ago, screen update required")  # noqa: E501
+            await self.__run(self.__full_display)
+            await self.__run(self.__sleep_mode)
 
-    async def stop(self, grace: float) -> None:
-        self.__epd.sleep()
-        await asyncio.sleep(grace)
-        self.__epd.Dev_exit()
+    async def stop(self, grace: Optional[float] = None) -> None:
+        await super().stop(grace)
+
+        self.__stop_animation()
+        self.__render_task.cancel()
+        async with self.__lock:
+            await self.__run(self.__sleep_mode)
+        await self.__run(self.__exit)
+        self.__executor.shutdown()
+        if self.__state:
+            self.__state.close()
+
+    def __exit(self) -> None:
+        if self.__epd is not None:
+            self.__epd.exit()
 
     def __sleep_mode(self) -> None:
         if self.__current_mode is not self.Mode.DEEP_SLEEP:
             self.__logging.debug("eInk screen entering in deep sleep mode (low consumption).")  # noqa: E501
             self.__epd.sleep()
             self.__current_mode = self.Mode.DEEP_SLEEP
+            self.metrics.enter_deep_sleep()
 
     def __full_update_mode(self) -> None:
         if self.__current_mode is not self.Mode.FULL_UPDATE:
             self.__logging.debug("eInk screen entering in full update mode.")  # noqa: E501
-            self.__epd.init(self.__epd.FULL_UPDATE)
+            self.__epd.init_full_update()
             self.__current_mode = self.Mode.FULL_UPDATE
+            self.metrics.leave_deep_sleep()
 
     def __partial_update_mode(self) -> None:
         if self.__current_mode is not self.Mode.PARTIAL_UPDATE:
             self.__logging.debug("eInk screen entering in partial update mode.")  # noqa: E501
-            self.__epd.init(self.__epd.PART_UPDATE)
+            self.__epd.init_partial_update()
             self.__current_mode = self.Mode.PARTIAL_UPDATE
+            self.metrics.leave_deep_sleep()
 
     def __full_display(self) -> None:
         self.__full_update_mode()
-        self.__epd.displayPartBaseImage(self.__last_frame)
-        self.__last_refresh = datetime.now()
+        self.__epd.display_base(self.__last_frame)
+        self.__ghosting.reset()
+        self.__refreshed()
 
-    def __partial_display(self) -> None:
+    def __partial_display(self, windows: Optional[List[Window]] = None) -> None:  # noqa: E501
         self.__partial_update_mode()
-        self.__epd.displayPartial_Wait(self.__last_frame)
-        self.__last_refresh = datetime.now()
+        self.__epd.display_partial(self.__last_frame, windows)
+        self.__refreshed()
+
+    def __refreshed(self) -> None:
+        """Saves the state of the panel, once refreshed."""
+        self.__last_refresh = time.time()
+        if self.__state:
+            self.__state.save(self.__last_frame, self.__last_refresh)
 
     @property
     def __logging(self) -> logging.Logger:
         return logging.getLogger("eInk_Waveshare_2in13")
 
 
-async def main(listen_addr: str):
-    server = grpc.aio.server()
-    server.add_insecure_port(listen_addr)
-
-    service = eInk_Waveshare_2in13()
-    add_RenderingServiceServicer_to_server(service, server)
+async def main(listen_addr: str,
+               epd: Optional[EPDBackend] = None,
+               metrics_addr: Optional[str] = None,
+               ghosting: Optional[GhostingPolicy] = None,
+               fonts: Optional[Dict[str, str]] = None,
+               state_file: Optional[str] = None,
+               local_socket: Optional[str] = None,
+               capture_file: Optional[str] = None,
+               max_concurrent_rpcs: Optional[int] = None,
+               fast_start: bool = False):
+    service = eInk_Waveshare_2in13(listen_addr, epd, metrics_addr, ghosting, state_file, local_socket, capture_file, max_concurrent_rpcs, fast_start)  # noqa: E501
+    for font_id, path in (fonts or {}).items():
+        service.fonts.register(font_id, path)
 
     loop = asyncio.get_event_loop()
-    loop.add_signal_handler(signal.SIGINT, service.cancel)
-    loop.add_signal_handler(signal.SIGTERM, service.cancel)
+    loop.add_signal_handler(signal.SIGINT, service.pre_stop)
+    loop.add_signal_handler(signal.SIGTERM, service.pre_stop)
 
     try:
         logging.info("starting server on %s", listen_addr)
-        await server.start()
-        await asyncio.wait(
-            [asyncio.create_task(server.wait_for_termination()),
-             asyncio.create_task(service.wait_for_termination())],
-            return_when=asyncio.FIRST_COMPLETED
-        )
+        await service.start()
+        await service.wait_for_termination()
     finally:
-        await asyncio.wait(
-            [asyncio.create_task(server.stop(5)),
-             asyncio.create_task(service.stop(2))],
-            return_when=asyncio.ALL_COMPLETED
-        )
+        await service.stop(5)
 
 
 if __name__ == '__main__':
@@ -198,8 +808,26 @@ if __name__ == '__main__':
 
     parser.add_argument("-l", "--listen-addr", help="Address to listen on for gRPC API.", default="[::]:48765")  # noqa: E501
     parser.add_argument("--log-level", help="Log severity.", choices=["fatal", "error", "warning", "info", "debug"], default="info")  # noqa: E501
+    parser.add_argument("--metrics-addr", help="Address to expose the Prometheus metrics on (disabled if not set).", default=None)  # noqa: E501
+    parser.add_argument("--ghosting-budget", help="Number of partial refreshes a pixel can undergo before the screen is fully refreshed.", type=int, default=15)  # noqa: E501
+    parser.add_argument("--max-partial-refreshes", help="Number of partial refreshes after which the screen is fully refreshed, whatever changed (0 for no limit).", type=int, default=100)  # noqa: E501
+    parser.add_argument("--font", help="Font available to the clients, as ID=PATH (TrueType or OpenType file).", action="append", default=[])  # noqa: E501
+    parser.add_argument("--state-file", help="File keeping the state of the screen across restarts, to avoid clearing it on start (disabled if not set).", default=None)  # noqa: E501
+    parser.add_argument("--local-socket", help="Unix socket to listen on for co-located clients, which can pass their frames through shared memory (disabled if not set).", default=None)  # noqa: E501
+    parser.add_argument("--capture-file", help="File to record the received requests to, to be replayed by benchmark/replay.py (disabled if not set).", default=None)  # noqa: E501
+    parser.add_argument("--max-concurrent-rpcs", help="Number of frames (calls or streamed frames) handled at the same time, the other frames being rejected, to bound the memory used by the frames (0 for no limit).", type=int, default=GRPCDisplay.MAX_CONCURRENT_RPCS)  # noqa: E501
+    parser.add_argument("--fast-start", help="Answer the requests while the screen is being initialized, the frames received meanwhile being displayed once it is ready.", action="store_true")  # noqa: E501
+    parser.add_argument("--emulator", help="Use an in-memory emulated screen instead of the Waveshare HAT.", action="store_true")  # noqa: E501
+    parser.add_argument("--emulator-snapshot", help="PNG file updated with the content of the emulated screen.", default=None)  # noqa: E501
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.getLevelName(args.log_level.upper()))
 
-    asyncio.run(main(args.listen_addr))
+    epd = EPDEmulator(snapshot=args.emulator_snapshot) if args.emulator else None  # noqa: E501
+    ghosting = GhostingPolicy(
+        EPDBackend.width, EPDBackend.height,
+        budget=args.ghosting_budget,
+        max_partial_refreshes=args.max_partial_refreshes or None,
+    )
+    fonts = dict(font.split("=", 1) for font in args.font)
+    asyncio.run(main(args.listen_addr, epd, args.metrics_addr, ghosting, fonts, args.state_file, args.local_socket, args.capture_file, args.max_concurrent_rpcs, args.fast_start))  # noqa: E501
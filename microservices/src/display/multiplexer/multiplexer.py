@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# Copyright (C) 2022 xunleii
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import asyncio
+import logging
+import signal
+from typing import Optional, Sequence
+
+from stboite.display.v1.multiplexer import DisplayMultiplexer
+
+
+async def main(listen_addr: str,
+               displays: Sequence[str],
+               metrics_addr: Optional[str] = None,
+               timeout: float = DisplayMultiplexer.TIMEOUT):
+    service = DisplayMultiplexer(listen_addr, displays, metrics_addr)
+    service.TIMEOUT = timeout
+
+    loop = asyncio.get_event_loop()
+    loop.add_signal_handler(signal.SIGINT, service.pre_stop)
+    loop.add_signal_handler(signal.SIGTERM, service.pre_stop)
+
+    try:
+        logging.info("starting server on %s, forwarding to %s", listen_addr, ", ".join(displays))  # noqa: E501
+        await service.start()
+        await service.wait_for_termination()
+    finally:
+        await service.stop(5)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="gRPC API forwarding the frames to several displays.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument("-l", "--listen-addr", help="Address to listen on for gRPC API.", default="[::]:48765")  # noqa: E501
+    parser.add_argument("-d", "--display", help="Address of a display to forward the frames to.", action="append", required=True)  # noqa: E501
+    parser.add_argument("--log-level", help="Log severity.", choices=["fatal", "error", "warning", "info", "debug"], default="info")  # noqa: E501
+    parser.add_argument("--metrics-addr", help="Address to expose the Prometheus metrics on (disabled if not set).", default=None)  # noqa: E501
+    parser.add_argument("--timeout", help="Deadline of the calls to the displays, in seconds.", type=float, default=DisplayMultiplexer.TIMEOUT)  # noqa: E501
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level.upper()))
+    asyncio.run(main(args.listen_addr, args.display, args.metrics_addr, args.timeout))  # noqa: E501